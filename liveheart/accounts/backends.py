@@ -0,0 +1,49 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models.functions import Lower
+
+UserModel = get_user_model()
+
+
+def normalize_email(email):
+    return (email or "").strip().lower()
+
+
+def users_with_device():
+    """Пользователи вместе с устройством TOTP (один запрос вместо двух)"""
+    return UserModel._default_manager.select_related("totp_device")
+
+
+class EmailBackend(ModelBackend):
+    """
+    Вход по email и паролю.
+
+    Пользователь ищется по индексу на LOWER(email) (миграция accounts 0003) и загружается
+    сразу вместе с устройством TOTP, поэтому проверка пароля и выбор второго фактора
+    обходятся одним запросом.
+    """
+
+    def authenticate(self, request, email=None, password=None):
+        if not email or password is None:
+            return None
+        user = (
+            users_with_device()
+            .annotate(email_lower=Lower("email"))
+            .filter(email_lower=normalize_email(email))
+            .order_by("pk")
+            .first()
+        )
+        if user is None:
+            # Хэшируем пароль и для несуществующего пользователя, чтобы не выдавать его временем ответа
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def get_user(self, user_id):
+        try:
+            user = users_with_device().get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
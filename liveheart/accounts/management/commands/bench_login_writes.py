@@ -0,0 +1,86 @@
+import re
+import time
+
+import pyotp
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import reverse
+
+from accounts.models import OutboxMessage, TOTPDevice
+from patients.bench import temporary_database
+
+WRITE = re.compile(r'^\s*(?:INSERT INTO|UPDATE|DELETE FROM)\s+"(\w+)"', re.IGNORECASE)
+
+
+def count_writes(queries):
+    """(всего записей в БД, из них в django_session)"""
+    total = session = 0
+    for query in queries:
+        match = WRITE.match(query["sql"])
+        if match:
+            total += 1
+            session += match.group(1) == "django_session"
+    return total, session
+
+
+class Command(BaseCommand):
+    help = "Считает записи в БД (и отдельно в django_session) на один вход по коду из письма и по TOTP"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=20)
+
+    def login_email(self, client, user):
+        client.post(reverse("accounts:login"), {"email": user.email, "password": "bench"})
+        client.post(reverse("accounts:verify"), {"action": "send"})
+        body = OutboxMessage.objects.filter(to_email=user.email).latest("id").body
+        code = re.search(r"(\d+)$", body).group(1)
+        return client.post(reverse("accounts:verify"), {"action": "verify", "code": code})
+
+    def login_totp(self, client, user):
+        client.post(reverse("accounts:login"), {"email": user.email, "password": "bench"})
+        code = pyotp.TOTP(user.totp_device.secret).now()
+        return client.post(reverse("accounts:verify_totp"), {"code": code})
+
+    def handle(self, *args, logins, **options):
+        setup_test_environment()
+        rates = {"ip": (10 ** 6, 10 ** 6), "account": (10 ** 6, 10 ** 6)}
+        # Отдельный кэш, чтобы не задеть кулдауны и лимиты настоящих пользователей
+        caches = {
+            alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": f"bench-{alias}"}
+            for alias in settings.CACHES
+        }
+
+        # Пользователи создаются во временной базе: рабочая не блокируется и не меняется
+        with override_settings(LOGIN_THROTTLE_RATES=rates, EMAIL_OUTBOX_EAGER=False, CACHES=caches), \
+                temporary_database():
+            for flow in ("email", "totp"):
+                users = [
+                    User.objects.create_user(f"bench-{flow}-{i}", f"bench-{flow}-{i}@example.com", "bench")
+                    for i in range(logins)
+                ]
+                if flow == "totp":
+                    for user in users:
+                        TOTPDevice.objects.create(user=user, secret=pyotp.random_base32(), confirmed=True)
+                    users = [User.objects.select_related("totp_device").get(id=u.id) for u in users]
+
+                login = self.login_email if flow == "email" else self.login_totp
+                writes = session_writes = 0
+                started = time.perf_counter()
+                for user in users:
+                    client = Client()
+                    with CaptureQueriesContext(connection) as ctx:
+                        response = login(client, user)
+                    assert response.status_code == 302 and client.session.get("is_2fa_verified"), flow
+                    total, session = count_writes(ctx.captured_queries)
+                    writes += total
+                    session_writes += session
+                elapsed = time.perf_counter() - started
+
+                self.stdout.write(
+                    f"{flow:5}: {writes / logins:.1f} записей в БД на вход, из них в django_session "
+                    f"{session_writes / logins:.1f}; {elapsed / logins * 1000:.0f} мс на вход"
+                )
@@ -0,0 +1,32 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет истёкшие сессии пачками. В отличие от clearsessions не держит блокировку "
+        "SQLite одним большим DELETE: между пачками успевают пройти записи обследований"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=500, help="Сколько сессий удалять за раз")
+        parser.add_argument("--pause", type=float, default=0.05, help="Пауза между пачками, сек.")
+
+    def handle(self, *args, batch, pause, **options):
+        now = timezone.now()
+        expired = Session.objects.filter(expire_date__lt=now).values_list("session_key", flat=True)
+
+        deleted = 0
+        while True:
+            keys = list(expired[:batch])
+            if not keys:
+                break
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+            if len(keys) < batch:
+                break
+            time.sleep(pause)
+
+        self.stdout.write(f"Удалено истёкших сессий: {deleted}")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from accounts.outbox import requeue_stale_messages, run_worker
+
+
+class Command(BaseCommand):
+    help = "Отправляет письма из очереди OutboxMessage через одно SMTP-соединение"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--poll", type=float, default=1.0, help="Пауза между опросами очереди, сек.")
+        parser.add_argument("--idle-close", type=float, default=30.0,
+                            help="Через сколько секунд простоя закрывать SMTP-соединение")
+        parser.add_argument("--batch", type=int, default=100)
+
+    def handle(self, *args, poll, idle_close, batch, **options):
+        requeued = requeue_stale_messages()
+        if requeued:
+            self.stdout.write(f"Возвращено в очередь зависших писем: {requeued}")
+
+        self.stdout.write("Воркер почты запущен")
+        try:
+            run_worker(poll=poll, idle_close=idle_close, batch=batch)
+        except KeyboardInterrupt:
+            self.stdout.write("Остановка воркера почты")
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Индекс по нормализованному email для входа (accounts.backends.EmailBackend)"""
+
+    dependencies = [
+        ('accounts', '0002_outboxmessage'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX accounts_user_email_lower_idx ON auth_user (LOWER(email));',
+            'DROP INDEX accounts_user_email_lower_idx;',
+        ),
+    ]
@@ -13,3 +13,40 @@ class TOTPDevice(models.Model):
 
     def __str__(self):
         return f"TOTP for {self.user}"
+
+
+class OutboxMessage(models.Model):
+    """Письмо в очереди на отправку (коды подтверждения и т.п.)"""
+
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "В очереди"),
+        (SENDING, "Отправляется"),
+        (SENT, "Отправлено"),
+        (FAILED, "Ошибка"),
+    ]
+
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    # Письмо с истёкшим кодом отправлять бессмысленно
+    expires_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # Кто отправляет письмо и когда последний раз подтвердил, что жив (accounts.outbox)
+    worker = models.CharField(max_length=128, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # Воркер выбирает письма, срок следующей попытки которых наступил
+        indexes = [models.Index(fields=["status", "next_attempt_at"], name="outbox_status_next_idx")]
+
+    def __str__(self):
+        return f"{self.subject} → {self.to_email} ({self.status})"
@@ -0,0 +1,200 @@
+"""
+Очередь исходящих писем.
+
+Представление только кладёт письмо в таблицу OutboxMessage; отправляет его воркер
+(run_outbox_worker) через одно SMTP-соединение на много писем. Неудачные попытки
+повторяются с экспоненциальной задержкой.
+
+Забранное письмо помечается именем воркера и временем отметки (heartbeat_at); перед отправкой
+воркер продлевает отметку и проверяет, что письмо всё ещё за ним. Письма без отметки дольше
+EMAIL_OUTBOX_STALE_AFTER возвращаются в очередь, а письма живых соседних воркеров не трогаются,
+поэтому запуск второго воркера не рассылает коды повторно.
+"""
+import logging
+import os
+import random
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from liveheart.metrics import SMTP_SECONDS
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_email(to_email, subject, body, ttl=None):
+    """Ставит письмо в очередь; ttl — через сколько секунд письмо теряет смысл"""
+    now = timezone.now()
+    message = OutboxMessage.objects.create(
+        to_email=to_email,
+        subject=subject,
+        body=body,
+        next_attempt_at=now,
+        expires_at=now + timedelta(seconds=ttl) if ttl else None,
+    )
+    if settings.EMAIL_OUTBOX_EAGER:
+        # Разработка без воркера: отправка сразу после коммита
+        transaction.on_commit(deliver_pending)
+    return message
+
+
+def backoff(attempts):
+    """Задержка перед следующей попыткой: 5, 10, 20 ... сек. (не больше 5 мин) плюс разброс до 25 %"""
+    delay = min(settings.EMAIL_OUTBOX_RETRY_BASE * 2 ** (attempts - 1), settings.EMAIL_OUTBOX_RETRY_MAX)
+    return timedelta(seconds=delay * (1 + random.random() / 4))
+
+
+def current_worker():
+    """Имя воркера для поля OutboxMessage.worker"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_messages(limit, worker=None):
+    """Забирает письма, срок отправки которых наступил; UPDATE по статусу защищает от двойной отправки"""
+    worker = worker or current_worker()
+    now = timezone.now()
+    due = (
+        OutboxMessage.objects.filter(status=OutboxMessage.PENDING, next_attempt_at__lte=now)
+        .order_by("next_attempt_at", "id")
+        .values_list("id", flat=True)
+    )
+    claimed = []
+    for message_id in due[:limit]:
+        if OutboxMessage.objects.filter(id=message_id, status=OutboxMessage.PENDING).update(
+            status=OutboxMessage.SENDING, attempts=F("attempts") + 1, worker=worker, heartbeat_at=now,
+        ):
+            claimed.append(message_id)
+    return list(OutboxMessage.objects.filter(id__in=claimed).order_by("id"))
+
+
+def requeue_stale_messages(stale_after=None):
+    """
+    Возвращает в очередь письма упавших воркеров: те, что отправляются, но без отметки
+    дольше stale_after секунд. Письма живых соседних воркеров не трогаются.
+    """
+    stale_after = settings.EMAIL_OUTBOX_STALE_AFTER if stale_after is None else stale_after
+    deadline = timezone.now() - timedelta(seconds=stale_after)
+    return (
+        OutboxMessage.objects.filter(status=OutboxMessage.SENDING)
+        .filter(Q(heartbeat_at__lt=deadline) | Q(heartbeat_at__isnull=True))
+        .update(status=OutboxMessage.PENDING, worker="", heartbeat_at=None)
+    )
+
+
+def _renew(message):
+    """Продлевает отметку письма; False — письмо уже вернули в очередь, отправлять его нельзя"""
+    return OutboxMessage.objects.filter(
+        id=message.id, status=OutboxMessage.SENDING, worker=message.worker,
+    ).update(heartbeat_at=timezone.now()) == 1
+
+
+def _deliver(message, connection):
+    if not _renew(message):
+        logger.warning("Письмо %s вернулось в очередь до отправки, пропускаем", message.id)
+        return False
+
+    now = timezone.now()
+    if message.expires_at and message.expires_at <= now:
+        message.status = OutboxMessage.FAILED
+        message.last_error = "Истёк срок действия письма"
+        message.body = ""
+        message.save(update_fields=["status", "last_error", "body"])
+        return False
+
+    email = EmailMessage(message.subject, message.body, settings.DEFAULT_FROM_EMAIL, [message.to_email],
+                         connection=connection)
+    started = time.perf_counter()
+    try:
+        # Открытое соединение переиспользуется; send() сам закрыл бы соединение, которое открыл
+        connection.open()
+        email.send()
+    except Exception as exc:
+        SMTP_SECONDS.observe(time.perf_counter() - started, "error")
+        # Соединение могло оборваться: следующее письмо откроет новое
+        connection.close()
+        message.last_error = f"{type(exc).__name__}: {exc}"
+        if message.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            message.status = OutboxMessage.FAILED
+            message.body = ""
+        else:
+            message.status = OutboxMessage.PENDING
+            message.next_attempt_at = now + backoff(message.attempts)
+        message.save(update_fields=["status", "last_error", "next_attempt_at", "body"])
+        logger.warning("Письмо %s не отправлено (попытка %s): %s", message.id, message.attempts, exc)
+        return False
+
+    SMTP_SECONDS.observe(time.perf_counter() - started, "ok")
+
+    # Текст с кодом после отправки не храним
+    message.status = OutboxMessage.SENT
+    message.sent_at = timezone.now()
+    message.body = ""
+    message.save(update_fields=["status", "sent_at", "body"])
+    return True
+
+
+def deliver_pending(connection=None, limit=100, worker=None):
+    """Отправляет письма из очереди через одно соединение; возвращает число отправленных"""
+    messages = claim_messages(limit, worker)
+    if not messages:
+        return 0
+
+    own_connection = connection is None
+    connection = connection or get_connection()
+    try:
+        return sum(_deliver(message, connection) for message in messages)
+    finally:
+        if own_connection:
+            connection.close()
+
+
+def run_worker(poll=1.0, idle_close=30.0, batch=100):
+    """
+    Цикл воркера: SMTP-соединение открыто, пока есть письма, и закрывается после
+    idle_close секунд простоя (почтовые серверы сами рвут долго молчащие соединения).
+    """
+    connection = get_connection()
+    worker = current_worker()
+    idle_since = None
+    last_requeue = time.monotonic()
+    try:
+        while True:
+            if time.monotonic() - last_requeue >= settings.EMAIL_OUTBOX_STALE_AFTER / 2:
+                # Письма упавших соседних воркеров забираем обратно в очередь
+                requeue_stale_messages()
+                last_requeue = time.monotonic()
+            sent = deliver_pending(connection, limit=batch, worker=worker)
+            if sent:
+                idle_since = None
+                continue
+            idle_since = idle_since or time.monotonic()
+            if time.monotonic() - idle_since > idle_close:
+                connection.close()
+            time.sleep(poll)
+    finally:
+        connection.close()
+
+
+def cooldown_left(key, seconds):
+    """Сколько секунд осталось до конца кулдауна (0 — кулдауна нет)"""
+    started = cache.get(f"cooldown:{key}")
+    return max(0, seconds - (int(time.time()) - started)) if started else 0
+
+
+def start_cooldown(key, seconds):
+    """
+    Кулдаун в общем кэше (один на все процессы и сессии).
+    Возвращает 0, если кулдаун начат, иначе — сколько секунд осталось ждать.
+    """
+    if cache.add(f"cooldown:{key}", int(time.time()), timeout=seconds):
+        return 0
+    return max(1, cooldown_left(key, seconds))
@@ -0,0 +1,77 @@
+"""
+Незавершённый вход (между паролем и вторым фактором).
+
+Состояние (id и email пользователя, способ подтверждения, хэш кода из письма) живёт в кэше
+TWO_FACTOR_STATE_CACHE под случайным токеном, а браузеру отдаётся только подписанная cookie
+с токеном. Сессия в базе создаётся один раз — после полного входа, поэтому промежуточные
+шаги не пишут в django_session.
+"""
+import secrets
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .backends import normalize_email
+
+COOKIE_NAME = "liveheart_pending_login"
+COOKIE_SALT = "accounts.pending"
+
+
+def _cache():
+    return caches[settings.TWO_FACTOR_STATE_CACHE]
+
+
+def _key(token):
+    return f"2fa:pending:{token}"
+
+
+def _token(request):
+    return request.get_signed_cookie(COOKIE_NAME, default=None, salt=COOKIE_SALT)
+
+
+def start(response, user, method):
+    """Начинает подтверждение входа для user (method — "email" или "totp")"""
+    token = secrets.token_urlsafe(32)
+    state = {"user_id": user.id, "email": normalize_email(user.email), "method": method}
+    _cache().set(_key(token), state, timeout=settings.TWO_FACTOR_STATE_TTL)
+    response.set_signed_cookie(
+        COOKIE_NAME, token, salt=COOKIE_SALT, max_age=settings.TWO_FACTOR_STATE_TTL,
+        httponly=True, secure=settings.SESSION_COOKIE_SECURE, samesite="Lax",
+    )
+    return response
+
+
+def load(request, method):
+    """Состояние незавершённого входа нужного способа или None"""
+    if not hasattr(request, "_pending_login"):
+        token = _token(request)
+        request._pending_login = _cache().get(_key(token)) if token else None
+    state = request._pending_login
+    return state if state and state["method"] == method else None
+
+
+def update(request, **values):
+    """Дописывает значения (хэш кода, время отправки) в состояние текущего входа"""
+    state = request._pending_login
+    state.update(values)
+    _cache().set(_key(_token(request)), state, timeout=settings.TWO_FACTOR_STATE_TTL)
+
+
+def finish(request, response):
+    """Удаляет состояние после успешного входа"""
+    token = _token(request)
+    if token:
+        _cache().delete(_key(token))
+    response.delete_cookie(COOKIE_NAME, samesite="Lax")
+    return response
+
+
+def pending_email(method):
+    """
+    Ключ учётной записи для ограничения попыток (accounts.throttle): тот же email в нижнем
+    регистре, что и при вводе пароля, чтобы у учётной записи был один лимит на все шаги входа
+    """
+    def key(request):
+        state = load(request, method)
+        return state.get("email") if state else None
+    return key
@@ -1,3 +1,323 @@
-from django.test import TestCase
+import io
+import tempfile
+from datetime import timedelta
 
-# Create your tests here.
+import pyotp
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from liveheart import metrics
+
+from . import outbox, throttle
+from .models import OutboxMessage, TOTPDevice
+from .outbox import claim_messages, deliver_pending, enqueue_email, requeue_stale_messages
+
+
+class FlakyBackend(LocmemBackend):
+    """locmem, который отказывает первые failures раз и считает созданные соединения"""
+    failures = 0
+    connections = 0
+
+    def __init__(self, *args, **kwargs):
+        FlakyBackend.connections += 1
+        super().__init__(*args, **kwargs)
+
+    def send_messages(self, messages):
+        if FlakyBackend.failures:
+            FlakyBackend.failures -= 1
+            raise ConnectionError("relay unavailable")
+        return super().send_messages(messages)
+
+
+LOCMEM = {
+    "EMAIL_BACKEND": "django.core.mail.backends.locmem.EmailBackend",
+    "CACHES": {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "two_factor": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "two_factor"},
+        "throttle": settings.CACHES["throttle"],
+    },
+}
+
+
+def clear_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+@override_settings(**LOCMEM)
+class OutboxTests(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_many_messages_one_connection(self):
+        for i in range(5):
+            enqueue_email(f"doctor{i}@example.com", "Код", "Ваш код для входа: 123456")
+
+        with override_settings(EMAIL_BACKEND="accounts.tests.FlakyBackend"):
+            FlakyBackend.connections = 0
+            self.assertEqual(deliver_pending(), 5)
+        self.assertEqual(FlakyBackend.connections, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(OutboxMessage.objects.exclude(status=OutboxMessage.SENT).exists())
+        self.assertFalse(OutboxMessage.objects.exclude(body="").exists())
+
+    @override_settings(EMAIL_BACKEND="accounts.tests.FlakyBackend", EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    def test_retry_with_backoff(self):
+        FlakyBackend.failures = 3
+        message = enqueue_email("doctor@example.com", "Код", "123456")
+
+        self.assertEqual(deliver_pending(), 0)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.PENDING, 1))
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        # До срока следующей попытки письмо не берётся
+        self.assertEqual(deliver_pending(), 0)
+
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+        deliver_pending()
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.FAILED, 2))
+        self.assertIn("relay unavailable", message.last_error)
+
+    def test_requeue_only_abandoned_messages(self):
+        live = enqueue_email("live@example.com", "Код", "111111")
+        claim_messages(1, worker="host:1")
+        dead = enqueue_email("dead@example.com", "Код", "222222")
+        claim_messages(1, worker="host:2")
+        OutboxMessage.objects.filter(id=dead.id).update(heartbeat_at=timezone.now() - timedelta(minutes=5))
+
+        # Запуск ещё одного воркера не отбирает письмо у живого соседа
+        self.assertEqual(requeue_stale_messages(), 1)
+        live.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual((live.status, live.worker), (OutboxMessage.SENDING, "host:1"))
+        self.assertEqual((dead.status, dead.worker), (OutboxMessage.PENDING, ""))
+
+    def test_requeued_message_is_not_sent_by_old_worker(self):
+        enqueue_email("doctor@example.com", "Код", "123456")
+        [message] = claim_messages(1, worker="host:1")
+        # Воркер завис, письмо вернули в очередь и забрал другой
+        requeue_stale_messages(stale_after=-1)
+        self.assertEqual(deliver_pending(worker="host:2"), 1)
+
+        self.assertFalse(outbox._deliver(message, None))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_expired_message_is_dropped(self):
+        message = enqueue_email("doctor@example.com", "Код", "123456", ttl=60)
+        OutboxMessage.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(deliver_pending(), 0)
+        self.assertEqual(mail.outbox, [])
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.FAILED)
+
+
+@override_settings(**LOCMEM)
+class VerifyEmailCodeTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+
+    def start_login(self, client):
+        client.post(reverse("accounts:login"), {"email": "doctor@example.com", "password": "pass"})
+
+    def test_view_only_enqueues(self):
+        self.start_login(self.client)
+        response = self.client.post(reverse("accounts:verify"), {"action": "send"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.to_email, "doctor@example.com")
+
+        deliver_pending()
+        self.assertEqual(mail.outbox[0].to, ["doctor@example.com"])
+
+    def test_cooldown_is_shared_between_sessions(self):
+        self.start_login(self.client)
+        self.client.post(reverse("accounts:verify"), {"action": "send"})
+
+        other = self.client_class()
+        self.start_login(other)
+        response = other.post(reverse("accounts:verify"), {"action": "send"})
+
+        self.assertIn("Подождите", response.context["error"])
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+
+@override_settings(**LOCMEM, LOGIN_THROTTLE_RATES={"ip": (3, 0.001), "account": (2, 0.001)})
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        User.objects.create_user("doctor", "doctor@example.com", "pass")
+
+    def attempt(self, ip="10.0.0.1", email="doctor@example.com"):
+        return self.client.post(reverse("accounts:login"), {"email": email, "password": "wrong"}, REMOTE_ADDR=ip)
+
+    def test_ip_bucket_rejects_before_any_work(self):
+        for i in range(3):
+            self.assertEqual(self.attempt(email=f"user{i}@example.com").status_code, 200)
+
+        with self.assertNumQueries(0):
+            response = self.attempt(email="other@example.com")
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+
+        # Другие клиенты не страдают
+        self.assertEqual(self.attempt(ip="10.0.0.2", email="someone@example.com").status_code, 200)
+
+    def test_account_bucket_across_ips(self):
+        self.assertEqual(self.attempt(ip="10.0.0.1").status_code, 200)
+        self.assertEqual(self.attempt(ip="10.0.0.2", email=" Doctor@Example.com").status_code, 200)
+        self.assertEqual(self.attempt(ip="10.0.0.3").status_code, 429)
+
+    def test_verify_totp_is_throttled(self):
+        user = User.objects.get()
+        TOTPDevice.objects.create(user=user, secret=pyotp.random_base32(), confirmed=True)
+        self.client.post(reverse("accounts:login"), {"email": "doctor@example.com", "password": "pass"},
+                         REMOTE_ADDR="10.0.2.1")
+        url = reverse("accounts:verify_totp")
+
+        statuses = [self.client.post(url, {"code": "000000"}, REMOTE_ADDR=f"10.0.1.{i}").status_code
+                    for i in range(3)]
+        self.assertEqual(statuses[-1], 429)
+
+    def test_account_limit_is_shared_by_all_login_steps(self):
+        user = User.objects.get()
+        TOTPDevice.objects.create(user=user, secret=pyotp.random_base32(), confirmed=True)
+        self.assertEqual(self.attempt(ip="10.0.0.1").status_code, 200)
+        self.client.post(reverse("accounts:login"), {"email": "Doctor@example.com", "password": "pass"},
+                         REMOTE_ADDR="10.0.0.2")
+
+        # Обе попытки на пароль уже потрачены: код TOTP для той же учётной записи не проверяется
+        response = self.client.post(reverse("accounts:verify_totp"), {"code": "000000"}, REMOTE_ADDR="10.0.0.3")
+        self.assertEqual(response.status_code, 429)
+
+    def test_limit_is_atomic_across_connections(self):
+        import threading
+
+        # Каждый поток — свой экземпляр кэша и своё соединение, как отдельные процессы сервера
+        limiter = throttle.SlidingWindow("test", 30, 0.001)
+        allowed = []
+
+        def attempts():
+            allowed.extend(limiter.take("10.0.0.1")[0] for _ in range(10))
+
+        threads = [threading.Thread(target=attempts) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(allowed.count(True), 30)
+
+    def test_attacker_buckets_survive_many_keys(self):
+        for i in range(3):
+            self.attempt(email=f"user{i}@example.com")
+        # Перебор с сотен адресов: файловый кэш на 300 ключей вытеснил бы и счётчик атакующего
+        limiter = throttle.limiter("ip")
+        for i in range(1000):
+            limiter.take(f"10.1.{i // 256}.{i % 256}")
+
+        self.assertEqual(self.attempt(email="other@example.com").status_code, 429)
+
+    def test_counters(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(METRICS_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        metrics.reset()
+        for _ in range(4):
+            self.attempt()
+
+        admin = User.objects.create_superuser("admin", "admin@example.com", "pass")
+        self.client.force_login(admin)
+        stats = self.client.get(reverse("accounts:throttle_stats")).json()
+        self.assertEqual((stats["login:checked"], stats["login:denied"]), (4, 2))
+
+
+@override_settings(**LOCMEM)
+class EmailBackendTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user("doctor", "Doctor@Example.com", "pass")
+        self.device = TOTPDevice.objects.create(user=self.user, secret=pyotp.random_base32(), confirmed=True)
+
+    def test_authenticate_loads_device_in_one_query(self):
+        with self.assertNumQueries(1):
+            user = authenticate(email=" doctor@example.COM", password="pass")
+            self.assertEqual(user.totp_device.secret, self.device.secret)
+        self.assertIsNone(authenticate(email="doctor@example.com", password="wrong"))
+        self.assertIsNone(authenticate(email="nobody@example.com", password="pass"))
+
+    def test_login_totp_flow_query_count(self):
+        # Вход: только пользователь с устройством, сессия в базе ещё не создаётся
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse("accounts:login"), {"email": "doctor@example.com", "password": "pass"})
+        self.assertRedirects(response, reverse("accounts:verify_totp"), fetch_redirect_response=False)
+        self.assertFalse(Session.objects.exists())
+
+        # TOTP: пользователь с устройством (1 запрос) + last_login;
+        # остальное — создание сессии при входе (проверка ключа, INSERT, сохранение)
+        code = pyotp.TOTP(self.device.secret).now()
+        with self.assertNumQueries(9):
+            response = self.client.post(reverse("accounts:verify_totp"), {"code": code})
+        self.assertRedirects(response, settings.LOGIN_REDIRECT_URL, fetch_redirect_response=False)
+        self.assertEqual(int(self.client.session["_auth_user_id"]), self.user.id)
+
+
+@override_settings(**LOCMEM)
+class PendingLoginTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        User.objects.create_user("doctor", "doctor@example.com", "pass")
+
+    def test_email_flow_persists_only_final_session(self):
+        self.client.post(reverse("accounts:login"), {"email": "doctor@example.com", "password": "pass"})
+        self.client.post(reverse("accounts:verify"), {"action": "send"})
+        self.assertFalse(Session.objects.exists())
+
+        code = OutboxMessage.objects.get().body.rsplit(" ", 1)[-1]
+        response = self.client.post(reverse("accounts:verify"), {"action": "verify", "code": code})
+
+        self.assertRedirects(response, settings.LOGIN_REDIRECT_URL, fetch_redirect_response=False)
+        self.assertEqual(Session.objects.count(), 1)
+        self.assertTrue(self.client.session["is_2fa_verified"])
+        # Повторно тем же состоянием воспользоваться нельзя
+        self.client.logout()
+        self.assertRedirects(self.client.get(reverse("accounts:verify")), reverse("accounts:login"),
+                             fetch_redirect_response=False)
+
+    def test_state_survives_default_cache_overflow(self):
+        self.client.post(reverse("accounts:login"), {"email": "doctor@example.com", "password": "pass"})
+        # Кулдауны и прочее в default: вытеснение там не должно сбрасывать незавершённые входы
+        caches["default"].set_many({f"filler:{i}": i for i in range(1000)})
+
+        self.assertEqual(self.client.get(reverse("accounts:verify")).status_code, 200)
+
+    def test_forged_cookie_is_ignored(self):
+        self.client.cookies["liveheart_pending_login"] = "forged"
+        self.assertRedirects(self.client.get(reverse("accounts:verify")), reverse("accounts:login"),
+                             fetch_redirect_response=False)
+
+    def test_clear_expired_sessions_in_batches(self):
+        now = timezone.now()
+        for i in range(7):
+            Session.objects.create(session_key=f"old{i}", session_data="", expire_date=now - timedelta(days=1))
+        Session.objects.create(session_key="live", session_data="", expire_date=now + timedelta(days=1))
+
+        # Три пачки по выборке ключей и DELETE; неполная пачка — последняя
+        with self.assertNumQueries(6):
+            call_command("clear_expired_sessions", batch=3, pause=0, stdout=io.StringIO())
+        self.assertEqual(list(Session.objects.values_list("session_key", flat=True)), ["live"])
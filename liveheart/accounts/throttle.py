@@ -0,0 +1,121 @@
+"""
+Ограничение частоты попыток входа: скользящее окно в кэше LOGIN_THROTTLE_CACHE.
+
+Каждому IP и каждой учётной записи положено capacity попыток за окно capacity / rate секунд
+(в среднем rate попыток в секунду). Попытки считаются в счётчике текущего окна, а прошлое окно
+учитывается с весом оставшейся от него доли — так лимит не удваивается на стыке окон.
+Проверка делается до хэширования пароля и до запросов к базе, исчерпанный лимит сразу даёт
+дешёвый ответ 429.
+
+Счётчики меняются атомарными add/incr, поэтому параллельные запросы не тратят одну попытку
+дважды. Кэш должен быть общим для процессов сервера, иначе каждый процесс считал бы свой лимит:
+по умолчанию это файл SQLite (liveheart.sqlite_cache), для нескольких машин — Redis.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from liveheart.metrics import collect, counter
+
+THROTTLE_CHECKS = counter(
+    "liveheart_login_throttle_total", "Проверки лимита входа по видам запросов", ("view", "result"),
+)
+
+
+def _cache():
+    return caches[settings.LOGIN_THROTTLE_CACHE]
+
+
+class SlidingWindow:
+    def __init__(self, scope, capacity, rate):
+        self.scope = scope
+        self.capacity = capacity
+        # За окно набирается capacity попыток при rate попыток в секунду
+        self.window = capacity / rate
+        # Счётчик нужен, пока окно текущее или прошлое
+        self.timeout = int(2 * self.window) + 1
+
+    def _key(self, key, window):
+        return f"throttle:{self.scope}:{hashlib.sha1(str(key).encode()).hexdigest()}:{window}"
+
+    def take(self, key, tokens=1):
+        """(разрешено ли, через сколько секунд появится попытка)"""
+        window, elapsed = divmod(time.time(), self.window)
+        window = int(window)
+        current = self._key(key, window)
+        cache = _cache()
+        cache.add(current, 0, timeout=self.timeout)
+        count = cache.incr(current, tokens)
+        previous = cache.get(self._key(key, window - 1), 0) * (1 - elapsed / self.window)
+        if previous + count <= self.capacity:
+            return True, 0
+
+        # Отказ попытку не тратит
+        cache.decr(current, tokens)
+        # Ждать, пока вес прошлого окна не освободит место, но не дольше конца текущего окна
+        excess = previous + count - self.capacity
+        wait = self.window - elapsed
+        if previous:
+            wait = min(wait, excess / (previous / (self.window - elapsed)))
+        return False, int(wait) + 1
+
+
+def limiter(scope):
+    capacity, rate = settings.LOGIN_THROTTLE_RATES[scope]
+    return SlidingWindow(scope, capacity, rate)
+
+
+def client_ip(request):
+    """IP клиента; за обратным прокси — последний адрес из заголовка, который добавил прокси"""
+    header = settings.LOGIN_THROTTLE_IP_HEADER
+    if header and request.META.get(header):
+        return request.META[header].split(",")[-1].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def throttle_stats():
+    """Счётчики проверок и отказов по видам запросов (для мониторинга), сумма по процессам"""
+    values = collect().get(THROTTLE_CHECKS.name, {})
+    return {
+        f"{view}:{result}": values.get((view, result), 0)
+        for view in settings.LOGIN_THROTTLE_VIEWS for result in ("checked", "denied")
+    }
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse("Слишком много попыток, повторите позже", status=429,
+                            content_type="text/plain; charset=utf-8")
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+def throttled(name, account_key):
+    """
+    Декоратор для POST-запросов входа: сначала лимит IP, затем лимит учётной записи.
+    account_key(request) — ключ учётной записи (email в нижнем регистре) или None.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method != "POST":
+                return view_func(request, *args, **kwargs)
+
+            THROTTLE_CHECKS.inc(name, "checked")
+            allowed, retry_after = limiter("ip").take(client_ip(request))
+            if allowed:
+                account = account_key(request)
+                if account:
+                    allowed, retry_after = limiter("account").take(account)
+            if not allowed:
+                THROTTLE_CHECKS.inc(name, "denied")
+                return too_many_requests(retry_after)
+
+            return view_func(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -12,5 +12,6 @@ urlpatterns = [
     path("verify-totp/", views.verify_totp_view, name="verify_totp"),
     path("totp/disable/", views.disable_totp_view, name="disable_totp"),
     path("profile/", views.profile_view, name="profile"),
+    path("throttle/stats/", views.throttle_stats_view, name="throttle_stats"),
 
 ]
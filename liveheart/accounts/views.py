@@ -4,12 +4,19 @@ import pyotp
 from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import User
-from django.core.mail import send_mail
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
 from django.shortcuts import render, redirect
 
+from liveheart.timing import query_budget
+from patients.stats import dashboard_summary
+
+from . import pending
+from .backends import EmailBackend, normalize_email
 from .decorators import two_factor_required
 from .models import TOTPDevice
+from .outbox import cooldown_left, enqueue_email, start_cooldown
+from .throttle import throttle_stats, throttled
 from .totp import generate_totp_secret, verify_totp
 from .utils import generate_2fa_code, hash_code
 from .utils_qr import generate_qr_code
@@ -18,21 +25,21 @@ from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 
 
+EMAIL_BACKEND = "accounts.backends.EmailBackend"
+
+
+def _login_email(request):
+    return normalize_email(request.POST.get("email")) or None
+
+
+@throttled("login", _login_email)
 def login_view(request):
     if request.method == "POST":
-        # Очищаем сессию от старых данных
-        request.session.flush()
-
         email = request.POST.get("email")
         password = request.POST.get("password")
 
-        # Ищем пользователя (сначала по email, чтобы получить username)
-        user_obj = User.objects.filter(email=email).first()
-        if not user_obj:
-            return render(request, "accounts/login.html", {"error": "Неверные данные"})
-
-        # Проверяем пароль
-        user = authenticate(request, username=user_obj.username, password=password)
+        # Один запрос: пользователь по индексу на email вместе с устройством TOTP
+        user = authenticate(request, email=email, password=password)
         if not user:
             return render(request, "accounts/login.html", {"error": "Неверные данные"})
 
@@ -41,34 +48,38 @@ def login_view(request):
         # Проверяем, включен ли TOTP у пользователя
         device = getattr(user, "totp_device", None)
 
+        # Сессия в базе до второго фактора не создаётся: состояние входа — в кэше
         if device and device.confirmed:
             # Если есть TOTP -> СРАЗУ на ввод кода из приложения
-            request.session["pre_totp_user_id"] = user.id
-            return redirect("accounts:verify_totp")
+            return pending.start(redirect("accounts:verify_totp"), user, "totp")
         else:
             # Если TOTP нет -> отправляем на проверку Email
-            request.session["pre_2fa_user_id"] = user.id
-            request.session["is_2fa_verified"] = False
-            return redirect("accounts:verify")
+            return pending.start(redirect("accounts:verify"), user, "email")
 
     return render(request, "accounts/login.html")
 
 
+@throttled("verify_2fa", pending.pending_email("email"))
 def verify_2fa_view(request):
-    # Получаем ID пользователя из сессии
-    user_id = request.session.get("pre_2fa_user_id")
-    if not user_id:
+    # Состояние незавершённого входа (из кэша, по cookie)
+    state = pending.load(request, "email")
+    if not state:
         return redirect("accounts:login")
 
-    user = User.objects.get(id=user_id)
+    user = EmailBackend().get_user(state["user_id"])
+    if user is None:
+        return redirect("accounts:login")
     now = int(time.time())
 
-    # Данные для кулдауна (таймера повторной отправки)
-    sent_at = request.session.get("2fa_created_at")
-    cooldown = max(0, 60 - (now - sent_at)) if sent_at else 0
+    # Кулдаун повторной отправки хранится в общем кэше по пользователю:
+    # новая сессия не позволяет обойти его и завалить почтовый сервер письмами
+    sent_at = state.get("code_created_at")
+    cooldown_key = f"2fa-send:{user.id}"
+    resend_cooldown = settings.TWO_FACTOR_RESEND_COOLDOWN
 
     # === ОТПРАВКА КОДА НА ПОЧТУ ===
     if request.method == "POST" and request.POST.get("action") == "send":
+        cooldown = start_cooldown(cooldown_key, resend_cooldown)
         if cooldown > 0:
             return render(request, "accounts/verify.html", {
                 "error": f"Подождите {cooldown} сек.",
@@ -79,32 +90,30 @@ def verify_2fa_view(request):
         # Генерируем код
         code = generate_2fa_code(settings.TWO_FACTOR_CODE_LENGTH)
 
-        # Сохраняем хэш кода и время в сессию
-        request.session["2fa_code_hash"] = hash_code(code)
-        request.session["2fa_created_at"] = now
+        # Сохраняем хэш кода и время в состояние входа
+        pending.update(request, code_hash=hash_code(code), code_created_at=now)
 
-        # Отправляем письмо
-        send_mail(
+        # Письмо только ставится в очередь, отправляет его воркер почты
+        enqueue_email(
+            user.email,
             "Ваш код подтверждения",
             f"Ваш код для входа: {code}",
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            fail_silently=False,
+            ttl=settings.TWO_FACTOR_CODE_TTL,
         )
 
-        return render(request, "accounts/verify.html", {"code_sent": True, "cooldown": 60})
+        return render(request, "accounts/verify.html", {"code_sent": True, "cooldown": resend_cooldown})
 
     # === ПРОВЕРКА КОДА ===
     if request.method == "POST" and request.POST.get("action") == "verify":
         code = request.POST.get("code")
-        stored_hash = request.session.get("2fa_code_hash")
+        stored_hash = state.get("code_hash")
 
         # Проверка 1: Код не запрашивали
         if not stored_hash:
             return render(request, "accounts/verify.html", {"error": "Сначала запросите код"})
 
         # Проверка 2: Истекло время жизни кода (например, 5 минут)
-        if (now - request.session.get("2fa_created_at", 0)) > 300:
+        if (now - state.get("code_created_at", 0)) > settings.TWO_FACTOR_CODE_TTL:
             return render(request, "accounts/verify.html", {"error": "Код устарел, запросите новый"})
 
         # Проверка 3: Код неверный
@@ -112,29 +121,30 @@ def verify_2fa_view(request):
             return render(request, "accounts/verify.html", {"error": "Неверный код", "code_sent": True})
 
         # === УСПЕШНЫЙ ВХОД (Email подтвержден) ===
-        # Чистим временные данные
-        request.session.pop("2fa_code_hash", None)
-        request.session.pop("2fa_created_at", None)
-        request.session.pop("pre_2fa_user_id", None)
-
-        # Авторизуем пользователя
-        login(request, user, backend='django.contrib.auth.backends.ModelBackend')
+        # Авторизуем пользователя: в базу пишется только итоговая сессия
+        login(request, user, backend=EMAIL_BACKEND)
         request.session["is_2fa_verified"] = True
 
-        return redirect(settings.LOGIN_REDIRECT_URL)
+        # Чистим временные данные
+        return pending.finish(request, redirect(settings.LOGIN_REDIRECT_URL))
 
-    return render(request, "accounts/verify.html", {"code_sent": bool(sent_at), "cooldown": cooldown})
+    return render(request, "accounts/verify.html", {
+        "code_sent": bool(sent_at),
+        "cooldown": cooldown_left(cooldown_key, resend_cooldown),
+    })
 
 
+@throttled("verify_totp", pending.pending_email("totp"))
 def verify_totp_view(request):
-    # Берем ID, который мы положили в login_view
-    user_id = request.session.get("pre_totp_user_id")
+    # Берем состояние, которое сохранил login_view
+    state = pending.load(request, "totp")
 
-    # Если ID нет, значит пользователь не прошел первый этап
-    if not user_id:
+    # Если его нет, значит пользователь не прошел первый этап
+    if not state:
         return redirect("accounts:login")
 
-    user = User.objects.get(id=user_id)
+    # Пользователь и устройство TOTP одним запросом
+    user = EmailBackend().get_user(state["user_id"])
     device = getattr(user, "totp_device", None)
 
     # Если каким-то чудом сюда попал юзер без TOTP
@@ -146,13 +156,11 @@ def verify_totp_view(request):
 
         if verify_totp(device.secret, code):
             # === УСПЕШНЫЙ ВХОД (TOTP подтвержден) ===
-            login(request, user, backend='django.contrib.auth.backends.ModelBackend')
+            login(request, user, backend=EMAIL_BACKEND)
             request.session["is_2fa_verified"] = True
 
-            # Чистим сессию
-            request.session.pop("pre_totp_user_id", None)
-
-            return redirect(settings.LOGIN_REDIRECT_URL)
+            # Чистим временные данные
+            return pending.finish(request, redirect(settings.LOGIN_REDIRECT_URL))
         else:
             return render(request, "accounts/verify_totp.html", {"error": "Неверный код"})
 
@@ -200,8 +208,10 @@ def totp_setup(request):
 
 
 @two_factor_required
+@query_budget(3)
 def dashboard(request):
-    return render(request, "accounts/dashboard1.html")
+    # Статистика берётся из дневных сводок: O(дней), а не O(обследований)
+    return render(request, "accounts/dashboard1.html", {"stats": dashboard_summary(request.user)})
 
 
 @login_required
@@ -267,6 +277,11 @@ def disable_totp_view(request):
 
     return render(request, "accounts/disable_totp.html")
 
+@staff_member_required
+def throttle_stats_view(request):
+    return JsonResponse(throttle_stats())
+
+
 def logout_view(request):
     logout(request)
     return redirect("accounts:login")
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'liveheart.settings')
 
 application = get_asgi_application()
+
+# Прогрев генераторов отчётов, шрифтов и шаблонов до приёма запросов (WARMUP_MODE)
+from patients.warmup import warm_up_on_start  # noqa: E402
+
+warm_up_on_start()
@@ -0,0 +1,52 @@
+"""
+Отдельное соединение для чтения (SQLITE_READ_CONNECTION=True).
+
+Представления, которые только читают (история, карта пациента, отчёты), помечаются
+декоратором read_only_view, и их запросы идут через алиас "read": тот же файл базы,
+но соединение с query_only и без BEGIN IMMEDIATE, поэтому чтение не встаёт в очередь
+за блокировкой записи. Запись всегда идёт в "default".
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.db import DEFAULT_DB_ALIAS
+
+READ_ALIAS = "read"
+
+_read_only = ContextVar("read_only_view", default=False)
+
+
+@contextmanager
+def read_only():
+    """Чтения внутри блока идут через соединение для чтения"""
+    token = _read_only.set(True)
+    try:
+        yield
+    finally:
+        _read_only.reset(token)
+
+
+def read_only_view(view_func):
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        with read_only():
+            return view_func(request, *args, **kwargs)
+
+    return wrapper
+
+
+class ReadWriteRouter:
+    def db_for_read(self, model, **hints):
+        return READ_ALIAS if _read_only.get() else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Явно: объект, прочитанный через "read", сохраняется в основную базу
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Оба алиаса — один и тот же файл
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
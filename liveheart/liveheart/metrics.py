@@ -0,0 +1,427 @@
+"""
+Метрики для Prometheus без внешних сервисов.
+
+Каждый процесс (gunicorn, воркеры отчётов и почты) копит счётчики, гистограммы и датчики в памяти:
+запись — короткая блокировка и увеличение числа, единицы микросекунд, без файлового ввода-вывода.
+Фоновый поток раз в METRICS_FLUSH_INTERVAL секунд (и atexit) сбрасывает снимок состояния
+в METRICS_DIR/<pid>-<время старта>.json (временный файл и os.replace); ошибки записи
+не выходят за пределы потока. /metrics/ складывает файлы всех процессов: счётчики и гистограммы
+суммируются, датчики — только по живым процессам. Файлы завершившихся процессов при сборке
+переносятся в archive.json и удаляются, поэтому их число не растёт, а значения не откатываются.
+Время старта в имени не даёт новому процессу с тем же pid перезаписать чужие счётчики.
+
+Для гистограмм кроме корзин отдаются оценки p50/p95/p99 (<имя>_quantile), посчитанные
+по корзинам так же, как histogram_quantile в Prometheus.
+"""
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: сборку файлов не разводим между процессами
+    fcntl = None
+
+logger = logging.getLogger("liveheart.metrics")
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))  # 1 КБ ... 256 МБ
+
+ARCHIVE_NAME = "archive.json"
+
+_registry = {}
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_flusher_guard = threading.Lock()
+_flusher = None
+_started = time.time_ns()
+
+
+def _start_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _flusher_guard:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True)
+            _flusher.start()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        flush()
+
+
+def _after_fork():
+    # Дочерний процесс (gunicorn --preload, пул воркеров) начинает с нуля: свои файл, поток и значения
+    global _lock, _flush_lock, _flusher_guard, _flusher, _started
+    _lock = threading.Lock()
+    _flush_lock = threading.Lock()
+    _flusher_guard = threading.Lock()
+    _flusher = None
+    _started = time.time_ns()
+    for metric in _registry.values():
+        metric.values.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        _registry[name] = self
+
+    def state(self):
+        """Копия значений; вызывать под _lock"""
+        return [[list(key), value] for key, value in self.values.items()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        with _lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+        _start_flusher()
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, *labelvalues):
+        with _lock:
+            self.values[labelvalues] = value
+        _start_flusher()
+
+    def inc(self, *labelvalues, amount=1):
+        with _lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+        _start_flusher()
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            data = self.values.get(labelvalues)
+            if data is None:
+                # Счётчики по корзинам (последняя — +Inf), сумма
+                data = self.values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            data[0][index] += 1
+            data[1] += value
+        _start_flusher()
+
+    def state(self):
+        return [[list(key), [counts[:], total]] for key, (counts, total) in self.values.items()]
+
+
+def counter(name, help_text, labels=()):
+    return _registry.get(name) or Counter(name, help_text, labels)
+
+
+def gauge(name, help_text, labels=()):
+    return _registry.get(name) or Gauge(name, help_text, labels)
+
+
+def histogram(name, help_text, labels=(), buckets=DURATION_BUCKETS):
+    return _registry.get(name) or Histogram(name, help_text, labels, buckets)
+
+
+# --- сброс на диск и сборка по процессам ---
+
+def _directory():
+    return Path(settings.METRICS_DIR)
+
+
+def process_file_name():
+    """Имя файла процесса: pid и время старта, чтобы повторно выданный pid не путался со старым"""
+    return f"{os.getpid()}-{_started}.json"
+
+
+def snapshot():
+    """Согласованная копия всех метрик процесса"""
+    with _lock:
+        return {name: metric.state() for name, metric in _registry.items() if metric.values}
+
+
+def flush():
+    """Записывает снимок процесса в METRICS_DIR; ошибки записи только журналируются"""
+    data = snapshot()
+    if not data:
+        return  # процесс ничего не записал (например, manage.py migrate)
+    if not _flush_lock.acquire(blocking=False):
+        return  # сбрасывает другой поток
+    try:
+        directory = _directory()
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / process_file_name()
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data))
+        os.replace(tmp_path, path)
+    except (OSError, ValueError, TypeError):
+        logger.warning("Не удалось записать метрики процесса", exc_info=True)
+    finally:
+        _flush_lock.release()
+
+
+atexit.register(flush)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_json(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None  # файл удалили или он недописан
+
+
+def _merge(merged, data, include_gauges=True):
+    for name, rows in data.items():
+        metric = _registry.get(name)
+        if metric is None or (metric.kind == "gauge" and not include_gauges):
+            continue
+        values = merged.setdefault(name, {})
+        for key, value in rows:
+            key = tuple(key)
+            if metric.kind == "histogram":
+                total = values.setdefault(key, [[0] * len(value[0]), 0.0])
+                total[0] = [a + b for a, b in zip(total[0], value[0])]
+                total[1] += value[1]
+            else:
+                values[key] = values.get(key, 0) + value
+
+
+def _state(merged):
+    return {name: [[list(key), value] for key, value in values.items()] for name, values in merged.items()}
+
+
+def process_files(directory):
+    """
+    Файлы процессов: [(path, живой ли процесс)]. Из нескольких файлов с одним pid живым может быть
+    только последний по времени старта (pid выдан повторно).
+    """
+    files = {}
+    for path in directory.glob("*.json"):
+        pid, _, started = path.stem.partition("-")
+        if not pid.isdigit():
+            continue  # archive.json
+        files.setdefault(int(pid), []).append((int(started or 0), path))
+    result = []
+    for pid, entries in files.items():
+        entries.sort()
+        alive = _alive(pid)
+        for i, (_, path) in enumerate(entries):
+            result.append((path, alive and i == len(entries) - 1))
+    return result
+
+
+class _DirectoryLock:
+    """Сборку архива ведёт один процесс за раз, иначе файл умершего процесса учтётся дважды"""
+
+    def __init__(self, directory):
+        self.path = directory / ".lock"
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.fd = os.open(self.path, os.O_CREAT | os.O_RDWR)
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+
+
+def archive_dead(directory, merge=_merge):
+    """
+    Переносит файлы завершившихся процессов в archive.json и удаляет их (вызывать под
+    _DirectoryLock). Датчики мёртвых процессов не переносятся. Возвращает число перенесённых файлов.
+    """
+    dead = [path for path, alive in process_files(directory) if not alive]
+    archive_path = directory / ARCHIVE_NAME
+    archive = {}
+    merge(archive, _read_json(archive_path) or {})
+    moved = []
+    for path in dead:
+        data = _read_json(path)
+        if data is not None:
+            merge(archive, data, include_gauges=False)
+            moved.append(path)
+    if not moved:
+        return 0
+    tmp_path = archive_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(_state(archive)))
+    os.replace(tmp_path, archive_path)
+    for path in moved:
+        path.unlink(missing_ok=True)
+    return len(moved)
+
+
+def collect():
+    """Сумма состояний всех процессов: {имя метрики: {значения меток: значение}}"""
+    flush()
+    directory = _directory()
+    merged = {}
+    if not directory.exists():
+        return merged
+    # Под блокировкой: файл, который соседний процесс сейчас переносит в архив, не учтётся дважды
+    with _DirectoryLock(directory):
+        try:
+            archive_dead(directory)
+        except OSError:
+            logger.warning("Не удалось перенести метрики завершившихся процессов", exc_info=True)
+        _merge(merged, _read_json(directory / ARCHIVE_NAME) or {})
+        for path, alive in process_files(directory):
+            data = _read_json(path)
+            if data is not None:
+                _merge(merged, data, include_gauges=alive)
+    return merged
+
+
+def quantile(q, buckets, counts):
+    """Оценка квантиля по корзинам гистограммы (линейная интерполяция внутри корзины)"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    for i, count in enumerate(counts):
+        if cumulative + count >= rank and count:
+            if i == len(buckets):
+                return buckets[-1]  # в корзине +Inf верхней границы нет
+            lower = buckets[i - 1] if i else 0.0
+            return lower + (buckets[i] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return buckets[-1]
+
+
+# --- формат Prometheus ---
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(merged=None):
+    merged = collect() if merged is None else merged
+    lines = []
+    for name, metric in sorted(_registry.items()):
+        values = merged.get(name, {})
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        if metric.kind != "histogram":
+            lines += [f"{name}{_labels(metric.labels, key)} {_number(value)}" for key, value in sorted(values.items())]
+            continue
+
+        quantile_lines = []
+        for key, (counts, total_sum) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else _number(float(bound))
+                lines.append(f"{name}_bucket{_labels(metric.labels, key, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(metric.labels, key)} {_number(float(total_sum))}")
+            lines.append(f"{name}_count{_labels(metric.labels, key)} {cumulative}")
+            for q in QUANTILES:
+                value = quantile(q, metric.buckets, counts)
+                if value is not None:
+                    quantile_lines.append(
+                        f"{name}_quantile{_labels(metric.labels, key, [('quantile', q)])} {_number(float(value))}"
+                    )
+        if quantile_lines:
+            lines.append(f"# HELP {name}_quantile {metric.help} (оценка по корзинам)")
+            lines.append(f"# TYPE {name}_quantile gauge")
+            lines += quantile_lines
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Обнуляет метрики процесса (для тестов)"""
+    with _lock:
+        for metric in _registry.values():
+            metric.values.clear()
+
+
+# --- метрики приложения ---
+
+REQUEST_SECONDS = histogram(
+    "liveheart_http_request_duration_seconds", "Время обработки запроса по имени URL", ("view",),
+)
+REQUESTS = counter("liveheart_http_requests_total", "Запросы по имени URL и коду ответа", ("view", "status"))
+EXPORT_SECONDS = histogram("liveheart_export_duration_seconds", "Время сборки отчёта", ("format",))
+EXPORT_BYTES = histogram("liveheart_export_size_bytes", "Размер отчёта", ("format",), buckets=SIZE_BUCKETS)
+EXPORTS_RUNNING = gauge("liveheart_export_jobs_running", "Задания экспорта, которые собираются сейчас")
+SMTP_SECONDS = histogram("liveheart_smtp_send_duration_seconds", "Отправка письма через SMTP", ("result",))
+DB_LOCK_WAITS = counter(
+    "liveheart_db_lock_waits_total", "Записи в БД, ждавшие блокировку дольше METRICS_LOCK_WAIT_MS", ("alias",),
+)
+DB_LOCKED = counter("liveheart_db_locked_total", "Ошибки database is locked после ожидания", ("alias",))
+
+WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "BEGIN", "REPLACE")
+
+
+def db_wrapper(execute, sql, params, many, context):
+    """execute_wrapper для всех соединений: ожидание блокировки записи и ошибки блокировки"""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    except Exception as exc:
+        if "database is locked" in str(exc):
+            DB_LOCKED.inc(context["connection"].alias)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        if elapsed * 1000 >= settings.METRICS_LOCK_WAIT_MS and sql.lstrip()[:7].upper().startswith(WRITE_PREFIXES):
+            DB_LOCK_WAITS.inc(context["connection"].alias)
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    """Обработчик connection_created"""
+    # В начало списка: execute_wrapper() из timing снимает обёртку с конца
+    if db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, db_wrapper)
@@ -13,6 +13,10 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 from pathlib import Path
 from dotenv import load_dotenv
 import os
+import sys
+import tempfile
+
+from .sqlite import sqlite_options
 
 load_dotenv()
 
@@ -21,6 +25,10 @@ load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
+# Запуск manage.py test
+TESTING = sys.argv[1:2] == ["test"]
+
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/6.0/howto/deployment/checklist/
 
@@ -47,6 +55,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым: замер охватывает весь запрос вместе с остальными middleware
+    'liveheart.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,7 +72,8 @@ ROOT_URLCONF = 'liveheart.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендеринга для Server-Timing
+        'BACKEND': 'liveheart.timing.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -85,9 +96,22 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # WAL, synchronous=NORMAL, mmap, кэш страниц, ожидание блокировки (liveheart/sqlite.py)
+        'OPTIONS': sqlite_options(),
     }
 }
 
+# Отдельное соединение только для чтения для истории, карты пациента и отчётов
+SQLITE_READ_CONNECTION = os.getenv("SQLITE_READ_CONNECTION") == "True"
+if SQLITE_READ_CONNECTION:
+    DATABASES['read'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DATABASES['default']['NAME'],
+        'OPTIONS': sqlite_options(read_only=True),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['liveheart.db_router.ReadWriteRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -130,6 +154,9 @@ STATICFILES_DIRS = [
 ]
 
 AUTHENTICATION_BACKENDS = [
+    # Вход врачей по email: пользователь и устройство TOTP одним запросом
+    'accounts.backends.EmailBackend',
+    # Вход в админку по имени пользователя
     'django.contrib.auth.backends.ModelBackend',
 ]
 
@@ -146,6 +173,60 @@ CSRF_COOKIE_SECURE = not DEBUG
 
 TWO_FACTOR_CODE_LENGTH = 6
 TWO_FACTOR_CODE_TTL = 300
+# Повторная отправка кода не чаще раза в минуту на пользователя (общий кэш, а не сессия)
+TWO_FACTOR_RESEND_COOLDOWN = 60
+# Незавершённый вход (до второго фактора) хранится в кэше, а не в django_session
+TWO_FACTOR_STATE_CACHE = "two_factor"
+TWO_FACTOR_STATE_TTL = 600
+
+
+# Лимит попыток входа (скользящее окно): вид ключа -> (попыток за окно, в среднем попыток/сек.)
+LOGIN_THROTTLE_RATES = {
+    "ip": (30, 0.5),          # 30 попыток в минуту с одного IP
+    "account": (10, 1 / 30),  # 10 попыток за 5 минут на учётную запись (email)
+}
+LOGIN_THROTTLE_VIEWS = ("login", "verify_2fa", "verify_totp")
+# За обратным прокси: заголовок с адресом клиента, например "HTTP_X_FORWARDED_FOR"
+LOGIN_THROTTLE_IP_HEADER = os.getenv("LOGIN_THROTTLE_IP_HEADER")
+
+
+# Кэши. По умолчанию:
+#   default    — файлы на диске, общие для процессов сервера: кулдауны повторной отправки кода;
+#   two_factor — незавершённые входы: тоже файлы, но в своём каталоге и с запасом ёмкости, чтобы
+#                их не вытесняли другие записи (запись появляется только после верного пароля);
+#   throttle   — счётчики лимита входа в файле SQLite (liveheart/sqlite_cache.py), общем для процессов
+#                сервера: атомарный incr, и записи не вытесняются по числу. Файловый кэш не годится:
+#                перебор создаёт ключ на каждый IP и адрес, а он при переполнении удаляет случайную
+#                треть ключей, в том числе счётчики самого атакующего; кэш в памяти считал бы лимит
+#                в каждом процессе отдельно.
+# Для нескольких серверов — Redis для всех
+# (CACHE_BACKEND=django.core.cache.backends.redis.RedisCache, CACHE_LOCATION=redis://...).
+CACHE_BACKEND = os.getenv("CACHE_BACKEND")
+CACHE_LOCATION = os.getenv("CACHE_LOCATION")
+if CACHE_BACKEND:
+    CACHES = {
+        alias: {"BACKEND": CACHE_BACKEND, "LOCATION": CACHE_LOCATION, "KEY_PREFIX": alias}
+        for alias in ("default", "two_factor", "throttle")
+    }
+else:
+    _cache_dir = Path(CACHE_LOCATION or BASE_DIR / "cache")
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": str(_cache_dir),
+            "OPTIONS": {"MAX_ENTRIES": 10_000},
+        },
+        "two_factor": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": str(_cache_dir / "two_factor"),
+            "OPTIONS": {"MAX_ENTRIES": 10_000},
+        },
+        "throttle": {
+            "BACKEND": "liveheart.sqlite_cache.SQLiteCache",
+            "LOCATION": str(_cache_dir / "throttle.sqlite3"),
+        },
+    }
+LOGIN_THROTTLE_CACHE = "throttle"
 
 
 EMAIL_BACKEND = os.getenv(
@@ -165,4 +246,74 @@ DEFAULT_FROM_EMAIL = os.getenv(
     EMAIL_HOST_USER,
 )
 
-
+# Очередь писем: отправляет run_outbox_worker; EAGER — сразу после коммита, без воркера
+EMAIL_OUTBOX_EAGER = os.getenv("EMAIL_OUTBOX_EAGER") == "True"
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_BASE = 5     # сек., удваивается с каждой попыткой
+EMAIL_OUTBOX_RETRY_MAX = 300
+# Воркер отмечает письмо перед отправкой; письма без отметки дольше EMAIL_OUTBOX_STALE_AFTER сек.
+# считаются брошенными упавшим воркером и возвращаются в очередь
+EMAIL_OUTBOX_STALE_AFTER = float(os.getenv("EMAIL_OUTBOX_STALE_AFTER", 60))
+
+
+
+
+# Фоновая сборка отчётов: файлы заданий ExportJob и режим без отдельного воркера
+EXPORT_ROOT = Path(os.getenv("EXPORT_ROOT", BASE_DIR / "exports"))
+EXPORT_JOBS_EAGER = os.getenv("EXPORT_JOBS_EAGER") == "True"
+# Воркер отмечает свои задания раз в EXPORT_JOB_HEARTBEAT секунд; задания без отметки дольше
+# EXPORT_JOB_STALE_AFTER считаются брошенными и возвращаются в очередь
+EXPORT_JOB_HEARTBEAT = float(os.getenv("EXPORT_JOB_HEARTBEAT", 10))
+EXPORT_JOB_STALE_AFTER = float(os.getenv("EXPORT_JOB_STALE_AFTER", 60))
+
+# Дисковый кэш готовых отчётов (LRU по времени последнего обращения)
+REPORT_CACHE_DIR = Path(os.getenv("REPORT_CACHE_DIR", BASE_DIR / "report_cache"))
+REPORT_CACHE_MAX_BYTES = int(os.getenv("REPORT_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Число процессов для пакетной выгрузки протоколов в ZIP (0 — собирать в процессе запроса)
+BATCH_EXPORT_WORKERS = int(os.getenv("BATCH_EXPORT_WORKERS", os.cpu_count() or 1))
+
+# Сборка PDF: "xhtml2pdf" (через HTML-шаблон) или "reportlab" (протокол рисуется напрямую, быстрее)
+REPORT_PDF_BACKEND = os.getenv("REPORT_PDF_BACKEND", "xhtml2pdf")
+# TTF-шрифты с кириллицей для ReportLab; без них сборка PDF и прогрев завершаются ошибкой
+REPORT_PDF_FONT = os.getenv("REPORT_PDF_FONT", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
+REPORT_PDF_FONT_BOLD = os.getenv("REPORT_PDF_FONT_BOLD", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf")
+
+# Метрики Prometheus (liveheart/metrics.py): файлы процессов, период их сброса на диск,
+# с какого времени запись считается ждавшей блокировку, кому открыт /metrics/ (и персоналу)
+METRICS_DIR = Path(os.getenv("METRICS_DIR", BASE_DIR / "metrics"))
+if TESTING:
+    METRICS_DIR = Path(tempfile.gettempdir()) / "liveheart-test-metrics"
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))
+METRICS_LOCK_WAIT_MS = 100
+METRICS_ALLOWED_IPS = os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+
+# Ключ псевдонимов в исследовательской выгрузке (patients/research.py); смена ключа разрывает
+# связь с прошлыми выгрузками. Отдельный от SECRET_KEY: без ключа выгрузка не собирается
+RESEARCH_PSEUDONYM_KEY = os.getenv("RESEARCH_PSEUDONYM_KEY", "")
+
+# Прогрев процесса при старте: "off", "sync" (до приёма запросов) или "background"
+WARMUP_MODE = os.getenv("WARMUP_MODE", "off")
+
+# Бланк протокола DOCX (шапка больницы, стили, таблицы с подстановками {{ ... }})
+REPORT_DOCX_TEMPLATE = Path(os.getenv("REPORT_DOCX_TEMPLATE", BASE_DIR / "patients" / "report_templates" / "protocol.docx"))
+
+
+# Замер запросов (liveheart/timing.py): заголовок Server-Timing показывает клиенту внутреннее
+# устройство ответа, поэтому по умолчанию только при DEBUG
+SERVER_TIMING = DEBUG or os.getenv("SERVER_TIMING") == "True"
+# Запросы дольше порога пишутся в журнал liveheart.slow_requests (JSON)
+SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", 500))
+# Превышение query_budget в тестах — ошибка, в работе — предупреждение в журнале
+QUERY_BUDGET_STRICT = TESTING
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "liveheart.slow_requests": {"handlers": ["console"], "level": "WARNING", "propagate": False},
+    },
+}
@@ -0,0 +1,46 @@
+"""
+Настройки соединений SQLite для одновременной работы нескольких врачей.
+
+- WAL: читатели не ждут писателя, писатель не ждёт читателей;
+- synchronous=NORMAL: в WAL данные не теряются при падении процесса, fsync только на checkpoint;
+- mmap и кэш страниц побольше: история и отчёты читаются из памяти;
+- timeout: сколько ждать занятую базу, прежде чем отдать "database is locked";
+- BEGIN IMMEDIATE: транзакция берёт блокировку записи сразу, а не при первом INSERT, —
+  иначе повышение блокировки чтения до записи падает с SQLITE_BUSY без ожидания.
+
+Модуль импортируется из settings, поэтому не зависит от Django.
+"""
+import os
+
+MB = 1024 * 1024
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def sqlite_pragmas(read_only=False):
+    pragmas = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "temp_store": "MEMORY",
+        "mmap_size": _env_int("SQLITE_MMAP_SIZE", 256 * MB),
+        # Отрицательное значение — размер в КиБ, а не в страницах
+        "cache_size": -_env_int("SQLITE_CACHE_SIZE", 64 * MB) // 1024,
+    }
+    if read_only:
+        pragmas["query_only"] = "ON"
+    return pragmas
+
+
+def sqlite_options(read_only=False):
+    """OPTIONS для DATABASES: прагмы на каждое новое соединение, ожидание блокировки, режим транзакций"""
+    pragmas = sqlite_pragmas(read_only)
+    options = {
+        "init_command": ";".join(f"PRAGMA {name}={value}" for name, value in pragmas.items()),
+        "timeout": _env_int("SQLITE_BUSY_TIMEOUT", 20),
+    }
+    if not read_only:
+        options["transaction_mode"] = "IMMEDIATE"
+    return options
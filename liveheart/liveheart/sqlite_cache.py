@@ -0,0 +1,122 @@
+"""
+Кэш Django в отдельном файле SQLite (LOCATION — путь к файлу): общий для всех процессов сервера
+на одной машине и без Redis.
+
+Нужен лимиту попыток входа (accounts.throttle), которому важны общие для процессов счётчики:
+- incr — один UPDATE ... RETURNING, атомарен и между потоками, и между процессами;
+- add — один INSERT ... ON CONFLICT, занятый живой записью ключ не перезаписывается;
+- целые числа хранятся как INTEGER, остальное — pickle.
+
+Записи не вытесняются по числу (MAX_ENTRIES не действует), как в файловом кэше, где при
+переполнении удаляется случайная треть ключей: просроченные записи удаляются раз в CULL_EVERY записей.
+Каждая запись — отдельная транзакция в WAL без fsync: после сбоя питания счётчики могут
+откатиться на последние секунды, для лимита попыток это несущественно.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+CULL_EVERY = 1000
+
+SCHEMA = "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value, expires REAL) WITHOUT ROWID"
+ALIVE = "(expires IS NULL OR expires > ?)"
+
+
+def _encode(value):
+    if type(value) is int:
+        return value
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _decode(value):
+    return pickle.loads(value) if isinstance(value, bytes) else value
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = Path(location)
+        self._local = threading.local()
+        self._writes = 0
+
+    def _db(self):
+        # Соединение на поток; после fork дочерний процесс открывает своё
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=20, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=OFF")
+            db.execute(SCHEMA)
+            local.db, local.pid = db, os.getpid()
+        return local.db
+
+    def _write(self, sql, params):
+        db = self._db()
+        self._writes += 1
+        if self._writes % CULL_EVERY == 0:
+            db.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        return db.execute(sql, params)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._write(
+            "INSERT INTO cache VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE "
+            "SET value = excluded.value, expires = excluded.expires WHERE cache.expires <= ?",
+            (key, _encode(value), self.get_backend_timeout(timeout), time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._db().execute(f"SELECT value FROM cache WHERE key = ? AND {ALIVE}", (key, time.time())).fetchone()
+        return default if row is None else _decode(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._write(
+            "INSERT INTO cache VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE "
+            "SET value = excluded.value, expires = excluded.expires",
+            (key, _encode(value), self.get_backend_timeout(timeout)),
+        )
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._write(
+            f"UPDATE cache SET expires = ? WHERE key = ? AND {ALIVE}",
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        # fetchall: оператор должен дойти до конца, иначе транзакция записи остаётся открытой
+        rows = self._write(
+            f"UPDATE cache SET value = value + ? WHERE key = ? AND {ALIVE} AND typeof(value) = 'integer' "
+            "RETURNING value",
+            (delta, key, time.time()),
+        ).fetchall()
+        if not rows:
+            raise ValueError(f"Key '{key}' not found")
+        return rows[0][0]
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._write("DELETE FROM cache WHERE key = ?", (key,)).rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._db().execute(f"SELECT 1 FROM cache WHERE key = ? AND {ALIVE}", (key, time.time())).fetchone()
+        return row is not None
+
+    def clear(self):
+        self._write("DELETE FROM cache", ())
+
+    def close(self, **kwargs):
+        # Соединение живёт весь поток: Django закрывает кэши после каждого запроса
+        pass
@@ -0,0 +1,170 @@
+"""
+Замер времени запроса по частям: SQL, шаблоны, сборка отчётов.
+
+ServerTimingMiddleware считает время всего запроса, число и время SQL-запросов (execute_wrapper
+на всех соединениях), время шаблонов (TimedDjangoTemplates) и участков, помеченных timed(...).
+Итог уходит в заголовок Server-Timing (SERVER_TIMING=True, виден в DevTools браузера) и в журнал
+liveheart.slow_requests одной JSON-строкой, если запрос дольше SLOW_REQUEST_MS.
+
+Для потоковых ответов (реестр XLSX, ZIP) учитывается время до начала отдачи.
+"""
+import json
+import logging
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+from . import metrics
+
+logger = logging.getLogger("liveheart.slow_requests")
+
+_current = ContextVar("request_timings", default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Представление сделало больше SQL-запросов, чем объявлено в query_budget"""
+
+
+class RequestTimings:
+    __slots__ = ("sql_count", "sql_ms", "spans")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.spans = {}
+
+    def add(self, name, ms):
+        self.spans[name] = self.spans.get(name, 0.0) + ms
+
+
+def current_timings():
+    """Замеры текущего запроса (None вне запроса: воркеры, команды)"""
+    return _current.get()
+
+
+@contextmanager
+def timed(name):
+    """Добавляет время блока к участку name текущего запроса; вне запроса ничего не делает"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, (perf_counter() - started) * 1000)
+
+
+def _sql_wrapper(execute, sql, params, many, context):
+    timings = _current.get()
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if timings is not None:
+            timings.sql_count += 1
+            timings.sql_ms += (perf_counter() - started) * 1000
+
+
+def query_budget(max_queries):
+    """
+    Объявляет предельное число SQL-запросов на запрос к представлению (вместе с сессией и
+    пользователем). Превышение пишется в журнал, а в тестах (QUERY_BUDGET_STRICT) — ошибка.
+    """
+    def decorator(view_func):
+        view_func._query_budget = max_queries
+        return view_func
+
+    return decorator
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        with timed("tpl"):
+            return self.template.render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Шаблонизатор Django, который учитывает время рендеринга в Server-Timing"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class ServerTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = getattr(view_func, "_query_budget", None)
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_sql_wrapper))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total_ms = (perf_counter() - started) * 1000
+
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "<unresolved>"
+        metrics.REQUEST_SECONDS.observe(total_ms / 1000, view)
+        metrics.REQUESTS.inc(view, str(response.status_code))
+
+        if settings.SERVER_TIMING:
+            response["Server-Timing"] = self.header(timings, total_ms)
+        if total_ms >= settings.SLOW_REQUEST_MS:
+            logger.warning(json.dumps(self.record(request, response, timings, total_ms), ensure_ascii=False))
+        self.check_budget(request, timings)
+        return response
+
+    @staticmethod
+    def header(timings, total_ms):
+        parts = [f"total;dur={total_ms:.1f}", f'db;dur={timings.sql_ms:.1f};desc="{timings.sql_count} queries"']
+        parts += [f"{name};dur={ms:.1f}" for name, ms in timings.spans.items()]
+        return ", ".join(parts)
+
+    @staticmethod
+    def record(request, response, timings, total_ms):
+        match = getattr(request, "resolver_match", None)
+        user = getattr(request, "user", None)
+        return {
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "user_id": user.id if user is not None and user.is_authenticated else None,
+            "total_ms": round(total_ms, 1),
+            "sql_count": timings.sql_count,
+            "sql_ms": round(timings.sql_ms, 1),
+            **{f"{name}_ms": round(ms, 1) for name, ms in timings.spans.items()},
+        }
+
+    @staticmethod
+    def check_budget(request, timings):
+        budget = getattr(request, "_query_budget", None)
+        if budget is None or timings.sql_count <= budget:
+            return
+        message = f"{request.method} {request.path}: {timings.sql_count} SQL-запросов при бюджете {budget}"
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
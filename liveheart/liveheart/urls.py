@@ -2,11 +2,15 @@ from django.contrib import admin
 from django.urls import path, include
 from django.shortcuts import redirect
 
+from patients.views import metrics_view, readiness_view
+
 urlpatterns = [
     path("", lambda request: redirect("accounts:dashboard")),
     path("admin/", admin.site.urls),
     path("auth/", include("accounts.urls")),
     path("patients/", include("patients.urls")),
+    path("health/ready/", readiness_view, name="readiness"),
+    path("metrics/", metrics_view, name="metrics"),
 
 ]
 
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'liveheart.settings')
 
 application = get_wsgi_application()
+
+# Прогрев генераторов отчётов, шрифтов и шаблонов до приёма запросов (WARMUP_MODE)
+from patients.warmup import warm_up_on_start  # noqa: E402
+
+warm_up_on_start()
@@ -1,3 +1,21 @@
 from django.contrib import admin
+from django.db import transaction
+
 from .models import *
-admin.site.register([Patient, Examination, Aorta, AorticValve, LeftVentricle, OtherChambers, MitralValve, TricuspidValve, PulmonaryArtery, MyocardialSegment])
\ No newline at end of file
+from .stats import unrecord_exams
+
+admin.site.register([Patient, ExportJob])
+
+
+@admin.register(Examination)
+class ExaminationAdmin(admin.ModelAdmin):
+    # Обследования удаляются без сигналов (см. signals.py): вклад в дневные сводки вычитаем здесь
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            unrecord_exams(Examination.objects.filter(pk=obj.pk))
+            obj.delete()
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            unrecord_exams(queryset)
+            queryset.delete()
@@ -3,3 +3,13 @@ from django.apps import AppConfig
 
 class PatientsConfig(AppConfig):
     name = 'patients'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from liveheart.metrics import install_db_wrapper
+
+        from . import signals  # noqa: F401
+
+        # Ожидание блокировок SQLite считается во всех процессах, не только в веб-запросах
+        connection_created.connect(install_db_wrapper, dispatch_uid="liveheart.metrics")
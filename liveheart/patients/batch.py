@@ -0,0 +1,60 @@
+"""
+Пакетная выгрузка протоколов одним ZIP.
+
+Отчёты собираются параллельно в пуле процессов и дописываются в архив по мере готовности,
+так что первые байты уходят клиенту, не дожидаясь всей пачки.
+"""
+import zipfile
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from .models import Examination
+from .utils import ZipSink
+from .worker_pool import discard_shared_pool, render_exam_report
+
+
+def select_exam_ids(user, exam_ids=None, patient_id=None, day=None):
+    """id обследований врача по списку, пациенту или дню"""
+    qs = Examination.objects.filter(patient__user=user)
+    if exam_ids is not None:
+        qs = qs.filter(id__in=exam_ids)
+    if patient_id is not None:
+        qs = qs.filter(patient_id=patient_id)
+    if day is not None:
+        qs = qs.filter(exam_datetime__date=day)
+    return list(qs.order_by("exam_datetime", "id").values_list("id", flat=True))
+
+
+def _render_serial(exam_ids, fmt):
+    for exam_id in exam_ids:
+        yield render_exam_report(exam_id, fmt)
+
+
+def _render_parallel(pool, futures):
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    except BrokenProcessPool:
+        discard_shared_pool(pool)
+        raise
+
+
+def iter_zip(exam_ids, fmt, pool=None):
+    """
+    Генератор байтов ZIP-архива с отчётами. Без pool — сборка в текущем процессе
+    (тесты, маленькие пачки), иначе в переданном пуле; пул остаётся открытым.
+    """
+    sink = ZipSink()
+    futures = [pool.submit(render_exam_report, exam_id, fmt) for exam_id in exam_ids] if pool else []
+    try:
+        results = _render_parallel(pool, futures) if pool else _render_serial(exam_ids, fmt)
+        # Отчёты уже сжаты (DOCX/XLSX — zip, PDF — deflate), поэтому кладём без сжатия
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf:
+            for exam_id, filename, content in results:
+                zf.writestr(f"{exam_id}_{filename}", content)
+                yield sink.pop()
+        yield sink.pop()
+    finally:
+        # Клиент ушёл: снимаем из общей очереди свои ещё не начатые отчёты
+        for future in futures:
+            future.cancel()
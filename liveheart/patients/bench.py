@@ -0,0 +1,202 @@
+"""Вспомогательные функции для бенчмарков: синтетические данные, замер времени и памяти"""
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from liveheart.db_router import READ_ALIAS
+
+from .models import SEGMENT_COUNT, Examination, Patient
+from .services import examination_fields, save_examinations
+from .stats import record_exams
+
+
+@contextmanager
+def temporary_database(plain=False):
+    """
+    Пустая база с миграциями во временном каталоге вместо рабочей: данные бенчмарка не
+    держат блокировку записи рабочей базы и не попадают в неё. plain — SQLite без OPTIONS.
+    """
+    directory = tempfile.mkdtemp(prefix="liveheart-bench-")
+    aliases = [alias for alias in (DEFAULT_DB_ALIAS, READ_ALIAS) if alias in connections.settings]
+    saved = {alias: dict(connections[alias].settings_dict) for alias in aliases}
+    try:
+        for alias in aliases:
+            connections[alias].close()
+            connections[alias].settings_dict["NAME"] = str(Path(directory) / "bench.sqlite3")
+            if plain:
+                connections[alias].settings_dict["OPTIONS"] = {}
+        call_command("migrate", verbosity=0, interactive=False)
+        yield
+    finally:
+        connections.close_all()
+        for alias in aliases:
+            connections[alias].settings_dict.update(saved[alias])
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def peak_rss_mb():
+    """Пиковый RSS процесса в МБ"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def synthetic_record(rng, i, now=None):
+    """Правдоподобное обследование со всеми разделами и сегментами"""
+    now = now or timezone.now()
+    height = rng.uniform(150, 195)
+    weight = rng.uniform(50, 120)
+    edv = rng.uniform(80, 180)
+    return {
+        "full_name": f"Пациент {i:07d}",
+        "exam": {
+            "exam_datetime": now - timedelta(minutes=rng.randint(0, 60 * 24 * 365)),
+            "age": rng.randint(18, 90),
+            "height": round(height, 1),
+            "weight": round(weight, 1),
+            "bmi": round(weight / (height / 100) ** 2, 1),
+            "bsa": round((height * weight / 3600) ** 0.5, 2),
+            "hr": rng.randint(50, 110),
+        },
+        "sections": {
+            "aorta": {"diameter": round(rng.uniform(25, 40), 1), "valve_opening": round(rng.uniform(14, 22), 1)},
+            "aorticvalve": {
+                "psk": round(rng.uniform(0.8, 4.5), 2),
+                "grad_max": round(rng.uniform(3, 80), 1),
+                "grad_mean": round(rng.uniform(2, 50), 1),
+                "regurgitation": rng.randint(0, 2),
+                "area": round(rng.uniform(0.8, 3.5), 2),
+            },
+            "leftventricle": {
+                "ivsd": round(rng.uniform(7, 14), 1),
+                "edd": round(rng.uniform(40, 65), 1),
+                "esd": round(rng.uniform(25, 50), 1),
+                "pw": round(rng.uniform(7, 13), 1),
+                "edv": round(edv, 1),
+                "esv": round(edv * rng.uniform(0.3, 0.7), 1),
+                "hr": rng.randint(50, 110),
+            },
+            "otherchambers": {
+                "la": round(rng.uniform(30, 50), 1),
+                "ra": round(rng.uniform(30, 50), 1),
+                "rv": round(rng.uniform(20, 35), 1),
+                "lav": round(rng.uniform(30, 90), 1),
+            },
+            "mitralvalve": {
+                "e": round(rng.uniform(0.5, 1.2), 2),
+                "a": round(rng.uniform(0.4, 1.0), 2),
+                "grad_max": round(rng.uniform(1, 10), 1),
+                "dte": round(rng.uniform(140, 240)),
+                "ivrt": round(rng.uniform(60, 110)),
+                "reg": rng.randint(0, 2),
+            },
+            "tricuspidvalve": {
+                "e": round(rng.uniform(0.3, 0.8), 2),
+                "a": round(rng.uniform(0.2, 0.6), 2),
+                "grad_max": round(rng.uniform(5, 40), 1),
+                "tapse": round(rng.uniform(14, 26), 1),
+                "reg": rng.randint(0, 2),
+            },
+            "pulmonaryartery": {
+                "diameter": round(rng.uniform(18, 30), 1),
+                "grad_max": round(rng.uniform(2, 10), 1),
+                "velocity": round(rng.uniform(0.6, 1.2), 2),
+                "at": round(rng.uniform(80, 160)),
+                "et": round(rng.uniform(250, 350)),
+                "reg": rng.randint(0, 2),
+                "ivc": round(rng.uniform(12, 24), 1),
+            },
+        },
+        "segments": [rng.choice((0, 0, 0, 0, 1, 2, 3)) for _ in range(SEGMENT_COUNT)],
+    }
+
+
+def seed_exams(user, count, batch_size=1000, seed=0):
+    """Создаёт count обследований пачками через save_examinations"""
+    rng = random.Random(seed)
+    now = timezone.now()
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        save_examinations(user, [synthetic_record(rng, start + i, now) for i in range(size)])
+
+
+def seed_doctors(doctors, patients, exams, seed=0, prefix="doctor", password="bench", batch_size=1000):
+    """
+    doctors врачей × patients пациентов × exams обследований у каждого пациента (с разделами
+    и сегментами). Врачи — prefix-001@example.com ... с паролем password. Возвращает врачей.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    users = []
+    for d in range(1, doctors + 1):
+        with transaction.atomic():
+            user = User.objects.create_user(f"{prefix}-{d:03d}", f"{prefix}-{d:03d}@example.com", password)
+            people = Patient.objects.bulk_create([
+                Patient(user=user, full_name=f"Пациент {d:03d}-{i:06d}") for i in range(patients)
+            ])
+            pending = []
+            for patient in people:
+                for _ in range(exams):
+                    record = synthetic_record(rng, patient.id, now)
+                    pending.append(Examination(patient=patient, **examination_fields(record)))
+                if len(pending) >= batch_size:
+                    record_exams(user.id, Examination.objects.bulk_create(pending))
+                    pending = []
+            if pending:
+                record_exams(user.id, Examination.objects.bulk_create(pending))
+        users.append(user)
+    return users
+
+
+def synthetic_form(rng, i):
+    """POST-данные формы нового обследования (как их отправляет new_patient.html)"""
+    edv = rng.uniform(80, 180)
+    form = {
+        "full_name": f"Пациент формы {i:07d}",
+        "age": str(rng.randint(18, 90)),
+        "height": f"{rng.uniform(150, 195):.1f}",
+        "weight": f"{rng.uniform(50, 120):.1f}",
+        "hr": str(rng.randint(50, 110)),
+        "diametr_aorta": f"{rng.uniform(25, 40):.1f}",
+        "aorta_enabled": "on",
+        "max_gradient": f"{rng.uniform(3, 80):.1f}",
+        "mjp": f"{rng.uniform(7, 14):.1f}",
+        "kdr": f"{rng.uniform(40, 65):.1f}",
+        "kcr": f"{rng.uniform(25, 50):.1f}",
+        "zclj": f"{rng.uniform(7, 13):.1f}",
+        "kdo": f"{edv:.1f}",
+        "kco": f"{edv * rng.uniform(0.3, 0.7):.1f}",
+        "tapse": f"{rng.uniform(14, 26):.1f}",
+    }
+    form.update({f"segment_{n}": str(rng.choice((0, 0, 0, 1, 2, 3))) for n in range(1, SEGMENT_COUNT + 1)})
+    return form
+
+
+def measure(func, repeat=20, warmup=1):
+    """Время вызовов func() в мс: медиана, p95, минимум (после warmup прогревочных вызовов)"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "repeat": repeat,
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        "min_ms": round(timings[0], 3),
+    }
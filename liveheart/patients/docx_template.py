@@ -0,0 +1,179 @@
+"""
+Протокол DOCX из готового бланка.
+
+Бланк (шапка больницы, стили, таблицы разделов) — обычный .docx с подстановками вида
+{{ aorta.diameter }}. Он разбирается один раз на процесс; для каждого отчёта копируется только
+word/document.xml, в копию вписываются значения, а остальные части архива (стили, тема, шрифты)
+берутся уже сжатыми.
+
+Правила бланка:
+    {{ имя }}          — значение (см. utils.docx_context); подстановка должна быть целиком в одном
+                         абзаце, иначе абзац собирается в один фрагмент текста;
+    {{ if раздел }}    — в начале заголовка раздела: если раздел выключен, заголовок и таблица
+                         сразу после него удаляются.
+
+Бланк по умолчанию собирается командой build_docx_template; свой бланк больницы задаётся
+настройкой REPORT_DOCX_TEMPLATE.
+"""
+import copy
+import hashlib
+import io
+import re
+import zipfile
+from functools import lru_cache
+
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.shared import Inches, Pt
+from lxml import etree
+
+DOCUMENT_PART = "word/document.xml"
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+PLACEHOLDER = re.compile(r"\{\{\s*([\w.]+)\s*\}\}")
+CONDITION = re.compile(r"\{\{\s*if\s+(\w+)\s*\}\}")
+
+# Разделы бланка по умолчанию: (раздел, заголовок, [(подпись, поле, единица)])
+TEMPLATE_SECTIONS = [
+    ("aorta", "АОРТА", [
+        ("Диаметр основания:", "aorta.diameter", "мм"),
+        ("Раскрытие аортального клапана:", "aorta.valve_opening", "мм"),
+    ]),
+    ("aorticvalve", "АОРТАЛЬНЫЙ КЛАПАН", [
+        ("Пиковая скорость (Vmax):", "aorticvalve.psk", "м/с"),
+        ("Макс. градиент давления:", "aorticvalve.grad_max", "мм рт.ст."),
+        ("Средний градиент:", "aorticvalve.grad_mean", "мм рт.ст."),
+        ("Площадь отверстия:", "aorticvalve.area", "см²"),
+        ("Регургитация:", "aorticvalve.regurgitation", "ст."),
+    ]),
+    ("leftventricle", "ЛЕВЫЙ ЖЕЛУДОЧЕК", [
+        ("КДР (Конечно-диаст. размер):", "leftventricle.edd", "мм"),
+        ("КСР (Конечно-сист. размер):", "leftventricle.esd", "мм"),
+        ("КДО (Конечно-диаст. объем):", "leftventricle.edv", "мл"),
+        ("КСО (Конечно-сист. объем):", "leftventricle.esv", "мл"),
+        ("МЖП (толщина в диастолу):", "leftventricle.ivsd", "мм"),
+        ("ЗСЛЖ (толщина в диастолу):", "leftventricle.pw", "мм"),
+        ("Фракция выброса (Simpson):", "ef", "%"),
+    ]),
+]
+
+
+def build_base_template(fileobj):
+    """Бланк по умолчанию: та же вёрстка, что раньше строилась на каждый отчёт"""
+    doc = Document()
+
+    style = doc.styles['Normal']
+    style.font.name = 'Times New Roman'
+    style.font.size = Pt(12)
+
+    header = doc.add_paragraph("ГБУЗ НО «Центральная городская больница г. Арзамас»")
+    header.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    header.runs[0].bold = True
+
+    title = doc.add_paragraph("ПРОТОКОЛ ЭХОКАРДИОГРАФИИ")
+    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    title.runs[0].bold = True
+    title.runs[0].font.size = Pt(14)
+
+    doc.add_paragraph()
+
+    def labelled(*pairs):
+        p = doc.add_paragraph()
+        for label, value in pairs:
+            p.add_run(label).bold = True
+            p.add_run(value)
+
+    labelled(("Ф.И.О.: ", "{{ full_name }}\t\t"), ("Дата: ", "{{ date }}"))
+    labelled(("Возраст: ", "{{ age }}\t"), ("Рост: ", "{{ height }}\t"), ("Вес: ", "{{ weight }}\t"))
+    labelled(("ППТ: ", "{{ bsa }}\t"), ("ЧСС: ", "{{ hr }}"))
+
+    doc.add_paragraph("_" * 70)
+
+    for name, heading, rows in TEMPLATE_SECTIONS:
+        h = doc.add_heading(level=3)
+        h.add_run(f"{{{{ if {name} }}}}")
+        h.add_run(heading)
+        table = doc.add_table(rows=len(rows), cols=2)
+        table.autofit = True
+        for row, (label, field, _) in zip(table.rows, rows):
+            row.cells[0].text = label
+            row.cells[0].width = Inches(3.0)
+            row.cells[1].text = f"{{{{ {field} }}}}"
+
+    doc.add_heading("ЛОКАЛЬНАЯ СОКРАТИМОСТЬ", level=3)
+    p = doc.add_paragraph()
+    p.add_run("{{ segments_title }}").bold = True
+    p.add_run("{{ segments }}")
+
+    doc.save(fileobj)
+
+
+class DocxTemplate:
+    """Разобранный бланк: дерево document.xml и архив с остальными частями, сжатый один раз"""
+
+    def __init__(self, data):
+        self.digest = hashlib.sha256(data).hexdigest()[:12]
+        source = zipfile.ZipFile(io.BytesIO(data))
+        self.document = etree.fromstring(source.read(DOCUMENT_PART))
+
+        static = io.BytesIO()
+        with zipfile.ZipFile(static, "w", zipfile.ZIP_DEFLATED) as target:
+            for info in source.infolist():
+                if info.filename != DOCUMENT_PART:
+                    target.writestr(info, source.read(info), zipfile.ZIP_DEFLATED)
+        self.static_parts = static.getvalue()
+
+    def render(self, context, enabled=()):
+        """Байты .docx: копия бланка с подставленными значениями"""
+        root = copy.deepcopy(self.document)
+        for paragraph in list(root.iter(f"{W}p")):
+            texts = list(paragraph.iter(f"{W}t"))
+            if not any("{{" in (t.text or "") for t in texts):
+                continue
+
+            condition = CONDITION.search("".join(t.text or "" for t in texts))
+            if condition and condition.group(1) not in enabled:
+                _remove_block(paragraph)
+                continue
+
+            for t in texts:
+                t.text = _fill(t.text or "", context)
+            if any(_broken(t.text) for t in texts):
+                # Подстановка разорвана между фрагментами текста (бланк правили в Word)
+                merged = "".join(t.text for t in texts)
+                texts[0].text = _fill(merged, context)
+                for t in texts[1:]:
+                    t.text = ""
+
+        out = io.BytesIO(self.static_parts)
+        with zipfile.ZipFile(out, "a", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(DOCUMENT_PART, etree.tostring(root, xml_declaration=True, encoding="UTF-8",
+                                                           standalone=True))
+        return out.getvalue()
+
+
+def _fill(text, context):
+    text = CONDITION.sub("", text)
+    # Неизвестные подстановки остаются в тексте как есть, чтобы ошибку в бланке было видно
+    return PLACEHOLDER.sub(lambda m: str(context.get(m.group(1), m.group(0))), text)
+
+
+def _broken(text):
+    rest = PLACEHOLDER.sub("", text)
+    return "{{" in rest or "}}" in rest
+
+
+def _remove_block(paragraph):
+    """Удаляет заголовок раздела и таблицу, которая идёт сразу за ним"""
+    following = paragraph.getnext()
+    if following is not None and following.tag == f"{W}tbl":
+        following.getparent().remove(following)
+    paragraph.getparent().remove(paragraph)
+
+
+@lru_cache(maxsize=4)
+def load_template(path):
+    """Бланк разбирается один раз на процесс (для каждого пути)"""
+    with open(path, "rb") as f:
+        return DocxTemplate(f.read())
@@ -0,0 +1,132 @@
+"""
+Расчётные показатели эхокардиографии.
+
+Те же формулы, что и в new_patient.js, но на сервере: скалярный API для одного обследования
+и векторизованный (NumPy) для пересчёта целых когорт.
+
+    ИМТ  = вес / (рост, м)²
+    ППТ  = √(рост · вес / 3600)          (Mosteller)
+    ФУ   = (КДР − КСР) / КДР · 100
+    УО   = КДО − КСО
+    ФВ   = УО / КДО · 100
+    СВ   = УО · ЧСС / 1000               (л/мин)
+    СИ   = СВ / ППТ
+    ИНЛС = Σ баллов сегментов / 17       (норма 1, гипокинез 2, акинез 3, дискинез 4)
+"""
+import math
+
+import numpy as np
+
+from .models import SEGMENT_BITS, SEGMENT_COUNT, unpack_segments
+
+# Показатели, которые хранятся в Examination
+INDEX_FIELDS = ("bmi", "bsa", "fs", "sv", "ef", "co", "ci", "wmsi")
+
+# Колонки Examination, из которых считаются показатели
+SOURCE_FIELDS = (
+    "height", "weight", "hr",
+    "leftventricle_edd", "leftventricle_esd", "leftventricle_edv", "leftventricle_esv", "leftventricle_hr",
+    "segment_states",
+)
+
+
+def _ok(*values):
+    return all(v is not None and v > 0 for v in values)
+
+
+def _round(value, digits):
+    # np.round, как в compute_indices_batch: встроенный round() на границе (1.575 -> 1.57)
+    # округляет иначе, и recompute_indices переписывал бы такие строки без причины
+    return None if value is None else float(np.round(value, digits))
+
+
+def ejection_fraction(edv, esv):
+    """ФВ по Симпсону, %"""
+    if not _ok(edv) or esv is None:
+        return None
+    return (edv - esv) / edv * 100
+
+
+def wall_motion_score_index(segment_states):
+    return sum(state + 1 for state in unpack_segments(segment_states or 0)) / SEGMENT_COUNT
+
+
+def compute_indices(height=None, weight=None, hr=None, leftventricle_edd=None, leftventricle_esd=None,
+                    leftventricle_edv=None, leftventricle_esv=None, leftventricle_hr=None, segment_states=0):
+    """Показатели одного обследования; отсутствующие исходные данные дают None"""
+    edd, esd, edv, esv = leftventricle_edd, leftventricle_esd, leftventricle_edv, leftventricle_esv
+    hr = hr or leftventricle_hr
+
+    bmi = weight / (height / 100) ** 2 if _ok(height, weight) else None
+    bsa = math.sqrt(height * weight / 3600) if _ok(height, weight) else None
+    fs = (edd - esd) / edd * 100 if _ok(edd) and esd is not None else None
+    sv = edv - esv if edv is not None and esv is not None else None
+    co = sv * hr / 1000 if sv is not None and _ok(hr) else None
+    ci = co / bsa if co is not None and bsa else None
+
+    return {
+        "bmi": _round(bmi, 1),
+        "bsa": _round(bsa, 2),
+        "fs": _round(fs, 1),
+        "sv": _round(sv, 1),
+        "ef": _round(ejection_fraction(edv, esv), 1),
+        "co": _round(co, 2),
+        "ci": _round(ci, 2),
+        "wmsi": _round(wall_motion_score_index(segment_states), 2),
+    }
+
+
+def compute_indices_batch(columns):
+    """
+    Векторизованный расчёт для когорты.
+
+    columns — словарь {поле из SOURCE_FIELDS: np.ndarray}, пропуски — NaN (segment_states — int64).
+    Возвращает {поле из INDEX_FIELDS: np.ndarray float64}, где NaN означает «не рассчитывается».
+    """
+    height, weight = columns["height"], columns["weight"]
+    edd, esd = columns["leftventricle_edd"], columns["leftventricle_esd"]
+    edv, esv = columns["leftventricle_edv"], columns["leftventricle_esv"]
+    hr = np.where(np.isnan(columns["hr"]) | (columns["hr"] == 0), columns["leftventricle_hr"], columns["hr"])
+
+    def positive(a):
+        return np.where(a > 0, a, np.nan)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        height_m = positive(height) / 100
+        bmi = positive(weight) / height_m ** 2
+        bsa = np.sqrt(positive(height) * positive(weight) / 3600)
+        fs = (edd - esd) / positive(edd) * 100
+        sv = edv - esv
+        ef = sv / positive(edv) * 100
+        co = sv * positive(hr) / 1000
+        ci = co / bsa
+
+    # 17 сегментов по 2 бита: сдвигаем весь столбец сразу для каждого сегмента
+    packed = columns["segment_states"].astype(np.int64)
+    shifts = np.arange(SEGMENT_COUNT, dtype=np.int64) * SEGMENT_BITS
+    scores = ((packed[:, None] >> shifts) & 0b11) + 1
+    wmsi = scores.sum(axis=1) / SEGMENT_COUNT
+
+    return {
+        "bmi": np.round(bmi, 1),
+        "bsa": np.round(bsa, 2),
+        "fs": np.round(fs, 1),
+        "sv": np.round(sv, 1),
+        "ef": np.round(ef, 1),
+        "co": np.round(co, 2),
+        "ci": np.round(ci, 2),
+        "wmsi": np.round(wmsi, 2),
+    }
+
+
+def rows_to_columns(rows, fields=SOURCE_FIELDS):
+    """Кортежи из values_list -> столбцы NumPy (None -> NaN)"""
+    if not rows:
+        return {name: np.empty(0) for name in fields}
+    table = np.array(rows, dtype=object)
+    table[table == None] = np.nan  # noqa: E711 — поэлементное сравнение NumPy
+    columns = {}
+    for i, name in enumerate(fields):
+        dtype = np.int64 if name == "segment_states" else np.float64
+        columns[name] = table[:, i].astype(dtype)
+    return columns
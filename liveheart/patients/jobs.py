@@ -0,0 +1,103 @@
+import logging
+import os
+import socket
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+from liveheart.metrics import EXPORTS_RUNNING
+
+from .models import ExportJob
+from .report_cache import get_or_render
+from .snapshot import load_snapshot
+from .utils import export_filename
+
+logger = logging.getLogger(__name__)
+
+
+def export_path(job):
+    return Path(settings.EXPORT_ROOT) / f"{job.id}.{job.format}"
+
+
+def enqueue_export(user, exam, fmt):
+    """
+    Ставит отчёт в очередь. Сборка начинается только после коммита транзакции,
+    чтобы тяжёлый рендер не держал блокировку записи SQLite.
+    """
+    job = ExportJob.objects.create(user=user, examination=exam, format=fmt)
+    if settings.EXPORT_JOBS_EAGER:
+        # Без отдельного воркера (разработка, тесты) собираем сразу после коммита
+        transaction.on_commit(lambda: run_job(job.id))
+    return job
+
+
+def current_worker():
+    """Имя воркера для поля ExportJob.worker"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_jobs(limit, worker=None):
+    """Забирает из очереди до limit заданий; UPDATE по статусу защищает от двойного захвата"""
+    worker = worker or current_worker()
+    claimed = []
+    pending = ExportJob.objects.filter(status=ExportJob.PENDING).order_by("id").values_list("id", flat=True)
+    for job_id in pending[:limit]:
+        if ExportJob.objects.filter(id=job_id, status=ExportJob.PENDING).update(
+            status=ExportJob.RUNNING, worker=worker, heartbeat_at=timezone.now(),
+        ):
+            claimed.append(job_id)
+    return claimed
+
+
+def heartbeat(job_ids, worker=None):
+    """Отмечает, что воркер жив и ещё собирает эти задания"""
+    if not job_ids:
+        return 0
+    return ExportJob.objects.filter(
+        id__in=job_ids, status=ExportJob.RUNNING, worker=worker or current_worker(),
+    ).update(heartbeat_at=timezone.now())
+
+
+def requeue_stale_jobs(stale_after=None):
+    """
+    Возвращает в очередь задания упавших воркеров: те, что собираются, но без отметки
+    heartbeat дольше stale_after секунд. Задания живых соседних воркеров не трогаются.
+    """
+    stale_after = settings.EXPORT_JOB_STALE_AFTER if stale_after is None else stale_after
+    deadline = timezone.now() - timedelta(seconds=stale_after)
+    return (
+        ExportJob.objects.filter(status=ExportJob.RUNNING)
+        .filter(models.Q(heartbeat_at__lt=deadline) | models.Q(heartbeat_at__isnull=True))
+        .update(status=ExportJob.PENDING, worker="", heartbeat_at=None)
+    )
+
+
+def run_job(job_id):
+    """Собирает отчёт задания и сохраняет его на диск. Выполняется в процессе воркера."""
+    job = ExportJob.objects.get(id=job_id)
+    EXPORTS_RUNNING.inc()
+    try:
+        exam = load_snapshot(job.examination_id)
+        content = get_or_render(exam, job.format)
+
+        path = export_path(job)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, path)
+
+        job.status = ExportJob.DONE
+        job.file_name = export_filename(exam, job.format)
+    except Exception as e:
+        logger.exception("Export job %s failed", job_id)
+        job.status = ExportJob.FAILED
+        job.error = str(e)
+    finally:
+        EXPORTS_RUNNING.dec()
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "file_name", "error", "finished_at"])
+    return job.status
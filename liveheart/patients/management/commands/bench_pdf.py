@@ -0,0 +1,63 @@
+import gc
+import logging
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from patients.bench import peak_rss_mb, synthetic_record
+from patients.models import Examination, Patient
+from patients.services import examination_fields
+from patients.snapshot import ExamSnapshot
+from patients.utils import PDF_BACKENDS
+
+
+def synthetic_snapshots(count, seed=0):
+    """Снимки обследований без записи в базу"""
+    rng = random.Random(seed)
+    snapshots = []
+    for i in range(count):
+        record = synthetic_record(rng, i)
+        exam = Examination(patient=Patient(id=i + 1, user_id=1, full_name=record["full_name"]),
+                           **examination_fields(record))
+        snapshots.append(ExamSnapshot.from_exam(exam))
+    return snapshots
+
+
+class Command(BaseCommand):
+    help = "Сравнивает способы сборки PDF: мс на отчёт, размер файла и выделение памяти"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=50, help="Число отчётов на каждый способ")
+        parser.add_argument("--backends", nargs="+", default=list(PDF_BACKENDS), choices=list(PDF_BACKENDS))
+
+    def handle(self, *args, count, backends, **options):
+        # Предупреждения xhtml2pdf о глифах печатаются на каждый отчёт и искажают замер
+        logging.getLogger("xhtml2pdf").setLevel(logging.ERROR)
+        snapshots = synthetic_snapshots(count)
+
+        for name in backends:
+            render = PDF_BACKENDS[name]
+            # Первый отчёт отдельно: регистрация шрифтов, загрузка шаблонов
+            started = time.perf_counter()
+            render(snapshots[0])
+            first_ms = (time.perf_counter() - started) * 1000
+
+            gc.collect()
+            started = time.perf_counter()
+            size = sum(len(render(exam)) for exam in snapshots)
+            elapsed = time.perf_counter() - started
+
+            # Память отдельным прогоном: tracemalloc сам замедляет сборку
+            tracemalloc.start()
+            for exam in snapshots[:10]:
+                render(exam)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            self.stdout.write(
+                f"{name:10} {elapsed / count * 1000:7.1f} мс/отчёт (первый {first_ms:.0f} мс), "
+                f"{size / count / 1024:.1f} КБ/отчёт, пик выделений {peak / 1024 / 1024:.1f} МБ, "
+                f"пиковый RSS процесса {peak_rss_mb():.0f} МБ"
+            )
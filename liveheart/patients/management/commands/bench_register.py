@@ -0,0 +1,38 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from patients.bench import peak_rss_mb, seed_exams, temporary_database
+from patients.register import stream_register
+
+
+class Command(BaseCommand):
+    help = "Замеряет выгрузку реестра XLSX на синтетических данных: строк/сек и пиковый RSS"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+
+    def handle(self, *args, sizes, **options):
+        for size in sizes:
+            # Данные создаются во временной базе, рабочая не блокируется и не меняется
+            with temporary_database():
+                doctor = User.objects.create_user(f"bench-register-{size}")
+                seed_exams(doctor, size)
+
+                rss_before = peak_rss_mb()
+                started = time.perf_counter()
+                first_byte = None
+                total_bytes = 0
+                for block in stream_register(doctor):
+                    if first_byte is None and block:
+                        first_byte = time.perf_counter() - started
+                    total_bytes += len(block)
+                elapsed = time.perf_counter() - started
+
+                self.stdout.write(
+                    f"{size} обследований: {elapsed:.2f} с (первый байт через {first_byte * 1000:.0f} мс), "
+                    f"{size / elapsed:,.0f} строк/с, "
+                    f"{total_bytes / 1024 / 1024:.1f} МБ XLSX, "
+                    f"пиковый RSS {peak_rss_mb():.0f} МБ (до выгрузки {rss_before:.0f} МБ)"
+                )
@@ -0,0 +1,88 @@
+import random
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.db.models import OuterRef, Subquery
+
+from liveheart.db_router import read_only
+from patients.bench import seed_exams, synthetic_record, temporary_database
+from patients.models import Examination, Patient
+from patients.services import save_examinations
+from patients.timeline import patient_timeline
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест SQLite: N потоков сохраняют протоколы, M потоков читают историю и карты "
+        "пациентов. Считает операции в секунду и ошибки блокировки. Работает на временной копии "
+        "схемы, рабочая база не затрагивается"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--seconds", type=float, default=10)
+        parser.add_argument("--seed", type=int, default=500, help="Сколько обследований создать заранее")
+        parser.add_argument("--profiles", nargs="+", choices=["plain", "tuned"], default=["plain", "tuned"],
+                            help="plain — SQLite без настроек, tuned — OPTIONS из settings")
+
+    def handle(self, *args, writers, readers, seconds, seed, profiles, **options):
+        for profile in profiles:
+            with temporary_database(plain=profile == "plain"):
+                doctor = User.objects.create_user("bench-concurrency")
+                seed_exams(doctor, seed)
+                patient_ids = list(Patient.objects.filter(user=doctor).values_list("id", flat=True))
+                connections.close_all()
+
+                result = self.run(doctor, patient_ids, writers, readers, seconds)
+            self.stdout.write(
+                f"{profile:5}: запись {result['write'] / seconds:,.0f} протоколов/с, "
+                f"чтение {result['read'] / seconds:,.0f} запросов/с, "
+                f"ошибок блокировки {result['locked']} (других ошибок {result['error']})"
+            )
+
+    def run(self, doctor, patient_ids, writers, readers, seconds):
+        counts = {"write": 0, "read": 0, "locked": 0, "error": 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+
+        def count(key):
+            with lock:
+                counts[key] += 1
+
+        def work(operation, seed):
+            rng = random.Random(seed)
+            try:
+                while time.monotonic() < deadline:
+                    try:
+                        operation(rng)
+                    except OperationalError as exc:
+                        count("locked" if "locked" in str(exc) else "error")
+            finally:
+                connections.close_all()
+
+        def write(rng):
+            save_examinations(doctor, [synthetic_record(rng, rng.randrange(10 ** 6))])
+            count("write")
+
+        def read(rng):
+            with read_only():
+                last_exam = (
+                    Examination.objects.filter(patient=OuterRef("pk")).order_by("-exam_datetime")
+                    .values("exam_datetime")[:1]
+                )
+                list(Patient.objects.filter(user=doctor).annotate(last=Subquery(last_exam))
+                     .order_by("full_name", "id")[:50])
+                patient_timeline(Patient.objects.get(id=rng.choice(patient_ids)))
+            count("read")
+
+        threads = [threading.Thread(target=work, args=(write, i)) for i in range(writers)]
+        threads += [threading.Thread(target=work, args=(read, writers + i)) for i in range(readers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return counts
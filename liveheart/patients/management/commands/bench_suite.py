@@ -0,0 +1,136 @@
+import json
+import platform
+import random
+import subprocess
+import sys
+from pathlib import Path
+
+import django
+import pyotp
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import TOTPDevice
+from patients.bench import measure, seed_doctors, synthetic_form, temporary_database
+from patients.models import Examination
+from patients.snapshot import load_snapshot
+from patients.utils import generate_docx, generate_pdf, generate_xlsx
+
+EXPORTERS = {"generate_docx": generate_docx, "generate_xlsx": generate_xlsx, "generate_pdf": generate_pdf}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Набор замеров на синтетических данных разного размера: форма нового обследования, история, поиск, "
+        "карта пациента, экспортёры и вход по TOTP. Результат — JSON для сравнения прогонов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000], help="Пациентов у врача")
+        parser.add_argument("--exams", type=int, default=3, help="Обследований у каждого пациента")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--output", help="Куда записать JSON (по умолчанию — только таблица в консоль)")
+        parser.add_argument("--compare", help="JSON прошлого прогона: показать изменение медиан")
+
+    def handle(self, *args, sizes, exams, repeat, output, compare, **options):
+        setup_test_environment()
+        results = []
+        # Лимиты входа не должны срабатывать, письма и отчёты не уходят в очередь
+        overrides = {
+            "LOGIN_THROTTLE_RATES": {"ip": (10 ** 6, 10 ** 6), "account": (10 ** 6, 10 ** 6)},
+            "CACHES": {
+                alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": f"bench-{alias}"}
+                for alias in settings.CACHES
+            },
+            "EMAIL_OUTBOX_EAGER": False,
+            "EXPORT_JOBS_EAGER": False,
+        }
+        with override_settings(**overrides):
+            for size in sizes:
+                # Данные создаются во временной базе: рабочая не блокируется, а запись
+                # в замерах коммитится, как в настоящих запросах
+                with temporary_database():
+                    results += self.run_size(size, exams, repeat)
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "params": {"sizes": sizes, "exams": exams, "repeat": repeat},
+            "results": results,
+        }
+        previous = self.load_previous(compare)
+        for row in results:
+            line = (f"{row['name']:16} {row['patients']:>7} пац. {row['median_ms']:9.2f} мс "
+                    f"(p95 {row['p95_ms']:.2f}), запросов {row['queries']}")
+            before = previous.get((row["name"], row["patients"]))
+            if before:
+                line += f", было {before['median_ms']:.2f} мс ({row['median_ms'] / before['median_ms'] - 1:+.0%})"
+            self.stdout.write(line)
+
+        if output:
+            Path(output).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+            self.stdout.write(f"Результаты записаны в {output}")
+
+    def load_previous(self, path):
+        if not path:
+            return {}
+        rows = json.loads(Path(path).read_text())["results"]
+        return {(row["name"], row["patients"]): row for row in rows}
+
+    def run_size(self, size, exams, repeat):
+        self.stderr.write(f"Данные: 1 врач × {size} пациентов × {exams} обследований")
+        doctor, = seed_doctors(1, size, exams, prefix=f"bench-suite-{size}")
+        TOTPDevice.objects.create(user=doctor, secret=pyotp.random_base32(), confirmed=True)
+        exam = Examination.objects.filter(patient__user=doctor).latest("id")
+
+        client = Client()
+        client.force_login(doctor)
+        rng = random.Random(size)
+        counter = iter(range(10 ** 9))
+
+        cases = {
+            "new_patient:get": lambda: client.get(reverse("patients:new_patient")),
+            "new_patient:post": lambda: client.post(
+                reverse("patients:new_patient"), synthetic_form(rng, next(counter)),
+            ),
+            "history": lambda: client.get(reverse("patients:history")),
+            "search": lambda: client.get(reverse("patients:patient_search"), {"q": "пациент 00"}),
+            "patient_card": lambda: client.get(reverse("patients:patient_card", args=[exam.patient_id])),
+        }
+        for name, exporter in EXPORTERS.items():
+            cases[name] = lambda exporter=exporter: exporter(load_snapshot(exam.id))
+        cases["login_totp"] = lambda: self.login_totp(doctor)
+
+        results = []
+        for name, func in cases.items():
+            # Вход — это PBKDF2 на каждый вызов, хватает нескольких повторов
+            stats = measure(func, repeat=min(repeat, 5) if name == "login_totp" else repeat)
+            with CaptureQueriesContext(connection) as ctx:
+                func()
+            results.append({"name": name, "patients": size, "exams": exams, **stats,
+                            "queries": len(ctx.captured_queries)})
+        return results
+
+    def login_totp(self, doctor):
+        client = Client()
+        client.post(reverse("accounts:login"), {"email": doctor.email, "password": "bench"})
+        response = client.post(reverse("accounts:verify_totp"), {"code": pyotp.TOTP(doctor.totp_device.secret).now()})
+        assert response.status_code == 302, response.status_code
+        return response
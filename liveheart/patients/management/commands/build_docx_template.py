@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from patients.docx_template import build_base_template
+
+
+class Command(BaseCommand):
+    help = "Собирает бланк протокола DOCX по умолчанию (шапка, стили, таблицы разделов с подстановками)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=str(settings.REPORT_DOCX_TEMPLATE))
+
+    def handle(self, *args, output, **options):
+        with open(output, "wb") as f:
+            build_base_template(f)
+        self.stdout.write(f"Бланк записан в {output}. Его можно править в Word, сохраняя подстановки {{{{ ... }}}}.")
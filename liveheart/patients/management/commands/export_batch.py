@@ -0,0 +1,54 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from patients.batch import iter_zip, select_exam_ids
+from patients.utils import EXPORT_FORMATS
+from patients.worker_pool import make_pool
+
+
+class Command(BaseCommand):
+    help = "Собирает протоколы нескольких обследований параллельно и пишет их в один ZIP"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", required=True, help="Логин врача")
+        parser.add_argument("--ids", type=int, nargs="+", help="id обследований")
+        parser.add_argument("--patient", type=int, help="Все обследования пациента")
+        parser.add_argument("--date", help="Все обследования за день (ГГГГ-ММ-ДД)")
+        parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="pdf")
+        parser.add_argument("--workers", type=int, default=None, help="Число процессов (0 — без пула)")
+        parser.add_argument("--out", required=True, help="Путь к ZIP-файлу")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['user']} не найден")
+
+        day = None
+        if options["date"]:
+            day = parse_date(options["date"])
+            if day is None:
+                raise CommandError("Дата должна быть в формате ГГГГ-ММ-ДД")
+
+        exam_ids = select_exam_ids(user, options["ids"], options["patient"], day)
+        if not exam_ids:
+            raise CommandError("Обследования не найдены")
+
+        # Пул на один запуск команды (None — по числу ядер); запуск процессов входит в замер
+        started = time.perf_counter()
+        pool = make_pool(options["workers"]) if options["workers"] != 0 else None
+        try:
+            with open(options["out"], "wb") as f:
+                for block in iter_zip(exam_ids, options["format"], pool):
+                    f.write(block)
+        finally:
+            if pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"Протоколов: {len(exam_ids)}, {elapsed:.2f} с ({len(exam_ids) / elapsed:.1f} отчётов/с) -> {options['out']}"
+        )
@@ -0,0 +1,36 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.bench import seed_doctors
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу синтетическими данными: N врачей × M пациентов × K обследований "
+        "со всеми разделами и сегментами (для разработки и замеров, не для рабочей базы)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--doctors", type=int, default=3)
+        parser.add_argument("--patients", type=int, default=100, help="Пациентов у каждого врача")
+        parser.add_argument("--exams", type=int, default=3, help="Обследований у каждого пациента")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--prefix", default="doctor", help="Логины врачей: <prefix>-001, <prefix>-002 ...")
+        parser.add_argument("--password", default="bench")
+
+    def handle(self, *args, doctors, patients, exams, seed, prefix, password, **options):
+        if User.objects.filter(username__startswith=f"{prefix}-").exists():
+            raise CommandError(f"Врачи с логином {prefix}-... уже есть, выберите другой --prefix")
+
+        started = time.perf_counter()
+        users = seed_doctors(doctors, patients, exams, seed=seed, prefix=prefix, password=password)
+        elapsed = time.perf_counter() - started
+
+        total = doctors * patients * exams
+        self.stdout.write(
+            f"Создано врачей {len(users)}, пациентов {doctors * patients}, обследований {total} "
+            f"за {elapsed:.1f} с ({total / elapsed:,.0f} обследований/с). "
+            f"Вход: {users[0].email if users else '-'} / {password}"
+        )
@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from patients.stats import rebuild
+
+
+class Command(BaseCommand):
+    help = "Пересобирает дневные сводки врачей (DailyStats) по всем обследованиям"
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Сводок (врач × день): {rows}, {time.perf_counter() - started:.1f} с"
+        ))
@@ -0,0 +1,89 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from patients import stats
+from patients.indices import INDEX_FIELDS, SOURCE_FIELDS, compute_indices_batch, rows_to_columns
+from patients.models import Examination
+
+# Числовые колонки для расчёта и сравнения, затем всё, что нужно для вклада в DailyStats
+COLUMNS = ("id",) + SOURCE_FIELDS + INDEX_FIELDS
+STATS_COLUMNS = ("patient__user_id",) + tuple(f for f in stats.SOURCE_FIELDS if f not in COLUMNS)
+
+
+def _nullable(column):
+    """NaN -> None для записи в БД"""
+    values = column.astype(object)
+    values[np.isnan(column)] = None
+    return values
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает ИМТ, ППТ, ФВ, ФУ, УО, СВ, СИ и ИНЛС для всех обследований порциями через NumPy. "
+        "Дневные сводки (DailyStats) поправляются там, где изменилась ФВ"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk", type=int, default=50_000, help="Обследований в одной порции")
+
+    @staticmethod
+    def ef_changes(rows, ef, positions):
+        """(user_id, вклад до, вклад после) для stats.rerecord_exams по строкам с новой ФВ"""
+        names = COLUMNS + STATS_COLUMNS
+        for i in positions:
+            record = dict(zip(names, rows[i]))
+            before = tuple(record[f] for f in stats.SOURCE_FIELDS)
+            record["ef"] = None if np.isnan(ef[i]) else float(ef[i])
+            yield record["patient__user_id"], before, tuple(record[f] for f in stats.SOURCE_FIELDS)
+
+    def handle(self, *args, chunk, **options):
+        table = connection.ops.quote_name(Examination._meta.db_table)
+        assignments = ", ".join(f"{connection.ops.quote_name(f)} = %s" for f in INDEX_FIELDS)
+        # Показатели есть в протоколах: новая версия меняет ETag скачанных отчётов
+        assignments += ", version = version + 1"
+        sql = f"UPDATE {table} SET {assignments} WHERE id = %s"
+
+        started = time.perf_counter()
+        total = updated = 0
+        last_id = 0
+        while True:
+            rows = list(
+                Examination.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list(*COLUMNS, *STATS_COLUMNS)[:chunk]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            columns = rows_to_columns(rows, COLUMNS)
+            indices = compute_indices_batch(columns)
+            # Пишем только строки, где показатели изменились: у остальных версия и ETag
+            # отчётов остаются прежними
+            differs = {
+                f: ~np.isclose(indices[f], columns[f], rtol=0, atol=1e-9, equal_nan=True) for f in INDEX_FIELDS
+            }
+            changed = np.logical_or.reduce(list(differs.values()))
+            params = zip(
+                *(_nullable(indices[f][changed]) for f in INDEX_FIELDS),
+                columns["id"][changed].astype(np.int64).tolist(),
+            )
+
+            if changed.any():
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        cursor.executemany(sql, list(params))
+                    # Из показателей в сводки входит только ФВ
+                    stats.rerecord_exams(self.ef_changes(rows, indices["ef"], np.flatnonzero(differs["ef"])))
+            total += len(rows)
+            updated += int(changed.sum())
+            self.stdout.write(f"  {total} обследований, изменено {updated}...")
+
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Пересчитано {total} обследований за {elapsed:.1f} с ({rate:,.0f} в секунду), изменено {updated}"
+        ))
@@ -0,0 +1,17 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from patients.report_cache import cache_stats, evict
+
+
+class Command(BaseCommand):
+    help = "Показывает статистику кэша отчётов (попадания, промахи, размер) и при необходимости чистит его"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--evict", action="store_true", help="Вытеснить старые отчёты сверх лимита")
+
+    def handle(self, *args, **options):
+        if options["evict"]:
+            self.stdout.write(f"Удалено отчётов: {evict()}")
+        self.stdout.write(json.dumps(cache_stats(), indent=2))
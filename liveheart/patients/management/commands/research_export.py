@@ -0,0 +1,43 @@
+import sys
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.bench import peak_rss_mb
+from patients.research import CHUNK_SIZE, RESEARCH_FORMATS, pseudonym_key, write_research
+
+
+class Command(BaseCommand):
+    help = (
+        "Обезличенная выгрузка измерений всех обследований для исследований (CSV, NDJSON или NPZ). "
+        "Ф.И.О. и id заменены псевдонимами с ключом RESEARCH_PSEUDONYM_KEY"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(RESEARCH_FORMATS), default="csv")
+        parser.add_argument("--output", help="Файл (по умолчанию CSV и NDJSON — в stdout)")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, format, output, chunk_size, **options):
+        # До открытия файла: без ключа не остаётся пустой выгрузки
+        try:
+            pseudonym_key()
+        except ImproperlyConfigured as exc:
+            raise CommandError(str(exc))
+        if output is None and format == "npz":
+            output = "research.npz"
+
+        started = time.perf_counter()
+        if output:
+            with open(output, "wb") as f:
+                count = write_research(format, f, chunk_size)
+        else:
+            count = write_research(format, sys.stdout.buffer, chunk_size)
+        elapsed = time.perf_counter() - started
+
+        # Сводка в stderr, чтобы не смешиваться с данными в stdout
+        self.stderr.write(
+            f"{count} обследований за {elapsed:.1f} с ({count / elapsed:,.0f} строк/с), "
+            f"пиковый RSS {peak_rss_mb():.0f} МБ" + (f", файл {output}" if output else "")
+        )
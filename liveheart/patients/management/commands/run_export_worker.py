@@ -0,0 +1,46 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from patients.jobs import claim_jobs, current_worker, heartbeat, requeue_stale_jobs
+from patients.worker_pool import make_pool, run_export_job
+
+
+class Command(BaseCommand):
+    help = "Запускает пул процессов, который собирает отчёты из очереди ExportJob"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--poll", type=float, default=0.5, help="Пауза между опросами очереди, сек.")
+
+    def handle(self, *args, workers, poll, **options):
+        worker = current_worker()
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Возвращено в очередь зависших заданий: {requeued}")
+
+        self.stdout.write(f"Воркер отчётов {worker} запущен, процессов: {workers}")
+        in_flight = {}  # future -> id задания
+        last_heartbeat = time.monotonic()
+        with make_pool(workers) as pool:
+            try:
+                while True:
+                    in_flight = {f: job_id for f, job_id in in_flight.items() if not f.done()}
+                    if time.monotonic() - last_heartbeat >= settings.EXPORT_JOB_HEARTBEAT:
+                        # Свои задания продлеваем, брошенные упавшими воркерами забираем обратно в очередь
+                        heartbeat(list(in_flight.values()), worker)
+                        requeue_stale_jobs()
+                        last_heartbeat = time.monotonic()
+                    # Держим в пуле не больше двух заданий на процесс
+                    free = workers * 2 - len(in_flight)
+                    job_ids = claim_jobs(free, worker) if free > 0 else []
+                    for job_id in job_ids:
+                        in_flight[pool.submit(run_export_job, job_id)] = job_id
+                    close_old_connections()
+                    if not job_ids:
+                        time.sleep(poll)
+            except KeyboardInterrupt:
+                self.stdout.write("Остановка воркера, дожидаемся текущих заданий...")
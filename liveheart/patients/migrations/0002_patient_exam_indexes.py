@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['user', 'full_name', 'id'], name='patient_user_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='examination',
+            index=models.Index(fields=['patient', 'exam_datetime'], name='exam_patient_datetime_idx'),
+        ),
+    ]
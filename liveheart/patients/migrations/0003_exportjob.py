@@ -0,0 +1,31 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0002_patient_exam_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(choices=[('docx', 'Word'), ('xlsx', 'Excel'), ('pdf', 'PDF')], max_length=8)),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Собирается'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=16)),
+                ('file_name', models.CharField(blank=True, max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('examination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to='patients.examination')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='exportjob_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,352 @@
+from django.db import migrations, models
+
+
+SECTIONS = {
+    "aorta": ("Aorta", ("diameter", "valve_opening")),
+    "aorticvalve": ("AorticValve", ("psk", "grad_max", "grad_mean", "regurgitation", "area")),
+    "leftventricle": ("LeftVentricle", ("ivsd", "edd", "esd", "pw", "edv", "esv", "hr")),
+    "otherchambers": ("OtherChambers", ("la", "ra", "rv", "lav")),
+    "mitralvalve": ("MitralValve", ("e", "a", "grad_max", "dte", "ivrt", "reg")),
+    "tricuspidvalve": ("TricuspidValve", ("e", "a", "grad_max", "tapse", "reg")),
+    "pulmonaryartery": ("PulmonaryArtery", ("diameter", "grad_max", "velocity", "at", "et", "reg", "ivc")),
+}
+CHUNK_SIZE = 2000
+
+
+def _exam_chunks(Examination):
+    ids = list(Examination.objects.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def sections_to_columns(apps, schema_editor):
+    """Переносит строки разделов и сегменты в колонки обследования"""
+    Examination = apps.get_model("patients", "Examination")
+    MyocardialSegment = apps.get_model("patients", "MyocardialSegment")
+    columns = [f"{name}_{attr}" for name, (_, attrs) in SECTIONS.items() for attr in attrs + ("is_enabled",)]
+
+    for chunk in _exam_chunks(Examination):
+        exams = Examination.objects.in_bulk(chunk)
+
+        for name, (model_name, attrs) in SECTIONS.items():
+            model = apps.get_model("patients", model_name)
+            for row in model.objects.filter(examination_id__in=chunk).values("examination_id", *attrs, "is_enabled"):
+                exam = exams[row.pop("examination_id")]
+                for attr, value in row.items():
+                    setattr(exam, f"{name}_{attr}", value)
+
+        rows = MyocardialSegment.objects.filter(examination_id__in=chunk).values_list(
+            "examination_id", "segment_number", "state",
+        )
+        for exam_id, number, state in rows:
+            if 1 <= number <= 17:
+                exams[exam_id].segment_states |= (state & 0b11) << (2 * (number - 1))
+
+        Examination.objects.bulk_update(exams.values(), columns + ["segment_states"])
+
+
+def columns_to_sections(apps, schema_editor):
+    """Обратный перенос: колонки обследования -> строки разделов и сегментов"""
+    Examination = apps.get_model("patients", "Examination")
+    MyocardialSegment = apps.get_model("patients", "MyocardialSegment")
+
+    for chunk in _exam_chunks(Examination):
+        exams = list(Examination.objects.filter(id__in=chunk))
+
+        for name, (model_name, attrs) in SECTIONS.items():
+            model = apps.get_model("patients", model_name)
+            model.objects.bulk_create([
+                model(examination_id=exam.id, **{
+                    attr: getattr(exam, f"{name}_{attr}") for attr in attrs + ("is_enabled",)
+                })
+                for exam in exams
+            ])
+
+        MyocardialSegment.objects.bulk_create([
+            MyocardialSegment(examination_id=exam.id, segment_number=i + 1, state=(exam.segment_states >> (2 * i)) & 0b11)
+            for exam in exams
+            for i in range(17)
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0003_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examination',
+            name='aorta_diameter',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='aorta_is_enabled',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='aorta_valve_opening',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='aorticvalve_area',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='aorticvalve_grad_max',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='aorticvalve_grad_mean',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='aorticvalve_is_enabled',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='aorticvalve_psk',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='aorticvalve_regurgitation',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='leftventricle_edd',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='leftventricle_edv',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='leftventricle_esd',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='leftventricle_esv',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='leftventricle_hr',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='leftventricle_is_enabled',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='leftventricle_ivsd',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='leftventricle_pw',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='mitralvalve_a',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='mitralvalve_dte',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='mitralvalve_e',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='mitralvalve_grad_max',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='mitralvalve_is_enabled',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='mitralvalve_ivrt',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='mitralvalve_reg',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='otherchambers_is_enabled',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='otherchambers_la',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='otherchambers_lav',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='otherchambers_ra',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='otherchambers_rv',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='pulmonaryartery_at',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='pulmonaryartery_diameter',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='pulmonaryartery_et',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='pulmonaryartery_grad_max',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='pulmonaryartery_is_enabled',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='pulmonaryartery_ivc',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='pulmonaryartery_reg',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='pulmonaryartery_velocity',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='segment_states',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='tricuspidvalve_a',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='tricuspidvalve_e',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='tricuspidvalve_grad_max',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='tricuspidvalve_is_enabled',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='tricuspidvalve_reg',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='tricuspidvalve_tapse',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(sections_to_columns, columns_to_sections),
+        migrations.RemoveField(
+            model_name='aorticvalve',
+            name='examination',
+        ),
+        migrations.RemoveField(
+            model_name='leftventricle',
+            name='examination',
+        ),
+        migrations.RemoveField(
+            model_name='mitralvalve',
+            name='examination',
+        ),
+        migrations.RemoveField(
+            model_name='myocardialsegment',
+            name='examination',
+        ),
+        migrations.RemoveField(
+            model_name='otherchambers',
+            name='examination',
+        ),
+        migrations.RemoveField(
+            model_name='pulmonaryartery',
+            name='examination',
+        ),
+        migrations.RemoveField(
+            model_name='tricuspidvalve',
+            name='examination',
+        ),
+        migrations.DeleteModel(
+            name='Aorta',
+        ),
+        migrations.DeleteModel(
+            name='AorticValve',
+        ),
+        migrations.DeleteModel(
+            name='LeftVentricle',
+        ),
+        migrations.DeleteModel(
+            name='MitralValve',
+        ),
+        migrations.DeleteModel(
+            name='MyocardialSegment',
+        ),
+        migrations.DeleteModel(
+            name='OtherChambers',
+        ),
+        migrations.DeleteModel(
+            name='PulmonaryArtery',
+        ),
+        migrations.DeleteModel(
+            name='TricuspidValve',
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0004_compact_examination'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examination',
+            name='fs',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='sv',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='ef',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='co',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='ci',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='wmsi',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0005_examination_indices'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('exam_count', models.IntegerField(default=0)),
+                ('ef_count', models.IntegerField(default=0)),
+                ('ef_sum', models.FloatField(default=0)),
+                ('ef_reduced', models.IntegerField(default=0)),
+                ('ef_mid', models.IntegerField(default=0)),
+                ('ef_preserved', models.IntegerField(default=0)),
+                ('segments_total', models.IntegerField(default=0)),
+                ('segments_abnormal', models.IntegerField(default=0)),
+                ('av_grad_max_count', models.IntegerField(default=0)),
+                ('av_grad_max_sum', models.FloatField(default=0)),
+                ('av_grad_mean_count', models.IntegerField(default=0)),
+                ('av_grad_mean_sum', models.FloatField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='dailystats_user_day_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+import re
+
+from django.db import migrations, models
+
+# Копия на момент миграции: код приложения может измениться
+NAME_WORD = re.compile(r"[^\W_]+")
+
+TOKENS = "'u' || {0}.user_id || 'x' || replace({0}.search_name, ' ', ' u' || {0}.user_id || 'x')"
+
+CREATE_FTS = [
+    # contentless: хранится только индекс, строки читаются из patients_patient
+    "CREATE VIRTUAL TABLE patients_patient_fts USING fts5("
+    "tokens, content='', tokenize='unicode61 remove_diacritics 0')",
+    f"""
+    CREATE TRIGGER patients_patient_fts_ai AFTER INSERT ON patients_patient BEGIN
+        INSERT INTO patients_patient_fts (rowid, tokens) VALUES (new.id, {TOKENS.format("new")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER patients_patient_fts_ad AFTER DELETE ON patients_patient BEGIN
+        INSERT INTO patients_patient_fts (patients_patient_fts, rowid, tokens)
+        VALUES ('delete', old.id, {TOKENS.format("old")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER patients_patient_fts_au AFTER UPDATE OF search_name, user_id ON patients_patient BEGIN
+        INSERT INTO patients_patient_fts (patients_patient_fts, rowid, tokens)
+        VALUES ('delete', old.id, {TOKENS.format("old")});
+        INSERT INTO patients_patient_fts (rowid, tokens) VALUES (new.id, {TOKENS.format("new")});
+    END
+    """,
+    f"INSERT INTO patients_patient_fts (rowid, tokens) SELECT id, {TOKENS.format('patients_patient')} "
+    "FROM patients_patient",
+]
+
+DROP_FTS = [
+    "DROP TRIGGER IF EXISTS patients_patient_fts_ai",
+    "DROP TRIGGER IF EXISTS patients_patient_fts_ad",
+    "DROP TRIGGER IF EXISTS patients_patient_fts_au",
+    "DROP TABLE IF EXISTS patients_patient_fts",
+]
+
+
+def fill_search_name(apps, schema_editor):
+    Patient = apps.get_model("patients", "Patient")
+    batch = []
+    for patient in Patient.objects.only("id", "full_name").iterator(chunk_size=2000):
+        patient.search_name = " ".join(NAME_WORD.findall(patient.full_name.casefold().replace("ё", "е")))
+        batch.append(patient)
+        if len(batch) >= 2000:
+            Patient.objects.bulk_update(batch, ["search_name"])
+            batch = []
+    Patient.objects.bulk_update(batch, ["search_name"])
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        # FTS5 есть только в SQLite; на других СУБД поиск идёт по search_name
+        if schema_editor.connection.vendor == "sqlite":
+            for sql in statements:
+                schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0006_dailystats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='search_name',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_search_name, migrations.RunPython.noop),
+        migrations.RunPython(run_sqlite(CREATE_FTS), run_sqlite(DROP_FTS)),
+    ]
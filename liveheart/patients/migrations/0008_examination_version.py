@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0007_patient_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examination',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
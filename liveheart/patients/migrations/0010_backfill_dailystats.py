@@ -0,0 +1,61 @@
+from collections import defaultdict
+
+from django.db import migrations
+from django.utils import timezone
+
+# Копия patients.stats на момент миграции: код приложения может измениться
+SEGMENT_COUNT = 17
+SEGMENT_LOW_BITS = sum(1 << (2 * i) for i in range(SEGMENT_COUNT))
+
+SOURCE_FIELDS = ("exam_datetime", "created_at", "ef", "aorticvalve_grad_max", "aorticvalve_grad_mean", "segment_states")
+
+
+def contribution(exam_datetime, created_at, ef, aorticvalve_grad_max, aorticvalve_grad_mean, segment_states):
+    segment_states = segment_states or 0
+    deltas = {
+        "exam_count": 1,
+        "segments_total": SEGMENT_COUNT,
+        "segments_abnormal": bin((segment_states | (segment_states >> 1)) & SEGMENT_LOW_BITS).count("1"),
+    }
+    if ef is not None:
+        deltas["ef_count"] = 1
+        deltas["ef_sum"] = ef
+        deltas["ef_reduced" if ef < 40 else "ef_mid" if ef < 50 else "ef_preserved"] = 1
+    if aorticvalve_grad_max is not None:
+        deltas["av_grad_max_count"] = 1
+        deltas["av_grad_max_sum"] = aorticvalve_grad_max
+    if aorticvalve_grad_mean is not None:
+        deltas["av_grad_mean_count"] = 1
+        deltas["av_grad_mean_sum"] = aorticvalve_grad_mean
+    return timezone.localdate(exam_datetime or created_at or timezone.now()), deltas
+
+
+def backfill(apps, schema_editor):
+    # Сводки по обследованиям, записанным до появления DailyStats (0006 создала пустую таблицу).
+    # Полная пересборка, как stats.rebuild(), поэтому повторный запуск ничего не удваивает
+    Examination = apps.get_model("patients", "Examination")
+    DailyStats = apps.get_model("patients", "DailyStats")
+
+    totals = defaultdict(lambda: defaultdict(int))
+    rows = Examination.objects.order_by().values_list("patient__user_id", *SOURCE_FIELDS).iterator(chunk_size=5000)
+    for user_id, *values in rows:
+        day, deltas = contribution(*values)
+        for name, value in deltas.items():
+            totals[(user_id, day)][name] += value
+
+    DailyStats.objects.all().delete()
+    DailyStats.objects.bulk_create(
+        [DailyStats(user_id=user_id, day=day, **deltas) for (user_id, day), deltas in totals.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0009_exportjob_worker'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,123 @@
+import re
+from collections import namedtuple
+
 from django.db import models
 from django.contrib.auth.models import User  # Импортируем модель пользователя
 
+NAME_WORD = re.compile(r"[^\W_]+")
+
+
+def normalize_name(full_name):
+    """ФИО для поиска: без регистра, ё как е, только слова через один пробел"""
+    return " ".join(NAME_WORD.findall((full_name or "").casefold().replace("ё", "е")))
+
+
+class PatientQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for patient in objs:
+            patient.search_name = normalize_name(patient.full_name)
+        return super().bulk_create(objs, *args, **kwargs)
+
 
 class Patient(models.Model):
     # Привязываем пациента к конкретному врачу (пользователю)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="patients")
     full_name = models.CharField(max_length=255)
+    # normalize_name(full_name): заполняется в save() и bulk_create(), по нему триггеры ведут
+    # полнотекстовый индекс patients_patient_fts (см. patients/search.py).
+    # При .update(full_name=...) обновляйте и search_name.
+    search_name = models.CharField(max_length=255, default="", editable=False)
+
+    objects = PatientQuerySet.as_manager()
+
+    class Meta:
+        # Под сортировку и keyset-пагинацию списка пациентов врача
+        indexes = [models.Index(fields=["user", "full_name", "id"], name="patient_user_name_idx")]
 
     def __str__(self):
         return self.full_name
 
+    def save(self, *args, **kwargs):
+        self.search_name = normalize_name(self.full_name)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "full_name" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "search_name"}
+        super().save(*args, **kwargs)
+
+
+# Разделы протокола и их поля. Значения хранятся в самой строке Examination
+# в колонках "<раздел>_<поле>" (и "<раздел>_is_enabled"), а не в отдельных таблицах.
+SECTIONS = {
+    "aorta": ("diameter", "valve_opening"),
+    "aorticvalve": ("psk", "grad_max", "grad_mean", "regurgitation", "area"),
+    "leftventricle": ("ivsd", "edd", "esd", "pw", "edv", "esv", "hr"),
+    "otherchambers": ("la", "ra", "rv", "lav"),
+    "mitralvalve": ("e", "a", "grad_max", "dte", "ivrt", "reg"),
+    "tricuspidvalve": ("e", "a", "grad_max", "tapse", "reg"),
+    "pulmonaryartery": ("diameter", "grad_max", "velocity", "at", "et", "reg", "ivc"),
+}
+
+SEGMENT_COUNT = 17
+SEGMENT_BITS = 2  # состояние 0–3: норма, гипокинез, акинез, дискинез
+
+
+def pack_segments(states):
+    """17 состояний сегментов -> одно целое, по 2 бита на сегмент (сегмент 1 — младшие биты)"""
+    packed = 0
+    for i, state in enumerate(states):
+        packed |= (int(state) & 0b11) << (SEGMENT_BITS * i)
+    return packed
+
+
+def unpack_segments(packed):
+    return [(packed >> (SEGMENT_BITS * i)) & 0b11 for i in range(SEGMENT_COUNT)]
+
+
+class Segment(namedtuple("Segment", "segment_number state")):
+    __slots__ = ()
+
+
+class SegmentList(list):
+    """Сегменты обследования в порядке номеров; .all() оставлен для кода, писавшегося под менеджер"""
+
+    def all(self):
+        return self
+
+
+class Section:
+    """
+    Раздел протокола поверх колонок Examination: exam.aorta.diameter читает и пишет exam.aorta_diameter.
+    Сохраняет прежний интерфейс отдельных моделей Aorta, AorticValve и т.д.
+    """
+
+    __slots__ = ("_exam", "_name")
+
+    def __init__(self, exam, name):
+        object.__setattr__(self, "_exam", exam)
+        object.__setattr__(self, "_name", name)
+
+    def _column(self, attr):
+        if attr == "is_enabled" or attr in SECTIONS[self._name]:
+            return f"{self._name}_{attr}"
+        raise AttributeError(f"В разделе {self._name} нет поля {attr}")
+
+    def __getattr__(self, attr):
+        return getattr(self._exam, self._column(attr))
+
+    def __setattr__(self, attr, value):
+        setattr(self._exam, self._column(attr), value)
+
+
+class SectionDescriptor:
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, exam, owner=None):
+        if exam is None:
+            return self
+        return Section(exam, self.name)
+
 
 class Examination(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
@@ -24,81 +132,160 @@ class Examination(models.Model):
     bsa = models.FloatField(null=True, blank=True)
     hr = models.IntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Растёт на 1 при каждой правке: по нему ловятся параллельные правки и меняется ETag протоколов
+    version = models.PositiveIntegerField(default=1)
 
+    # Аорта
+    aorta_diameter = models.FloatField(null=True, blank=True)
+    aorta_valve_opening = models.FloatField(null=True, blank=True)
+    aorta_is_enabled = models.BooleanField(default=True)
 
-# Группы данных (Аорта, Клапаны и т.д.)
-class Aorta(models.Model):
-    examination = models.OneToOneField(Examination, on_delete=models.CASCADE)
-    diameter = models.FloatField(null=True, blank=True)
-    valve_opening = models.FloatField(null=True, blank=True)
-    is_enabled = models.BooleanField(default=True)
-
-
-class AorticValve(models.Model):
-    examination = models.OneToOneField(Examination, on_delete=models.CASCADE)
-    psk = models.FloatField(null=True, blank=True)
-    grad_max = models.FloatField(null=True, blank=True)
-    grad_mean = models.FloatField(null=True, blank=True)
-    regurgitation = models.IntegerField(default=0)
-    area = models.FloatField(null=True, blank=True)
-    is_enabled = models.BooleanField(default=True)
-
-
-class LeftVentricle(models.Model):
-    examination = models.OneToOneField(Examination, on_delete=models.CASCADE)
-    ivsd = models.FloatField(null=True, blank=True)
-    edd = models.FloatField(null=True, blank=True)
-    esd = models.FloatField(null=True, blank=True)
-    pw = models.FloatField(null=True, blank=True)
-    edv = models.FloatField(null=True, blank=True)
-    esv = models.FloatField(null=True, blank=True)
-    hr = models.IntegerField(null=True, blank=True)
-    is_enabled = models.BooleanField(default=True)
-
-
-class OtherChambers(models.Model):
-    examination = models.OneToOneField(Examination, on_delete=models.CASCADE)
-    la = models.FloatField(null=True, blank=True)
-    ra = models.FloatField(null=True, blank=True)
-    rv = models.FloatField(null=True, blank=True)
-    lav = models.FloatField(null=True, blank=True)
-    is_enabled = models.BooleanField(default=True)
-
-
-class MitralValve(models.Model):
-    examination = models.OneToOneField(Examination, on_delete=models.CASCADE)
-    e = models.FloatField(null=True, blank=True)
-    a = models.FloatField(null=True, blank=True)
-    grad_max = models.FloatField(null=True, blank=True)
-    dte = models.FloatField(null=True, blank=True)
-    ivrt = models.FloatField(null=True, blank=True)
-    reg = models.IntegerField(default=0)
-    is_enabled = models.BooleanField(default=True)
-
-
-class TricuspidValve(models.Model):
-    examination = models.OneToOneField(Examination, on_delete=models.CASCADE)
-    e = models.FloatField(null=True, blank=True)
-    a = models.FloatField(null=True, blank=True)
-    grad_max = models.FloatField(null=True, blank=True)
-    tapse = models.FloatField(null=True, blank=True)
-    reg = models.IntegerField(default=0)
-    is_enabled = models.BooleanField(default=True)
-
-
-class PulmonaryArtery(models.Model):
-    examination = models.OneToOneField(Examination, on_delete=models.CASCADE)
-    diameter = models.FloatField(null=True, blank=True)
-    grad_max = models.FloatField(null=True, blank=True)
-    velocity = models.FloatField(null=True, blank=True)
-    at = models.FloatField(null=True, blank=True)
-    et = models.FloatField(null=True, blank=True)
-    reg = models.IntegerField(default=0)
-    ivc = models.FloatField(null=True, blank=True)
-    is_enabled = models.BooleanField(default=True)
-
-
-class MyocardialSegment(models.Model):
-    examination = models.ForeignKey(Examination, on_delete=models.CASCADE, related_name="segments")
-    segment_number = models.PositiveSmallIntegerField()
-    state = models.PositiveSmallIntegerField(default=0)
\ No newline at end of file
+    # Аортальный клапан
+    aorticvalve_psk = models.FloatField(null=True, blank=True)
+    aorticvalve_grad_max = models.FloatField(null=True, blank=True)
+    aorticvalve_grad_mean = models.FloatField(null=True, blank=True)
+    aorticvalve_regurgitation = models.IntegerField(default=0)
+    aorticvalve_area = models.FloatField(null=True, blank=True)
+    aorticvalve_is_enabled = models.BooleanField(default=True)
+
+    # Левый желудочек
+    leftventricle_ivsd = models.FloatField(null=True, blank=True)
+    leftventricle_edd = models.FloatField(null=True, blank=True)
+    leftventricle_esd = models.FloatField(null=True, blank=True)
+    leftventricle_pw = models.FloatField(null=True, blank=True)
+    leftventricle_edv = models.FloatField(null=True, blank=True)
+    leftventricle_esv = models.FloatField(null=True, blank=True)
+    leftventricle_hr = models.IntegerField(null=True, blank=True)
+    leftventricle_is_enabled = models.BooleanField(default=True)
+
+    # Остальные камеры
+    otherchambers_la = models.FloatField(null=True, blank=True)
+    otherchambers_ra = models.FloatField(null=True, blank=True)
+    otherchambers_rv = models.FloatField(null=True, blank=True)
+    otherchambers_lav = models.FloatField(null=True, blank=True)
+    otherchambers_is_enabled = models.BooleanField(default=True)
+
+    # Митральный клапан
+    mitralvalve_e = models.FloatField(null=True, blank=True)
+    mitralvalve_a = models.FloatField(null=True, blank=True)
+    mitralvalve_grad_max = models.FloatField(null=True, blank=True)
+    mitralvalve_dte = models.FloatField(null=True, blank=True)
+    mitralvalve_ivrt = models.FloatField(null=True, blank=True)
+    mitralvalve_reg = models.IntegerField(default=0)
+    mitralvalve_is_enabled = models.BooleanField(default=True)
+
+    # Трикуспидальный клапан
+    tricuspidvalve_e = models.FloatField(null=True, blank=True)
+    tricuspidvalve_a = models.FloatField(null=True, blank=True)
+    tricuspidvalve_grad_max = models.FloatField(null=True, blank=True)
+    tricuspidvalve_tapse = models.FloatField(null=True, blank=True)
+    tricuspidvalve_reg = models.IntegerField(default=0)
+    tricuspidvalve_is_enabled = models.BooleanField(default=True)
+
+    # Лёгочная артерия
+    pulmonaryartery_diameter = models.FloatField(null=True, blank=True)
+    pulmonaryartery_grad_max = models.FloatField(null=True, blank=True)
+    pulmonaryartery_velocity = models.FloatField(null=True, blank=True)
+    pulmonaryartery_at = models.FloatField(null=True, blank=True)
+    pulmonaryartery_et = models.FloatField(null=True, blank=True)
+    pulmonaryartery_reg = models.IntegerField(default=0)
+    pulmonaryartery_ivc = models.FloatField(null=True, blank=True)
+    pulmonaryartery_is_enabled = models.BooleanField(default=True)
+
+    # Состояния 17 сегментов миокарда, упакованные по 2 бита (см. pack_segments)
+    segment_states = models.PositiveBigIntegerField(default=0)
+
+    # Расчётные показатели (patients.indices); bmi и bsa выше тоже пересчитываются на сервере
+    fs = models.FloatField(null=True, blank=True)
+    sv = models.FloatField(null=True, blank=True)
+    ef = models.FloatField(null=True, blank=True)
+    co = models.FloatField(null=True, blank=True)
+    ci = models.FloatField(null=True, blank=True)
+    wmsi = models.FloatField(null=True, blank=True)
+
+    # Совместимость с прежними моделями разделов: exam.aorta, exam.leftventricle и т.д.
+    aorta = SectionDescriptor("aorta")
+    aorticvalve = SectionDescriptor("aorticvalve")
+    leftventricle = SectionDescriptor("leftventricle")
+    otherchambers = SectionDescriptor("otherchambers")
+    mitralvalve = SectionDescriptor("mitralvalve")
+    tricuspidvalve = SectionDescriptor("tricuspidvalve")
+    pulmonaryartery = SectionDescriptor("pulmonaryartery")
+
+    class Meta:
+        # Последнее обследование пациента берётся по этому индексу без сканирования
+        indexes = [models.Index(fields=["patient", "exam_datetime"], name="exam_patient_datetime_idx")]
+
+    @property
+    def segments(self):
+        return SegmentList(
+            Segment(i, state) for i, state in enumerate(unpack_segments(self.segment_states), start=1)
+        )
+
+    def set_segments(self, states):
+        self.segment_states = pack_segments(states)
+
+
+class ExportJob(models.Model):
+    """Задание на фоновую сборку отчёта (DOCX / XLSX / PDF)"""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "В очереди"),
+        (RUNNING, "Собирается"),
+        (DONE, "Готово"),
+        (FAILED, "Ошибка"),
+    ]
+    FORMAT_CHOICES = [("docx", "Word"), ("xlsx", "Excel"), ("pdf", "PDF")]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="export_jobs")
+    examination = models.ForeignKey(Examination, on_delete=models.CASCADE, related_name="export_jobs")
+    format = models.CharField(max_length=8, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    file_name = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Воркер, который собирает задание (хост:pid), и когда он последний раз подтвердил, что жив
+    worker = models.CharField(max_length=128, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # Воркер выбирает задания из очереди по статусу в порядке поступления
+        indexes = [models.Index(fields=["status", "id"], name="exportjob_status_idx")]
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+
+class DailyStats(models.Model):
+    """
+    Сводка врача за день для дашборда. Обновляется инкрементально при записи и удалении
+    обследований (patients.stats), полностью пересобирается командой rebuild_daily_stats.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="daily_stats")
+    day = models.DateField()
+    exam_count = models.IntegerField(default=0)
+
+    # Распределение ФВ: сниженная (<40 %), умеренно сниженная (40–49 %), сохранённая (≥50 %)
+    ef_count = models.IntegerField(default=0)
+    ef_sum = models.FloatField(default=0)
+    ef_reduced = models.IntegerField(default=0)
+    ef_mid = models.IntegerField(default=0)
+    ef_preserved = models.IntegerField(default=0)
+
+    segments_total = models.IntegerField(default=0)
+    segments_abnormal = models.IntegerField(default=0)
+
+    av_grad_max_count = models.IntegerField(default=0)
+    av_grad_max_sum = models.FloatField(default=0)
+    av_grad_mean_count = models.IntegerField(default=0)
+    av_grad_mean_sum = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "day"], name="dailystats_user_day_uniq")]
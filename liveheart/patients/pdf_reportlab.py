@@ -0,0 +1,136 @@
+"""
+PDF-протокол, нарисованный напрямую средствами ReportLab (platypus), без HTML и xhtml2pdf.
+
+Шрифты регистрируются один раз на процесс, стили абзацев и таблиц строятся один раз
+и переиспользуются; на каждый отчёт создаются только строки таблиц.
+"""
+import io
+from functools import cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import HRFlowable, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+FONT = "LiveHeartSans"
+FONT_BOLD = "LiveHeartSans-Bold"
+
+PAGE_WIDTH = A4[0] - 4 * cm  # поля по 2 см, как в pdf_report.html
+
+
+@cache
+def register_fonts():
+    """
+    Регистрирует TTF-шрифты с кириллицей (REPORT_PDF_FONT / REPORT_PDF_FONT_BOLD).
+    Возвращает имена (обычный, жирный). Без файлов шрифтов — ImproperlyConfigured: встроенная
+    Helvetica не содержит кириллицы, и протокол вышел бы с пустыми квадратами вместо текста.
+    """
+    try:
+        pdfmetrics.registerFont(TTFont(FONT, str(settings.REPORT_PDF_FONT)))
+        pdfmetrics.registerFont(TTFont(FONT_BOLD, str(settings.REPORT_PDF_FONT_BOLD)))
+    except Exception as exc:
+        raise ImproperlyConfigured(
+            f"Шрифты PDF с кириллицей не найдены ({settings.REPORT_PDF_FONT}, {settings.REPORT_PDF_FONT_BOLD}): "
+            "задайте REPORT_PDF_FONT и REPORT_PDF_FONT_BOLD или REPORT_PDF_BACKEND=xhtml2pdf"
+        ) from exc
+    pdfmetrics.registerFontFamily(FONT, normal=FONT, bold=FONT_BOLD)
+    return FONT, FONT_BOLD
+
+
+@cache
+def styles():
+    """Стили абзацев и таблиц, общие для всех отчётов процесса"""
+    font, bold = register_fonts()
+    return {
+        "header": ParagraphStyle("header", fontName=font, fontSize=12, leading=15, alignment=TA_CENTER,
+                                 spaceAfter=20),
+        "subtitle": ParagraphStyle("subtitle", fontName=bold, fontSize=14, leading=17, alignment=TA_CENTER,
+                                   spaceAfter=20),
+        "patient": TableStyle([
+            ("FONT", (0, 0), (-1, -1), font, 12),
+            ("FONT", (0, 0), (0, -1), bold, 12),
+            ("FONT", (2, 0), (2, -1), bold, 12),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 5),
+            ("TOPPADDING", (0, 0), (-1, -1), 5),
+        ]),
+        "section": TableStyle([
+            ("FONT", (0, 0), (-1, -1), font, 12),
+            ("FONT", (0, 0), (-1, 0), bold, 12),
+            ("SPAN", (0, 0), (-1, 0)),
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#f0f0f0")),
+            ("BOX", (0, 0), (-1, 0), 1, colors.black),
+            ("GRID", (0, 1), (-1, -1), 1, colors.HexColor("#cccccc")),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 5),
+            ("TOPPADDING", (0, 0), (-1, -1), 5),
+        ]),
+        "patient_widths": [2.6 * cm, PAGE_WIDTH / 2 - 2.6 * cm, 2.6 * cm, PAGE_WIDTH / 2 - 2.6 * cm],
+        "section_widths": [PAGE_WIDTH * 0.6, PAGE_WIDTH * 0.4],
+    }
+
+
+def _val(value, unit=""):
+    # Как фильтр default:"-" в pdf_report.html
+    return f"{value if value not in (None, '', 0) else '-'} {unit}".rstrip()
+
+
+def _section(title, rows, st):
+    return Table([[title, ""], *rows], colWidths=st["section_widths"], style=st["section"], spaceAfter=15)
+
+
+def render_pdf_reportlab(exam):
+    """Тот же протокол, что и pdf_report.html, в байтах PDF"""
+    st = styles()
+    story = [
+        Paragraph("ГБУЗ НО «Центральная городская больница г. Арзамас»", st["header"]),
+        Paragraph("ПРОТОКОЛ ЭХОКАРДИОГРАФИИ", st["subtitle"]),
+        Table([
+            # Местная дата, как у фильтра |date в pdf_report.html
+            ["ФИО:", exam.patient.full_name, "Дата:",
+             timezone.localtime(exam.exam_datetime).strftime("%d.%m.%Y") if exam.exam_datetime else ""],
+            ["Возраст:", _val(exam.age, "лет"), "Рост/Вес:", f"{_val(exam.height)}/{_val(exam.weight)}"],
+            ["ППТ:", _val(exam.bsa, "м²"), "ЧСС:", _val(exam.hr, "уд/мин")],
+        ], colWidths=st["patient_widths"], style=st["patient"], hAlign="LEFT"),
+        Spacer(1, 6),
+        HRFlowable(width="100%", thickness=1, color=colors.black, spaceAfter=20),
+    ]
+
+    if exam.aorta.is_enabled:
+        story.append(_section("АОРТА", [
+            ["Диаметр основания", _val(exam.aorta.diameter, "мм")],
+            ["Раскрытие створок АК", _val(exam.aorta.valve_opening, "мм")],
+        ], st))
+
+    if exam.aorticvalve.is_enabled:
+        av = exam.aorticvalve
+        story.append(_section("АОРТАЛЬНЫЙ КЛАПАН", [
+            ["Пиковая скорость (Vmax)", _val(av.psk, "м/с")],
+            ["Макс. градиент (Gd max)", _val(av.grad_max, "мм рт.ст.")],
+            ["Средний градиент (Gd mean)", _val(av.grad_mean, "мм рт.ст.")],
+            ["Регургитация", f"{av.regurgitation} ст."],
+        ], st))
+
+    if exam.leftventricle.is_enabled:
+        lv = exam.leftventricle
+        story.append(_section("ЛЕВЫЙ ЖЕЛУДОЧЕК", [
+            ["КДР", _val(lv.edd, "мм")],
+            ["КСР", _val(lv.esd, "мм")],
+            ["КДО", _val(lv.edv, "мл")],
+            ["КСО", _val(lv.esv, "мл")],
+            ["МЖП (толщина)", _val(lv.ivsd, "мм")],
+            ["ЗСЛЖ (толщина)", _val(lv.pw, "мм")],
+        ], st))
+
+    result = io.BytesIO()
+    doc = SimpleDocTemplate(
+        result, pagesize=A4, leftMargin=2 * cm, rightMargin=2 * cm, topMargin=2 * cm, bottomMargin=2 * cm,
+        title=f"Протокол ЭхоКГ {exam.patient.full_name}",
+    )
+    doc.build(story)
+    return result.getvalue()
@@ -0,0 +1,133 @@
+"""
+Реестр всех обследований врача в XLSX.
+
+Строки читаются из БД порциями (.iterator), и каждая порция сразу дописывается в XML листа
+внутри ZIP-архива книги. Архив пишется в поток без перемотки (ZipSink), поэтому первые байты
+уходят клиенту после первой порции, а память не зависит от числа обследований.
+
+Книга собирается вручную из минимального набора частей (один лист, строки как inline-строки
+без общей таблицы строк и стилей): write-only книга openpyxl отдаёт файл только целиком.
+"""
+import zipfile
+from xml.sax.saxutils import escape
+
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+from .models import Examination
+from .utils import ZipSink, format_date
+
+
+# (заголовок колонки, поле для values_list)
+REGISTER_COLUMNS = [
+    ("Дата", "exam_datetime"),
+    ("Ф.И.О.", "patient__full_name"),
+    ("Возраст", "age"),
+    ("Рост, см", "height"),
+    ("Вес, кг", "weight"),
+    ("ИМТ", "bmi"),
+    ("ППТ, м²", "bsa"),
+    ("ЧСС", "hr"),
+    ("Аорта, мм", "aorta_diameter"),
+    ("Раскрытие АК, мм", "aorta_valve_opening"),
+    ("АК Vmax, м/с", "aorticvalve_psk"),
+    ("АК град. макс.", "aorticvalve_grad_max"),
+    ("АК град. ср.", "aorticvalve_grad_mean"),
+    ("КДР, мм", "leftventricle_edd"),
+    ("КСР, мм", "leftventricle_esd"),
+    ("КДО, мл", "leftventricle_edv"),
+    ("КСО, мл", "leftventricle_esv"),
+    ("МЖП, мм", "leftventricle_ivsd"),
+    ("ЗСЛЖ, мм", "leftventricle_pw"),
+    ("ЛП, мм", "otherchambers_la"),
+    ("ПП, мм", "otherchambers_ra"),
+    ("ПЖ, мм", "otherchambers_rv"),
+    ("МК E", "mitralvalve_e"),
+    ("МК A", "mitralvalve_a"),
+    ("TAPSE, мм", "tricuspidvalve_tapse"),
+    ("ЛА, мм", "pulmonaryartery_diameter"),
+    ("ФВ, %", "ef"),
+    ("ИНЛС", "wmsi"),
+]
+
+CHUNK_SIZE = 2000
+SHEET_NAME = "Реестр"
+
+_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+# Служебные части книги: (имя в архиве, содержимое)
+_PACKAGE_PARTS = [
+    ("[Content_Types].xml", (
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    )),
+    ("_rels/.rels", (
+        f'<Relationships xmlns="{_PACKAGE_REL_NS}">'
+        f'<Relationship Id="rId1" Type="{_REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    )),
+    ("xl/workbook.xml", (
+        f'<workbook xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}">'
+        f'<sheets><sheet name="{SHEET_NAME}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )),
+    ("xl/_rels/workbook.xml.rels", (
+        f'<Relationships xmlns="{_PACKAGE_REL_NS}">'
+        f'<Relationship Id="rId1" Type="{_REL_NS}/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    )),
+]
+
+
+def register_rows(user):
+    fields = [field for _, field in REGISTER_COLUMNS]
+    rows = (
+        Examination.objects.filter(patient__user=user)
+        .order_by("exam_datetime", "id")
+        .values_list(*fields)
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    for row in rows:
+        yield (format_date(row[0]),) + row[1:]
+
+
+def _cell(value):
+    if value is None:
+        return "<c/>"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"<c><v>{value!r}</v></c>"
+    text = escape(ILLEGAL_CHARACTERS_RE.sub("", str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _row(values):
+    return "<row>" + "".join(map(_cell, values)) + "</row>"
+
+
+def stream_register(user):
+    """Генератор байтов XLSX для StreamingHttpResponse"""
+    sink = ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, content in _PACKAGE_PARTS:
+            zf.writestr(name, _XML_HEADER + content)
+
+        with zf.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(f'{_XML_HEADER}<worksheet xmlns="{_MAIN_NS}"><sheetData>'.encode())
+            sheet.write(_row(title for title, _ in REGISTER_COLUMNS).encode())
+            lines = []
+            for row in register_rows(user):
+                lines.append(_row(row))
+                if len(lines) == CHUNK_SIZE:
+                    sheet.write("".join(lines).encode())
+                    lines.clear()
+                    yield sink.pop()
+            sheet.write(("".join(lines) + "</sheetData></worksheet>").encode())
+    yield sink.pop()
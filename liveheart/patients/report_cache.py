@@ -0,0 +1,199 @@
+"""
+Дисковый кэш готовых отчётов.
+
+Ключ — sha256 от данных обследования (пациент, все разделы, сегменты) и версии генератора,
+поэтому любое изменение обследования или шаблона даёт новый ключ, а устаревшие файлы
+вытесняются по LRU, когда кэш превышает REPORT_CACHE_MAX_BYTES.
+
+Занятый размер учитывается в файле SIZE_FILE (общем для процессов): каждый новый отчёт
+прибавляет к нему свой размер, а каталог обходится только когда учтённый размер превысил лимит.
+Обход вытесняет отчёты до EVICT_TARGET лимита и записывает точный размер заново.
+
+Попадания, промахи, сборки и вытеснения считаются метриками liveheart.metrics: они суммируются
+по процессам, а счётчики завершившихся процессов не теряются.
+"""
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+from liveheart.metrics import collect, counter
+
+from .utils import render_report, report_version
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только внутри процесса
+    fcntl = None
+
+
+CACHE_EVENTS = counter("liveheart_report_cache_total", "События кэша отчётов", ("event",))
+EVENTS = ("hits", "misses", "renders", "evictions")
+
+SIZE_FILE = "size"
+# Вытеснение освобождает место с запасом, чтобы следующий обход каталога случился нескоро
+EVICT_TARGET = 0.9
+
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+def cache_key(exam, fmt):
+    """exam — ExamSnapshot"""
+    data = {
+        "format": fmt,
+        "version": report_version(fmt),
+        "exam": exam.as_dict(),
+    }
+    raw = json.dumps(data, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def cache_dir():
+    return Path(settings.REPORT_CACHE_DIR)
+
+
+def _entry_path(key, fmt):
+    return cache_dir() / key[:2] / f"{key}.{fmt}"
+
+
+class _KeyLock:
+    """Блокировка ключа: пока один процесс собирает отчёт, остальные ждут его результат"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        if fcntl is None:
+            with _local_locks_guard:
+                self.lock = _local_locks.setdefault(str(self.path), threading.Lock())
+            self.lock.acquire()
+            return self
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fd = os.open(self.path, os.O_CREAT | os.O_RDWR)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is None:
+            self.lock.release()
+            return
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+
+
+def _read(path):
+    try:
+        content = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    # Обновляем время доступа для LRU
+    os.utime(path)
+    return content
+
+
+def get_or_render(exam, fmt):
+    """Байты отчёта по снимку обследования: из кэша, а при промахе — собирает и кладёт в кэш"""
+    key = cache_key(exam, fmt)
+    path = _entry_path(key, fmt)
+
+    content = _read(path)
+    if content is not None:
+        CACHE_EVENTS.inc("hits")
+        return content
+
+    with _KeyLock(path.with_suffix(".lock")):
+        # Пока ждали блокировку, отчёт мог собрать соседний процесс
+        content = _read(path)
+        if content is not None:
+            CACHE_EVENTS.inc("hits")
+            return content
+
+        CACHE_EVENTS.inc("misses")
+        content = render_report(exam, fmt)
+        CACHE_EVENTS.inc("renders")
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, path)
+
+    total = _add_size(len(content))
+    if total is None or total > settings.REPORT_CACHE_MAX_BYTES:
+        evict()
+    return content
+
+
+def _size_path():
+    return cache_dir() / SIZE_FILE
+
+
+def _write_size(total):
+    tmp_path = _size_path().with_suffix(".tmp")
+    tmp_path.write_text(str(total))
+    os.replace(tmp_path, _size_path())
+
+
+def _add_size(delta):
+    """Прибавляет delta к учтённому размеру кэша; None — размер ещё не посчитан обходом"""
+    with _KeyLock(_size_path().with_suffix(".lock")):
+        try:
+            total = int(_size_path().read_text()) + delta
+        except (FileNotFoundError, ValueError):
+            return None
+        _write_size(total)
+        return total
+
+
+def _entries():
+    for path in cache_dir().glob("??/*"):
+        if path.suffix in (".lock", ".tmp"):
+            continue
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        yield path, st.st_size, st.st_mtime
+
+
+def evict(max_bytes=None):
+    """
+    Удаляет самые давно использованные отчёты, пока кэш не уложится в EVICT_TARGET лимита,
+    и записывает точный размер. Обходит весь каталог, поэтому вызывается только при превышении.
+    """
+    max_bytes = settings.REPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    cache_dir().mkdir(parents=True, exist_ok=True)
+    # Под блокировкой размера: новые отчёты соседних процессов учтутся уже после обхода
+    with _KeyLock(_size_path().with_suffix(".lock")):
+        entries = list(_entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        if total > max_bytes:
+            target = max_bytes * EVICT_TARGET
+            for path, size, _ in sorted(entries, key=lambda e: e[2]):
+                if total <= target:
+                    break
+                path.unlink(missing_ok=True)
+                path.with_suffix(".lock").unlink(missing_ok=True)
+                total -= size
+                removed += 1
+        _write_size(total)
+    if removed:
+        CACHE_EVENTS.inc("evictions", amount=removed)
+    return removed
+
+
+def cache_stats():
+    """Сводка по кэшу для всех процессов: попадания, промахи и занятое место"""
+    counters = collect().get(CACHE_EVENTS.name, {})
+    counters = {event: counters.get((event,), 0) for event in EVENTS}
+    entries = list(_entries())
+    lookups = counters["hits"] + counters["misses"]
+    return {
+        **counters,
+        "hit_ratio": round(counters["hits"] / lookups, 3) if lookups else None,
+        "entries": len(entries),
+        "bytes": sum(size for _, size, _ in entries),
+        "max_bytes": settings.REPORT_CACHE_MAX_BYTES,
+    }
@@ -0,0 +1,213 @@
+"""
+Обезличенный набор данных для исследований: одна строка на обследование, все измерения
+разделов и 17 сегментов отдельными колонками.
+
+Ф.И.О., id пациента и врача в выгрузку не попадают: вместо них псевдонимы HMAC-SHA256 с ключом
+RESEARCH_PSEUDONYM_KEY. Ключ обязателен и не должен совпадать с SECRET_KEY: id перебираются
+легко, и по известному ключу псевдонимы обращаются обратно. Псевдонимы постоянны между выгрузками (обследования одного пациента
+связываются), смена ключа разрывает связь с прошлыми выгрузками. Время обследования
+округляется до даты.
+
+Строки читаются порциями (.iterator), CSV и NDJSON отдаются по мере чтения. Для NPZ каждая
+колонка пишется в свой временный файл, а затем файлы собираются в архив .npy-массивов,
+поэтому память не зависит от числа обследований.
+"""
+import csv
+import hashlib
+import hmac
+import io
+import json
+import shutil
+import tempfile
+import zipfile
+from collections import namedtuple
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models, router
+from django.utils import timezone
+
+from liveheart.db_router import read_only
+
+from .models import SEGMENT_COUNT, Examination, unpack_segments
+
+CHUNK_SIZE = 5000
+STREAM_BLOCK_SIZE = 64 * 1024
+PSEUDONYM_LENGTH = 16
+
+Column = namedtuple("Column", "name dtype")
+
+# Служебные поля, вместо которых в выгрузке псевдонимы, дата и сегменты по отдельности
+EXCLUDED_FIELDS = {"id", "patient", "created_at", "version", "exam_datetime", "segment_states"}
+
+
+def _dtype(field):
+    if isinstance(field, models.BooleanField):
+        return "?"
+    if isinstance(field, models.IntegerField) and not field.null:
+        return "i2"
+    # Числа с пропусками — float64, пропуск — NaN
+    return "f8"
+
+
+MEASUREMENT_FIELDS = [
+    field.name for field in Examination._meta.concrete_fields if field.name not in EXCLUDED_FIELDS
+]
+
+RESEARCH_COLUMNS = [
+    Column("exam", f"S{PSEUDONYM_LENGTH}"),
+    Column("subject", f"S{PSEUDONYM_LENGTH}"),
+    Column("operator", f"S{PSEUDONYM_LENGTH}"),
+    Column("exam_date", "datetime64[D]"),
+    *(Column(name, _dtype(Examination._meta.get_field(name))) for name in MEASUREMENT_FIELDS),
+    *(Column(f"segment_{i}", "u1") for i in range(1, SEGMENT_COUNT + 1)),
+]
+
+# формат -> (Content-Type, расширение файла)
+RESEARCH_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "npz": ("application/octet-stream", "npz"),
+}
+
+
+def pseudonym_key():
+    """Ключ псевдонимов; без отдельного ключа — ImproperlyConfigured, выгрузка не собирается"""
+    key = settings.RESEARCH_PSEUDONYM_KEY
+    if not key or key == settings.SECRET_KEY:
+        raise ImproperlyConfigured(
+            "Задайте RESEARCH_PSEUDONYM_KEY — отдельный от SECRET_KEY секретный ключ псевдонимов: "
+            "без него псевдонимы обращаются перебором id"
+        )
+    return key.encode()
+
+
+def pseudonymizer(kind):
+    """Функция id -> псевдоним; kind разводит псевдонимы пациентов, врачей и обследований"""
+    base = hmac.new(pseudonym_key(), f"{kind}:".encode(), hashlib.sha256)
+
+    def pseudonym(value):
+        digest = base.copy()
+        digest.update(str(value).encode())
+        return digest.hexdigest()[:PSEUDONYM_LENGTH]
+
+    return pseudonym
+
+
+def research_chunks(chunk_size=CHUNK_SIZE):
+    """Списки строк выгрузки (кортежи в порядке RESEARCH_COLUMNS) по chunk_size штук"""
+    exam_pseudonym = pseudonymizer("exam")
+    subject_pseudonym = pseudonymizer("patient")
+    operator_pseudonym = pseudonymizer("doctor")
+    operators = {}
+    # Один раз на выгрузку: timezone.localtime() на каждой строке заметно медленнее
+    tz = timezone.get_current_timezone()
+    with read_only():
+        alias = router.db_for_read(Examination)
+
+    rows = (
+        Examination.objects.using(alias)
+        .order_by("id")
+        .values_list("id", "patient_id", "patient__user_id", "exam_datetime", *MEASUREMENT_FIELDS, "segment_states")
+        .iterator(chunk_size=chunk_size)
+    )
+    while chunk := list(islice(rows, chunk_size)):
+        out = []
+        for exam_id, patient_id, user_id, exam_datetime, *values in chunk:
+            operator = operators.get(user_id)
+            if operator is None:
+                operator = operators[user_id] = operator_pseudonym(user_id)
+            out.append((
+                exam_pseudonym(exam_id),
+                subject_pseudonym(patient_id),
+                operator,
+                exam_datetime.astimezone(tz).date().isoformat() if exam_datetime else None,
+                *values[:-1],
+                *unpack_segments(values[-1]),
+            ))
+        yield out
+
+
+def iter_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow([column.name for column in RESEARCH_COLUMNS])
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def iter_ndjson(chunks):
+    names = [column.name for column in RESEARCH_COLUMNS]
+    for chunk in chunks:
+        lines = [json.dumps(dict(zip(names, row)), ensure_ascii=False) for row in chunk]
+        lines.append("")
+        yield "\n".join(lines).encode()
+
+
+def write_npz(chunks, fileobj):
+    """Пишет NPZ: по массиву .npy на колонку; возвращает число строк"""
+    count = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        files = [open(f"{tmp}/{i}.bin", "w+b") for i in range(len(RESEARCH_COLUMNS))]
+        try:
+            for chunk in chunks:
+                count += len(chunk)
+                for column, values, f in zip(RESEARCH_COLUMNS, zip(*chunk), files):
+                    # None в float-колонке становится NaN, в дате — NaT
+                    np.array(values, dtype=column.dtype).tofile(f)
+
+            with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_STORED, allowZip64=True) as zf:
+                for column, f in zip(RESEARCH_COLUMNS, files):
+                    header = {
+                        "descr": np.lib.format.dtype_to_descr(np.dtype(column.dtype)),
+                        "fortran_order": False,
+                        "shape": (count,),
+                    }
+                    f.seek(0)
+                    with zf.open(f"{column.name}.npy", "w", force_zip64=True) as member:
+                        np.lib.format.write_array_header_1_0(member, header)
+                        shutil.copyfileobj(f, member, STREAM_BLOCK_SIZE)
+        finally:
+            for f in files:
+                f.close()
+    return count
+
+
+def write_research(fmt, fileobj, chunk_size=CHUNK_SIZE):
+    """Пишет выгрузку в файл; возвращает число строк"""
+    chunks = research_chunks(chunk_size)
+    if fmt == "npz":
+        return write_npz(chunks, fileobj)
+
+    count = 0
+
+    def counted():
+        nonlocal count
+        for chunk in chunks:
+            count += len(chunk)
+            yield chunk
+
+    encode = iter_csv if fmt == "csv" else iter_ndjson
+    for block in encode(counted()):
+        fileobj.write(block)
+    return count
+
+
+def stream_research(fmt):
+    """Генератор байтов выгрузки для StreamingHttpResponse"""
+    if fmt == "csv":
+        yield from iter_csv(research_chunks())
+    elif fmt == "ndjson":
+        yield from iter_ndjson(research_chunks())
+    else:
+        # Длину массивов в заголовках .npy узнаём только в конце, поэтому через временный файл
+        with tempfile.TemporaryFile() as f:
+            write_npz(research_chunks(), f)
+            f.seek(0)
+            while block := f.read(STREAM_BLOCK_SIZE):
+                yield block
@@ -0,0 +1,62 @@
+"""
+Поиск пациентов врача по ФИО.
+
+Полнотекстовый индекс SQLite FTS5 (patients_patient_fts, миграция 0007) ведут триггеры на
+patients_patient по колонке search_name. Каждое слово индексируется вместе с id врача:
+"u17xиванов", поэтому префиксный запрос "u17xив"* сразу читает только пациентов этого врача
+и не зависит от размера всей таблицы (доли миллисекунды на 1 млн пациентов).
+
+Каждое слово запроса — префикс какой-либо части ФИО, порядок частей не важен.
+Сначала идут пациенты, у которых с первого слова запроса начинается фамилия, затем по bm25.
+"""
+from django.db import connections, router
+from django.db.models import OuterRef, Subquery
+
+from .models import Examination, Patient, normalize_name
+
+FTS_TABLE = "patients_patient_fts"
+MAX_TERMS = 5
+SEARCH_LIMIT = 20
+
+
+def match_expression(user_id, terms):
+    # Слова после normalize_name состоят только из букв и цифр, экранировать нечего
+    return " AND ".join(f'"u{user_id}x{term}"*' for term in terms)
+
+
+def search_patient_ids(user, query, limit=SEARCH_LIMIT):
+    terms = normalize_name(query).split()[:MAX_TERMS]
+    if not terms:
+        return []
+
+    connection = connections[router.db_for_read(Patient)]
+    if connection.vendor != "sqlite":
+        # Без FTS5: подстрока в нормализованном ФИО
+        patients = Patient.objects.filter(user=user)
+        for term in terms:
+            patients = patients.filter(search_name__contains=term)
+        return list(patients.order_by("full_name", "id").values_list("id", flat=True)[:limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT p.id FROM {FTS_TABLE} JOIN patients_patient p ON p.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s
+            ORDER BY p.search_name LIKE %s DESC, bm25({FTS_TABLE}), p.full_name
+            LIMIT %s
+            """,
+            [match_expression(user.id, terms), f"{terms[0]}%", limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_patients(user, query, limit=SEARCH_LIMIT):
+    """Найденные пациенты врача в порядке релевантности, с датой последнего обследования"""
+    ids = search_patient_ids(user, query, limit)
+    if not ids:
+        return []
+    last_exam = (
+        Examination.objects.filter(patient=OuterRef("pk")).order_by("-exam_datetime").values("exam_datetime")[:1]
+    )
+    found = Patient.objects.filter(user=user, id__in=ids).annotate(last_exam_at=Subquery(last_exam)).in_bulk()
+    return [found[pk] for pk in ids if pk in found]
@@ -0,0 +1,105 @@
+from django.db import transaction
+from django.db.models import F
+
+from .indices import SOURCE_FIELDS, compute_indices
+from .models import Patient, Examination, SECTIONS, SEGMENT_COUNT, normalize_name, pack_segments
+from .stats import SOURCE_FIELDS as STATS_FIELDS, record_exams, rerecord_exam
+
+
+class StaleExamination(Exception):
+    """Обследование изменили после того, как его открыли для правки"""
+
+
+def examination_fields(record):
+    """Поля строки Examination из записи: разделы разворачиваются в колонки "<раздел>_<поле>" """
+    fields = dict(record.get("exam", {}))
+    for name, values in record.get("sections", {}).items():
+        if name not in SECTIONS:
+            raise ValueError(f"Неизвестный раздел протокола: {name}")
+        for attr, value in values.items():
+            fields[f"{name}_{attr}"] = value
+    fields["segment_states"] = pack_segments(record.get("segments") or [0] * SEGMENT_COUNT)
+    # ИМТ, ППТ, ФВ и прочее считаются на сервере, присланным из формы значениям не доверяем
+    fields.update(compute_indices(**{name: fields.get(name) for name in SOURCE_FIELDS}))
+    return fields
+
+
+def save_examinations(user, records):
+    """
+    Сохраняет пачку обследований: один INSERT пациентов и один INSERT обследований.
+
+    Каждая запись — словарь вида
+    {"full_name": ..., "exam": {...}, "sections": {"aorta": {...}, ...}, "segments": [17 состояний]}.
+    Используется и веб-формой, и импортом.
+    """
+    records = list(records)
+    if not records:
+        return []
+
+    with transaction.atomic():
+        patients = Patient.objects.bulk_create([
+            Patient(user=user, full_name=r["full_name"]) for r in records
+        ])
+
+        # Разделы и сегменты хранятся в самой строке обследования
+        exams = Examination.objects.bulk_create([
+            Examination(patient=p, **examination_fields(r)) for p, r in zip(patients, records)
+        ])
+
+        # Дневные сводки для дашборда
+        record_exams(user.id, exams)
+
+    return exams
+
+
+def save_examination(user, record):
+    """Сохраняет одно обследование (см. save_examinations)"""
+    return save_examinations(user, [record])[0]
+
+
+def update_examination(exam, record, version=None):
+    """
+    Правка обследования. record — запись того же вида, что в save_examinations; её поля сравниваются
+    с загруженным exam (с select_related("patient")), и только изменившиеся колонки пишутся одним
+    UPDATE вместе с version + 1. Сегменты упакованы в одну колонку и входят в тот же UPDATE.
+    Новое Ф.И.О. — UPDATE пациента (индекс поиска ведут триггеры) и новые версии его обследований.
+
+    version — версия, которую видел пользователь; если с тех пор обследование изменили,
+    StaleExamination. Возвращает имена изменённых полей, exam обновляется на месте.
+    """
+    if version is not None and version != exam.version:
+        raise StaleExamination
+    changed = {name: value for name, value in examination_fields(record).items() if getattr(exam, name) != value}
+    full_name = record.get("full_name")
+    renamed = bool(full_name) and full_name != exam.patient.full_name
+    if not changed and not renamed:
+        return []
+
+    before = tuple(getattr(exam, name) for name in STATS_FIELDS)
+    with transaction.atomic():
+        if changed:
+            updated = Examination.objects.filter(id=exam.id, version=exam.version).update(
+                **changed, version=F("version") + 1,
+            )
+            if not updated:
+                raise StaleExamination
+            for name, value in changed.items():
+                setattr(exam, name, value)
+            exam.version += 1
+            if not changed.keys().isdisjoint(STATS_FIELDS):
+                rerecord_exam(exam.patient.user_id, before, tuple(getattr(exam, name) for name in STATS_FIELDS))
+
+        if renamed:
+            search_name = normalize_name(full_name)
+            Patient.objects.filter(id=exam.patient_id).update(full_name=full_name, search_name=search_name)
+            # Ф.И.О. есть в протоколах всех обследований пациента
+            others = Examination.objects.filter(patient_id=exam.patient_id)
+            if changed:
+                others = others.exclude(id=exam.id)
+            else:
+                exam.version += 1
+            others.update(version=F("version") + 1)
+            exam.patient.full_name = full_name
+            exam.patient.search_name = search_name
+
+    return list(changed) + (["full_name"] if renamed else [])
@@ -0,0 +1,13 @@
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .models import Patient
+from .stats import unrecord_patient
+
+
+@receiver(pre_delete, sender=Patient)
+def patient_deleted(sender, instance, **kwargs):
+    # Обследования удаляются каскадом одним DELETE: их вклад в дневные сводки вычитаем заранее,
+    # одним запросом на пациента. Приёмника на Examination нет, чтобы не отключать быстрое удаление;
+    # обследования по одному удаляются только в админке, вклад там вычитает ExaminationAdmin
+    unrecord_patient(instance)
@@ -0,0 +1,81 @@
+"""
+Неизменяемый снимок обследования для генераторов отчётов.
+
+Снимок загружается одним запросом через values() (без ORM-объектов) и повторяет интерфейс
+Examination, который используют отчёты и шаблон PDF: exam.patient.full_name, exam.aorta.diameter,
+exam.segments и т.д.
+"""
+from .models import Examination, SECTIONS, Segment, unpack_segments
+
+# Все колонки обследования, включая колонки разделов и упакованные сегменты
+EXAM_FIELDS = tuple(f.attname for f in Examination._meta.concrete_fields)
+
+
+class _Frozen:
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} только для чтения")
+
+    __delattr__ = __setattr__
+
+
+class PatientSnapshot(_Frozen):
+    __slots__ = ("id", "user_id", "full_name")
+
+
+def _section_class(name, fields):
+    return type(f"{name.title()}Snapshot", (_Frozen,), {"__slots__": fields + ("is_enabled",)})
+
+
+SECTION_CLASSES = {name: _section_class(name, fields) for name, fields in SECTIONS.items()}
+
+
+class ExamSnapshot(_Frozen):
+    __slots__ = EXAM_FIELDS + ("patient", "segments") + tuple(SECTIONS)
+
+    @classmethod
+    def from_values(cls, row, patient):
+        values = {name: row[name] for name in EXAM_FIELDS}
+        for name, section_cls in SECTION_CLASSES.items():
+            values[name] = section_cls(**{
+                attr: row[f"{name}_{attr}"] for attr in section_cls.__slots__
+            })
+        values["segments"] = tuple(
+            Segment(i, state) for i, state in enumerate(unpack_segments(row["segment_states"]), start=1)
+        )
+        return cls(patient=patient, **values)
+
+    @classmethod
+    def from_exam(cls, exam):
+        """Снимок из уже загруженного объекта Examination"""
+        patient = exam.patient
+        return cls.from_values(
+            {name: getattr(exam, name) for name in EXAM_FIELDS},
+            PatientSnapshot(id=patient.id, user_id=patient.user_id, full_name=patient.full_name),
+        )
+
+    def as_dict(self):
+        """Все данные снимка в виде словаря (для ключа кэша отчётов)"""
+        data = {name: getattr(self, name) for name in EXAM_FIELDS}
+        data["full_name"] = self.patient.full_name
+        return data
+
+
+def load_snapshot(exam_id):
+    """Снимок обследования одним запросом; Examination.DoesNotExist, если его нет"""
+    row = (
+        Examination.objects.filter(id=exam_id)
+        .values(*EXAM_FIELDS, "patient__user_id", "patient__full_name")
+        .first()
+    )
+    if row is None:
+        raise Examination.DoesNotExist(f"Обследование {exam_id} не найдено")
+    patient = PatientSnapshot(
+        id=row["patient_id"], user_id=row.pop("patient__user_id"), full_name=row.pop("patient__full_name"),
+    )
+    return ExamSnapshot.from_values(row, patient)
@@ -0,0 +1,17 @@
+// Правка обследования: заполняет форму осмотра сохранёнными значениями.
+// Подключается раньше miocardial_map.js, чтобы карта сегментов взяла цвета из заполненных полей.
+(function () {
+    const data = document.getElementById("exam-initial");
+    if (!data) {
+        return;
+    }
+    const initial = JSON.parse(data.textContent);
+    for (const [name, values] of Object.entries(initial)) {
+        // Некоторые имена в форме повторяются (например, max_gradient): значения идут по порядку полей
+        document.querySelectorAll(`[name="${CSS.escape(name)}"]`).forEach((input, i) => {
+            if (i < values.length) {
+                input.value = values[i];
+            }
+        });
+    }
+})();
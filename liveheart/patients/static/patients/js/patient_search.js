@@ -0,0 +1,135 @@
+// Поиск пациентов по мере ввода: запрос к search.json через 250 мс после последней клавиши,
+// предыдущий незавершённый запрос отменяется. Без JS форма работает как обычный GET-поиск.
+(function () {
+    const DEBOUNCE_MS = 250;
+
+    const form = document.querySelector(".search-box[data-search-url]");
+    const table = document.querySelector(".patients-table");
+    if (!form || !table) {
+        return;
+    }
+    const input = form.querySelector("input[name=q]");
+    const tbody = table.querySelector("tbody");
+    const pagination = document.querySelector(".pagination");
+    const initialRows = tbody.innerHTML;
+    const initialQuery = input.value.trim();
+
+    let timer = null;
+    let controller = null;
+
+    function cell(className, content) {
+        const td = document.createElement("td");
+        if (className) {
+            td.className = className;
+        }
+        if (content instanceof Node) {
+            td.appendChild(content);
+        } else {
+            td.textContent = content;
+        }
+        return td;
+    }
+
+    function actions(patient) {
+        const fragment = document.createDocumentFragment();
+
+        const open = document.createElement("a");
+        open.href = patient.card_url;
+        open.className = "link-btn";
+        open.textContent = "Открыть карту";
+        fragment.appendChild(open);
+
+        const remove = document.createElement("form");
+        remove.method = "post";
+        remove.action = patient.delete_url;
+        remove.className = "delete-form";
+        remove.onsubmit = () => confirm("Удалить пациента без возможности восстановления?");
+        const token = document.createElement("input");
+        token.type = "hidden";
+        token.name = "csrfmiddlewaretoken";
+        token.value = table.dataset.csrfToken;
+        const button = document.createElement("button");
+        button.type = "submit";
+        button.className = "delete-btn";
+        button.textContent = "Удалить";
+        remove.append(token, button);
+        fragment.appendChild(remove);
+
+        return fragment;
+    }
+
+    function render(results) {
+        tbody.replaceChildren();
+        if (!results.length) {
+            const row = document.createElement("tr");
+            const td = cell("empty-row", "Никого не найдено.");
+            td.colSpan = 3;
+            row.appendChild(td);
+            tbody.appendChild(row);
+            return;
+        }
+        for (const patient of results) {
+            const row = document.createElement("tr");
+            let lastExam = patient.last_exam_at;
+            if (!lastExam) {
+                lastExam = document.createElement("span");
+                lastExam.className = "no-data";
+                lastExam.textContent = "Нет данных";
+            }
+            row.append(
+                cell("patient-name", patient.full_name),
+                cell("", lastExam),
+                cell("actions-cell", actions(patient)),
+            );
+            tbody.appendChild(row);
+        }
+    }
+
+    async function search(query) {
+        if (controller) {
+            controller.abort();
+        }
+        if (!query) {
+            controller = null;
+            if (initialQuery) {
+                // Страница открыта с результатами поиска: полный список — без q
+                window.location.href = form.action;
+                return;
+            }
+            tbody.innerHTML = initialRows;
+            if (pagination) {
+                pagination.hidden = false;
+            }
+            return;
+        }
+
+        controller = new AbortController();
+        const url = `${form.dataset.searchUrl}?q=${encodeURIComponent(query)}`;
+        try {
+            const response = await fetch(url, {signal: controller.signal, headers: {Accept: "application/json"}});
+            if (!response.ok) {
+                return;
+            }
+            const data = await response.json();
+            if (pagination) {
+                pagination.hidden = true;
+            }
+            render(data.results);
+        } catch (error) {
+            if (error.name !== "AbortError") {
+                throw error;
+            }
+        }
+    }
+
+    input.addEventListener("input", () => {
+        clearTimeout(timer);
+        timer = setTimeout(() => search(input.value.trim()), DEBOUNCE_MS);
+    });
+
+    form.addEventListener("submit", (event) => {
+        event.preventDefault();
+        clearTimeout(timer);
+        search(input.value.trim());
+    });
+})();
@@ -0,0 +1,180 @@
+"""
+Инкрементальные дневные сводки врача (DailyStats).
+
+Каждое обследование вносит в строку (врач, день) свой «вклад»: +1 при записи и −1 при удалении
+пациента (signals.py) или самого обследования в админке (unrecord_exams).
+Дашборд читает готовые строки за период и не трогает таблицу обследований.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DailyStats, Examination, SEGMENT_BITS, SEGMENT_COUNT
+
+COUNTER_FIELDS = (
+    "exam_count", "ef_count", "ef_sum", "ef_reduced", "ef_mid", "ef_preserved",
+    "segments_total", "segments_abnormal",
+    "av_grad_max_count", "av_grad_max_sum", "av_grad_mean_count", "av_grad_mean_sum",
+)
+
+# Колонки Examination, которые нужны для вклада в сводку
+SOURCE_FIELDS = ("exam_datetime", "created_at", "ef", "aorticvalve_grad_max", "aorticvalve_grad_mean", "segment_states")
+
+# Младший бит каждой 2-битной пары состояний сегмента
+_SEGMENT_LOW_BITS = sum(1 << (SEGMENT_BITS * i) for i in range(SEGMENT_COUNT))
+
+
+def abnormal_segments(segment_states):
+    """Число сегментов с нарушением сократимости (состояние ≠ 0)"""
+    return bin((segment_states | (segment_states >> 1)) & _SEGMENT_LOW_BITS).count("1")
+
+
+def exam_day(exam_datetime, created_at):
+    return timezone.localdate(exam_datetime or created_at or timezone.now())
+
+
+def contribution(exam_datetime, created_at, ef, aorticvalve_grad_max, aorticvalve_grad_mean, segment_states):
+    """(день, {счётчик: прибавка}) для одного обследования"""
+    deltas = {
+        "exam_count": 1,
+        "segments_total": SEGMENT_COUNT,
+        "segments_abnormal": abnormal_segments(segment_states or 0),
+    }
+    if ef is not None:
+        deltas["ef_count"] = 1
+        deltas["ef_sum"] = ef
+        bucket = "ef_reduced" if ef < 40 else "ef_mid" if ef < 50 else "ef_preserved"
+        deltas[bucket] = 1
+    if aorticvalve_grad_max is not None:
+        deltas["av_grad_max_count"] = 1
+        deltas["av_grad_max_sum"] = aorticvalve_grad_max
+    if aorticvalve_grad_mean is not None:
+        deltas["av_grad_mean_count"] = 1
+        deltas["av_grad_mean_sum"] = aorticvalve_grad_mean
+    return exam_day(exam_datetime, created_at), deltas
+
+
+def exam_contribution(exam):
+    return contribution(*(getattr(exam, name) for name in SOURCE_FIELDS))
+
+
+def _apply(user_id, day, deltas):
+    updates = {name: F(name) + value for name, value in deltas.items()}
+    if DailyStats.objects.filter(user_id=user_id, day=day).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            DailyStats.objects.create(user_id=user_id, day=day, **deltas)
+    except IntegrityError:
+        # Строку дня только что создал параллельный запрос
+        DailyStats.objects.filter(user_id=user_id, day=day).update(**updates)
+
+
+def record_exams(user_id, exams, sign=1):
+    """Добавляет (sign=1) или вычитает (sign=-1) вклад обследований одного врача"""
+    per_day = defaultdict(lambda: defaultdict(int))
+    for exam in exams:
+        day, deltas = exam_contribution(exam)
+        for name, value in deltas.items():
+            per_day[day][name] += sign * value
+
+    with transaction.atomic(savepoint=False):
+        for day, deltas in per_day.items():
+            _apply(user_id, day, deltas)
+
+
+def rerecord_exam(user_id, before, after):
+    """
+    Правка обследования: вычитает прежний вклад (before — значения SOURCE_FIELDS до правки)
+    и добавляет новый. Если день не изменился, это один UPDATE только по изменившимся счётчикам.
+    """
+    rerecord_exams([(user_id, before, after)])
+
+
+def rerecord_exams(changes):
+    """Правка многих обследований: changes — (user_id, before, after); один UPDATE на врача и день"""
+    per_day = defaultdict(lambda: defaultdict(int))
+    for user_id, before, after in changes:
+        for values, sign in ((before, -1), (after, 1)):
+            day, deltas = contribution(*values)
+            for name, value in deltas.items():
+                per_day[(user_id, day)][name] += sign * value
+
+    with transaction.atomic(savepoint=False):
+        for (user_id, day), deltas in per_day.items():
+            deltas = {name: value for name, value in deltas.items() if value}
+            if deltas:
+                _apply(user_id, day, deltas)
+
+
+def unrecord_patient(patient):
+    """Вычитает вклад всех обследований пациента: один SELECT и по UPDATE на день"""
+    exams = Examination.objects.filter(patient_id=patient.id).order_by().only(*SOURCE_FIELDS)
+    record_exams(patient.user_id, exams, sign=-1)
+
+
+def unrecord_exams(exams):
+    """Вычитает вклад обследований из queryset (любых врачей) перед их удалением"""
+    per_day = defaultdict(lambda: defaultdict(int))
+    for user_id, *values in exams.order_by().values_list("patient__user_id", *SOURCE_FIELDS):
+        day, deltas = contribution(*values)
+        for name, value in deltas.items():
+            per_day[(user_id, day)][name] -= value
+
+    with transaction.atomic(savepoint=False):
+        for (user_id, day), deltas in per_day.items():
+            _apply(user_id, day, deltas)
+
+
+def rebuild(chunk_size=5000):
+    """Полная пересборка сводок по всем обследованиям"""
+    totals = defaultdict(lambda: defaultdict(int))
+    rows = (
+        Examination.objects.order_by()
+        .values_list("patient__user_id", *SOURCE_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    for user_id, *values in rows:
+        day, deltas = contribution(*values)
+        for name, value in deltas.items():
+            totals[(user_id, day)][name] += value
+
+    with transaction.atomic():
+        DailyStats.objects.all().delete()
+        DailyStats.objects.bulk_create(
+            [DailyStats(user_id=user_id, day=day, **deltas) for (user_id, day), deltas in totals.items()],
+            batch_size=1000,
+        )
+    return len(totals)
+
+
+def dashboard_summary(user, days=30):
+    """Показатели за последние days дней: O(дней), а не O(обследований)"""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = list(DailyStats.objects.filter(user=user, day__gte=since, exam_count__gt=0).order_by("day"))
+
+    total = {name: sum(getattr(r, name) for r in rows) for name in COUNTER_FIELDS}
+
+    def mean(sum_field, count_field):
+        return round(total[sum_field] / total[count_field], 1) if total[count_field] else None
+
+    def share(part, whole):
+        return round(part / whole * 100, 1) if whole else None
+
+    return {
+        "days": days,
+        "exam_count": total["exam_count"],
+        "per_day": [(r.day, r.exam_count) for r in rows],
+        "ef_mean": mean("ef_sum", "ef_count"),
+        "ef_distribution": [
+            ("< 40 %", total["ef_reduced"], share(total["ef_reduced"], total["ef_count"])),
+            ("40–49 %", total["ef_mid"], share(total["ef_mid"], total["ef_count"])),
+            ("≥ 50 %", total["ef_preserved"], share(total["ef_preserved"], total["ef_count"])),
+        ],
+        "abnormal_segments_share": share(total["segments_abnormal"], total["segments_total"]),
+        "av_grad_max_mean": mean("av_grad_max_sum", "av_grad_max_count"),
+        "av_grad_mean_mean": mean("av_grad_mean_sum", "av_grad_mean_count"),
+    }
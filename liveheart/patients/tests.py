@@ -1,3 +1,1103 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+from datetime import timedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from docx import Document
+
+from liveheart import metrics
+from liveheart.db_router import ReadWriteRouter, read_only
+from liveheart.sqlite import sqlite_options
+
+from . import pdf_reportlab, report_cache, stats, warmup
+from .jobs import claim_jobs, run_job
+from .models import DailyStats, Examination, ExportJob, Patient, pack_segments, unpack_segments
+from .search import search_patients
+from .services import examination_fields, save_examination, save_examinations
+from .snapshot import ExamSnapshot, load_snapshot
+from .timeline import TIMELINE_METRICS, patient_timeline
+from .utils import EXPORT_FORMATS, PDF_BACKENDS, format_date, render_docx, render_pdf, render_report, report_version
+
+
+def make_record(full_name="Иванов Иван Иванович", **exam):
+    return {
+        "full_name": full_name,
+        "exam": {"exam_datetime": timezone.now(), "age": 60, "height": 175.0, "weight": 80.0, **exam},
+        "sections": {
+            "aorta": {"diameter": 32.0, "valve_opening": 18.0},
+            "leftventricle": {"edd": 50.0, "esd": 32.0, "edv": 120.0, "esv": 50.0},
+        },
+        "segments": [0] * 16 + [2],
+    }
+
+
+class SaveExaminationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+
+    def test_save_writes_all_rows(self):
+        exam = save_examination(self.user, make_record())
+
+        exam = Examination.objects.get(pk=exam.pk)
+        self.assertEqual(exam.patient.user, self.user)
+        self.assertEqual(exam.aorta.diameter, 32.0)
+        self.assertEqual(exam.leftventricle.esv, 50.0)
+        self.assertTrue(exam.pulmonaryartery.is_enabled)
+        self.assertEqual([s.state for s in exam.segments], [0] * 16 + [2])
+        self.assertEqual(exam.segments[16].segment_number, 17)
+
+    def test_query_count_is_fixed(self):
+        # SAVEPOINT + пациент + обследование (с разделами и сегментами) + сводка дня + RELEASE.
+        # Первое обследование дня ещё создаёт строку сводки (SAVEPOINT + INSERT + RELEASE).
+        with self.assertNumQueries(8):
+            save_examination(self.user, make_record())
+
+        # Пачка из нескольких обследований стоит столько же запросов
+        with self.assertNumQueries(5):
+            save_examinations(self.user, [make_record(f"Пациент {i}") for i in range(5)])
+        self.assertEqual(Examination.objects.count(), 6)
+
+    def test_unknown_section_is_rejected(self):
+        with self.assertRaises(ValueError):
+            save_examination(self.user, {"full_name": "X", "sections": {"heart": {"x": 1}}})
+
+    def test_new_patient_view_saves_exam(self):
+        self.client.force_login(self.user)
+        data = {"full_name": "Петров Пётр", "age": "50", "kdr": "48,5", "segment_3": "1"}
+        response = self.client.post(reverse("patients:new_patient"), data)
+
+        self.assertRedirects(response, reverse("accounts:dashboard"), fetch_redirect_response=False)
+        exam = Examination.objects.get(patient__full_name="Петров Пётр")
+        self.assertEqual(exam.leftventricle.edd, 48.5)
+        self.assertEqual(exam.segments[2].state, 1)
+
+
+class CompactStorageTests(TestCase):
+    def test_segments_round_trip(self):
+        states = [i % 4 for i in range(17)]
+        self.assertEqual(unpack_segments(pack_segments(states)), states)
+        self.assertLess(pack_segments([3] * 17), 2 ** 34)
+
+    def test_section_accessor_reads_and_writes_columns(self):
+        exam = Examination(aorta_diameter=31.0)
+        self.assertEqual(exam.aorta.diameter, 31.0)
+        exam.leftventricle.edv = 110.0
+        self.assertEqual(exam.leftventricle_edv, 110.0)
+        self.assertTrue(exam.pulmonaryartery.is_enabled)
+        with self.assertRaises(AttributeError):
+            exam.aorta.tapse
+
+
+
+class ExamSnapshotTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+        self.exam = save_examination(self.user, make_record())
+
+    def test_all_exporters_render_from_one_query(self):
+        from .utils import EXPORT_FORMATS
+
+        with self.assertNumQueries(1):
+            exam = load_snapshot(self.exam.id)
+            for renderer, _ in EXPORT_FORMATS.values():
+                renderer(exam)
+
+    def test_snapshot_matches_model_and_is_immutable(self):
+        snap = load_snapshot(self.exam.id)
+        self.assertEqual(snap.patient.full_name, "Иванов Иван Иванович")
+        self.assertEqual(snap.patient.user_id, self.user.id)
+        self.assertEqual(snap.aorta.diameter, 32.0)
+        self.assertEqual(snap.segments[16].state, 2)
+        self.assertEqual(snap.as_dict(), ExamSnapshot.from_exam(Examination.objects.get(id=self.exam.id)).as_dict())
+
+        with self.assertRaises(AttributeError):
+            snap.age = 1
+        with self.assertRaises(AttributeError):
+            snap.aorta.diameter = 1
+        self.assertFalse(hasattr(snap, "__dict__"))
+
+
+class PatientHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+        self.client.force_login(self.user)
+
+    def test_query_count_does_not_depend_on_patient_count(self):
+        save_examinations(self.user, [make_record(f"Пациент {i:03}") for i in range(3)])
+        with self.assertNumQueries(3):
+            self.client.get(reverse("patients:history"))
+
+        save_examinations(self.user, [make_record(f"Пациент {i:03}") for i in range(3, 40)])
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("patients:history"))
+        self.assertContains(response, "Пациент 039")
+
+    def test_keyset_pagination(self):
+        from . import views
+
+        save_examinations(self.user, [make_record(f"Пациент {i:03}") for i in range(views.PATIENTS_PAGE_SIZE + 5)])
+
+        first = self.client.get(reverse("patients:history"))
+        self.assertEqual(len(first.context["patients"]), views.PATIENTS_PAGE_SIZE)
+        second = self.client.get(reverse("patients:history"), {"after": first.context["next_cursor"]})
+
+        names = [p.full_name for p in second.context["patients"]]
+        self.assertEqual(names[0], f"Пациент {views.PATIENTS_PAGE_SIZE:03}")
+        self.assertEqual(len(names), 5)
+        self.assertIsNone(second.context["next_cursor"])
+        self.assertIsNotNone(second.context["patients"][0].last_exam_at)
+
+
+class PatientCardTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+        self.client.force_login(self.user)
+        self.patient = save_examination(self.user, make_record(
+            "Петров", exam_datetime=timezone.now() - timedelta(days=30),
+        )).patient
+
+    def add_exams(self, count, **sections):
+        start = timezone.now() - timedelta(days=29)
+        Examination.objects.bulk_create([
+            Examination(patient=self.patient, **examination_fields({
+                "exam": {"exam_datetime": start + timedelta(hours=i)},
+                "sections": sections,
+            }))
+            for i in range(count)
+        ])
+
+    def test_query_count_does_not_depend_on_exam_count(self):
+        url = reverse("patients:patient_card", args=[self.patient.id])
+        with self.assertNumQueries(4):
+            self.client.get(url)
+
+        self.add_exams(200)
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context["timeline"]), 201)
+
+    def test_deltas_against_previous_exam(self):
+        Examination.objects.filter(patient=self.patient).update(
+            leftventricle_edv=120, leftventricle_esv=60, ef=50, tricuspidvalve_tapse=20,
+        )
+        self.add_exams(1, leftventricle={"edv": 120, "esv": 72}, tricuspidvalve={"tapse": 17})
+
+        first, second = patient_timeline(self.patient)
+        metrics = dict(zip([field for _, field, _ in TIMELINE_METRICS], second["metrics"]))
+        self.assertEqual(metrics["ef"], (40.0, -10.0))
+        self.assertEqual(metrics["tricuspidvalve_tapse"], (17, -3))
+        self.assertEqual(first["metrics"][0], (50, None))
+
+        data = self.client.get(reverse("patients:patient_timeline", args=[self.patient.id])).json()
+        self.assertEqual([value for _, value in data["series"]["ef"]], [50, 40.0])
+
+    def test_foreign_patient_is_hidden(self):
+        other = User.objects.create_user("other", "other@example.com", "pass")
+        self.client.force_login(other)
+        response = self.client.get(reverse("patients:patient_card", args=[self.patient.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class DocxTemplateTests(TestCase):
+    def setUp(self):
+        record = make_record("Щукин")
+        record["sections"]["aorticvalve"] = {"is_enabled": False}
+        self.exam = ExamSnapshot.from_exam(Examination(
+            patient=Patient(id=1, user_id=1, full_name="Щукин"), **examination_fields(record),
+        ))
+
+    def read(self, content):
+        doc = Document(io.BytesIO(content))
+        return [p.text for p in doc.paragraphs], [[c.text for c in row.cells] for t in doc.tables for row in t.rows]
+
+    def test_values_filled_and_disabled_sections_removed(self):
+        paragraphs, cells = self.read(render_docx(self.exam))
+
+        self.assertIn("Ф.И.О.: Щукин\t\tДата: " + self.exam.exam_datetime.strftime("%d.%m.%Y"), paragraphs)
+        self.assertNotIn("АОРТАЛЬНЫЙ КЛАПАН", paragraphs)
+        self.assertIn(["Диаметр основания:", "32.0 мм"], cells)
+        self.assertIn(["Фракция выброса (Simpson):", "58.3 %"], cells)
+        self.assertIn("Выявлены зоны нарушения сократимости: Сегмент 17: Акинез", paragraphs)
+        self.assertFalse(any("{{" in text for text in paragraphs))
+
+    def test_custom_letterhead(self):
+        # Бланк, отредактированный в Word: подстановка разбита на несколько фрагментов
+        doc = Document()
+        doc.add_paragraph("Клиника «Сердце»")
+        p = doc.add_paragraph("Пациент: {{ full")
+        p.add_run("_name }}, ФВ {{ ef }}, {{ unknown }}")
+        with tempfile.NamedTemporaryFile(suffix=".docx") as f:
+            doc.save(f.name)
+            with override_settings(REPORT_DOCX_TEMPLATE=f.name):
+                paragraphs, _ = self.read(render_docx(self.exam))
+                letterhead_version = report_version("docx")
+
+        self.assertEqual(paragraphs, ["Клиника «Сердце»", "Пациент: Щукин, ФВ 58.3 %, {{ unknown }}"])
+        self.assertNotEqual(letterhead_version, report_version("docx"))
+
+
+class PdfBackendTests(TestCase):
+    def test_backends_render_pdf(self):
+        exam = ExamSnapshot.from_exam(Examination(
+            patient=Patient(id=1, user_id=1, full_name="Щукин"), **examination_fields(make_record()),
+        ))
+        for backend in PDF_BACKENDS:
+            with self.subTest(backend=backend), override_settings(REPORT_PDF_BACKEND=backend):
+                self.assertTrue(render_pdf(exam).startswith(b"%PDF"))
+
+    @override_settings(TIME_ZONE="Europe/Moscow")
+    def test_backends_print_local_date(self):
+        from datetime import datetime, timezone as dt_timezone
+
+        from pypdf import PdfReader
+
+        # 22:30 UTC — уже следующий день по Москве
+        record = make_record(exam_datetime=datetime(2024, 3, 1, 22, 30, tzinfo=dt_timezone.utc))
+        exam = ExamSnapshot.from_exam(Examination(
+            patient=Patient(id=1, user_id=1, full_name="Щукин"), **examination_fields(record),
+        ))
+        for backend in PDF_BACKENDS:
+            with self.subTest(backend=backend), override_settings(REPORT_PDF_BACKEND=backend):
+                text = PdfReader(io.BytesIO(render_pdf(exam))).pages[0].extract_text()
+                self.assertIn("02.03.2024", text)
+        # DOCX и XLSX — та же дата
+        self.assertEqual(format_date(exam.exam_datetime), "02.03.2024")
+
+    def test_fonts_registered_once(self):
+        self.assertIs(pdf_reportlab.styles(), pdf_reportlab.styles())
+        self.assertEqual(pdf_reportlab.register_fonts.cache_info().misses, 1)
+
+    def test_missing_cyrillic_font_fails_loudly(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        for func in (pdf_reportlab.register_fonts, pdf_reportlab.styles):
+            func.cache_clear()
+            self.addCleanup(func.cache_clear)
+        with override_settings(REPORT_PDF_FONT="/nonexistent/font.ttf"), self.assertRaises(ImproperlyConfigured):
+            pdf_reportlab.styles()
+
+
+@override_settings(WARMUP_MODE="sync")
+class WarmupTests(TestCase):
+    def setUp(self):
+        warmup.reset()
+        self.addCleanup(warmup.reset)
+
+    def test_ready_only_after_warm_up(self):
+        response = self.client.get(reverse("readiness"))
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()["ready"])
+
+        steps = warmup.warm_up()
+        self.assertEqual(list(steps), [name for name, _ in warmup.WARMUP_STEPS])
+        self.assertIs(warmup.warm_up(), steps)
+
+        response = self.client.get(reverse("readiness"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()["steps_ms"]), set(steps))
+
+    def test_warm_up_does_not_count_exports(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(METRICS_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        metrics.reset()
+
+        warmup.warm_up()
+        self.assertEqual((metrics.EXPORT_SECONDS.values, metrics.EXPORT_BYTES.values), ({}, {}))
+
+    @override_settings(REPORT_PDF_BACKEND="reportlab", REPORT_PDF_FONT="/nonexistent/font.ttf")
+    def test_not_ready_without_cyrillic_font(self):
+        for func in (pdf_reportlab.register_fonts, pdf_reportlab.styles):
+            func.cache_clear()
+            self.addCleanup(func.cache_clear)
+
+        with self.assertLogs("patients.warmup", "ERROR"):
+            warmup.warm_up()
+        response = self.client.get(reverse("readiness"))
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("ImproperlyConfigured", response.json()["error"])
+
+    @override_settings(WARMUP_MODE="off")
+    def test_ready_without_warm_up_when_disabled(self):
+        self.assertEqual(self.client.get(reverse("readiness")).status_code, 200)
+
+
+class TempStorageMixin:
+    """Файлы отчётов и кэша пишутся во временный каталог"""
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(EXPORT_ROOT=f"{tmp.name}/exports", REPORT_CACHE_DIR=f"{tmp.name}/cache")
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class ExportJobTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+        self.client.force_login(self.user)
+
+    def post_protocol(self, export_type):
+        return self.client.post(reverse("patients:new_patient"), {"full_name": "Сидоров", "export_type": export_type})
+
+    def test_save_only_enqueues(self):
+        response = self.post_protocol("docx")
+
+        job = ExportJob.objects.get()
+        self.assertRedirects(response, reverse("patients:export_status", args=[job.id]))
+        self.assertEqual(job.status, ExportJob.PENDING)
+
+        self.assertEqual(claim_jobs(5), [job.id])
+        self.assertEqual(claim_jobs(5), [])
+        self.assertEqual(run_job(job.id), ExportJob.DONE)
+
+        status = self.client.get(reverse("patients:export_status_json", args=[job.id])).json()
+        self.assertEqual(status["status"], ExportJob.DONE)
+        download = self.client.get(status["download_url"])
+        self.assertEqual(download["Content-Type"], EXPORT_FORMATS["docx"][1])
+        self.assertTrue(b"".join(download.streaming_content).startswith(b"PK"))
+
+    def test_requeue_only_jobs_of_dead_workers(self):
+        from .jobs import heartbeat, requeue_stale_jobs
+
+        for _ in range(2):
+            self.post_protocol("docx")
+        alive, dead = ExportJob.objects.order_by("id").values_list("id", flat=True)
+        self.assertEqual(claim_jobs(1, "host:1"), [alive])
+        self.assertEqual(claim_jobs(1, "host:2"), [dead])
+
+        # Запуск нового воркера не отбирает задания, которые только что взяли живые воркеры
+        self.assertEqual(requeue_stale_jobs(stale_after=60), 0)
+
+        ExportJob.objects.update(heartbeat_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(heartbeat([alive], "host:1"), 1)
+        self.assertEqual(heartbeat([dead], "host:1"), 0)  # чужое задание не продлевается
+        self.assertEqual(requeue_stale_jobs(stale_after=60), 1)
+
+        job = ExportJob.objects.get(id=dead)
+        self.assertEqual((job.status, job.worker), (ExportJob.PENDING, ""))
+        self.assertEqual(ExportJob.objects.get(id=alive).status, ExportJob.RUNNING)
+        self.assertEqual(claim_jobs(5, "host:1"), [dead])
+
+    @override_settings(EXPORT_JOBS_EAGER=True)
+    def test_eager_mode_renders_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.post_protocol("xlsx")
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(ExportJob.objects.get().status, ExportJob.DONE)
+
+    def test_other_doctor_cannot_download(self):
+        self.post_protocol("pdf")
+        job = ExportJob.objects.get()
+        run_job(job.id)
+
+        other = User.objects.create_user("other", "other@example.com", "pass")
+        self.client.force_login(other)
+        response = self.client.get(reverse("patients:export_download", args=[job.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ReportCacheTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(METRICS_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        metrics.reset()
+        self.user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+        self.exam = save_examination(self.user, make_record())
+
+    def test_hit_after_miss_and_invalidation_on_change(self):
+        first = report_cache.get_or_render(load_snapshot(self.exam.id), "xlsx")
+        second = report_cache.get_or_render(load_snapshot(self.exam.id), "xlsx")
+        self.assertEqual(first, second)
+        stats = report_cache.cache_stats()
+        self.assertEqual((stats["misses"], stats["hits"]), (1, 1))
+
+        # Изменение строки раздела даёт новый ключ
+        Examination.objects.filter(id=self.exam.id).update(aorta_diameter=40.0)
+        report_cache.get_or_render(load_snapshot(self.exam.id), "xlsx")
+
+        stats = report_cache.cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["renders"], stats["entries"]), (1, 2, 2, 2))
+
+    def test_miss_under_limit_does_not_scan_cache(self):
+        from unittest import mock
+
+        exam = load_snapshot(self.exam.id)
+        report_cache.get_or_render(exam, "docx")
+        # Размер уже учтён: следующие промахи только прибавляют к нему, каталог не обходят
+        with mock.patch.object(report_cache, "_entries", wraps=report_cache._entries) as entries:
+            report_cache.get_or_render(exam, "xlsx")
+        entries.assert_not_called()
+        self.assertEqual(int(report_cache._size_path().read_text()), report_cache.cache_stats()["bytes"])
+
+        with override_settings(REPORT_CACHE_MAX_BYTES=1):
+            report_cache.get_or_render(exam, "pdf")
+        self.assertEqual((report_cache.cache_stats()["entries"], int(report_cache._size_path().read_text())), (0, 0))
+
+    def test_report_built_while_waiting_for_lock_is_a_hit(self):
+        from unittest import mock
+
+        exam = load_snapshot(self.exam.id)
+        content = report_cache.get_or_render(exam, "xlsx")
+        # Первое чтение промахнулось, а под блокировкой отчёт уже собран соседним процессом
+        with mock.patch.object(report_cache, "_read", side_effect=[None, content]), \
+                mock.patch.object(report_cache, "render_report") as render:
+            self.assertEqual(report_cache.get_or_render(exam, "xlsx"), content)
+        render.assert_not_called()
+        stats = report_cache.cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["renders"]), (1, 1, 1))
+
+    def test_pdf_backend_is_part_of_key(self):
+        exam = load_snapshot(self.exam.id)
+        with override_settings(REPORT_PDF_BACKEND="reportlab"):
+            reportlab_key = report_cache.cache_key(exam, "pdf")
+        with override_settings(REPORT_PDF_BACKEND="xhtml2pdf"):
+            self.assertNotEqual(report_cache.cache_key(exam, "pdf"), reportlab_key)
+
+    def test_lru_eviction(self):
+        exam = load_snapshot(self.exam.id)
+        report_cache.get_or_render(exam, "docx")
+        report_cache.get_or_render(exam, "xlsx")
+
+        self.assertEqual(report_cache.evict(max_bytes=1), 2)
+        self.assertEqual(report_cache.cache_stats()["entries"], 0)
+
+    def test_exam_report_view_is_scoped_to_owner(self):
+        self.client.force_login(self.user)
+        url = reverse("patients:exam_report", args=[self.exam.id, "docx"])
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        other = User.objects.create_user("other", "other@example.com", "pass")
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class RegisterExportTests(TestCase):
+    def test_register_streams_all_exams_of_doctor(self):
+        import openpyxl
+
+        user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+        other = User.objects.create_user("other", "other@example.com", "pass")
+        save_examinations(user, [make_record(f"Пациент {i}") for i in range(3)])
+        save_examinations(other, [make_record("Чужой")])
+
+        self.client.force_login(user)
+        response = self.client.get(reverse("patients:register_xlsx"))
+        self.assertTrue(response.streaming)
+
+        ws = openpyxl.load_workbook(io.BytesIO(b"".join(response.streaming_content))).active
+        rows = list(ws.iter_rows(values_only=True))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1][-2], round((120 - 50) / 120 * 100, 1))
+        self.assertNotIn("Чужой", [r[1] for r in rows])
+        self.assertEqual(rows[0][:2], ("Дата", "Ф.И.О."))
+        self.assertIsNone(rows[1][rows[0].index("TAPSE, мм")])
+
+    def test_first_bytes_before_all_rows_are_read(self):
+        from unittest import mock
+
+        import openpyxl
+
+        from . import register
+
+        user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+        save_examinations(user, [make_record(f"Пациент {i} <&>") for i in range(5)])
+
+        with mock.patch.object(register, "CHUNK_SIZE", 2):
+            blocks = register.stream_register(user)
+            # Первый кусок архива уходит после первой порции из 2 строк, а не после всей книги
+            first = next(blocks)
+            data = first + b"".join(blocks)
+        self.assertTrue(first.startswith(b"PK"))
+
+        ws = openpyxl.load_workbook(io.BytesIO(data)).active
+        names = [row[1] for row in ws.iter_rows(min_row=2, values_only=True)]
+        self.assertEqual(names, [f"Пациент {i} <&>" for i in range(5)])
+
+
+@override_settings(BATCH_EXPORT_WORKERS=0)
+class BatchExportTests(TempStorageMixin, TestCase):
+    def test_batch_zip_contains_only_own_exams(self):
+        import zipfile
+
+        user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+        other = User.objects.create_user("other", "other@example.com", "pass")
+        exams = save_examinations(user, [make_record(f"Пациент {i}") for i in range(3)])
+        foreign = save_examination(other, make_record("Чужой"))
+
+        self.client.force_login(user)
+        response = self.client.post(reverse("patients:batch_export"), {
+            "format": "docx",
+            "exam_ids": [e.id for e in exams] + [foreign.id],
+        })
+        self.assertEqual(response["Content-Type"], "application/zip")
+
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(
+            sorted(archive.namelist()),
+            sorted(f"{e.id}_Echo_Пациент {i}.docx" for i, e in enumerate(exams)),
+        )
+        self.assertIsNone(archive.testzip())
+
+    @override_settings(BATCH_EXPORT_WORKERS=2)
+    def test_web_requests_share_one_pool(self):
+        from . import worker_pool
+
+        # Процессы пула запускаются только при первой задаче, здесь их нет
+        pool = worker_pool.shared_pool()
+        self.addCleanup(worker_pool.discard_shared_pool, pool)
+        self.assertIs(worker_pool.shared_pool(), pool)
+
+        worker_pool.discard_shared_pool(pool)
+        replacement = worker_pool.shared_pool()
+        self.addCleanup(worker_pool.discard_shared_pool, replacement)
+        self.assertIsNot(replacement, pool)
+
+
+class IndicesTests(TestCase):
+    def test_scalar_values(self):
+        from .indices import compute_indices
+
+        result = compute_indices(
+            height=180, weight=81, hr=60, leftventricle_edd=50, leftventricle_esd=30,
+            leftventricle_edv=120, leftventricle_esv=48, segment_states=pack_segments([0] * 16 + [2]),
+        )
+        self.assertEqual(result, {
+            "bmi": 25.0, "bsa": 2.01, "fs": 40.0, "sv": 72.0, "ef": 60.0, "co": 4.32, "ci": 2.15,
+            "wmsi": round(19 / 17, 2),
+        })
+        self.assertIsNone(compute_indices()["ef"])
+
+    def test_batch_matches_scalar(self):
+        import random
+
+        import numpy as np
+
+        from .bench import synthetic_record
+        from .indices import INDEX_FIELDS, SOURCE_FIELDS, compute_indices, compute_indices_batch, rows_to_columns
+        from .services import examination_fields
+
+        rng = random.Random(1)
+        rows = []
+        for i in range(50):
+            fields = examination_fields(synthetic_record(rng, i))
+            if i % 5 == 0:
+                fields["height"] = None
+                fields["leftventricle_edv"] = None
+            rows.append(tuple(fields.get(name) for name in SOURCE_FIELDS))
+
+        # Значения на границе округления: СВ = 21 * 75 / 1000 = 1.575
+        rows.append(tuple({"leftventricle_edv": 60.0, "leftventricle_esv": 39.0, "hr": 75, "segment_states": 0}.get(name)
+                          for name in SOURCE_FIELDS))
+
+        batch = compute_indices_batch(rows_to_columns(rows))
+        for i, row in enumerate(rows):
+            scalar = compute_indices(**dict(zip(SOURCE_FIELDS, row)))
+            for name in INDEX_FIELDS:
+                expected = np.nan if scalar[name] is None else scalar[name]
+                np.testing.assert_equal(batch[name][i], expected, err_msg=name)
+        self.assertEqual(scalar["co"], batch["co"][-1])
+
+    def test_recompute_keeps_rows_on_rounding_boundary(self):
+        from django.core.management import call_command
+
+        user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+        # СВ = 21 * 75 / 1000 = 1.575: round() и np.round округляют по-разному
+        record = make_record("Петров", hr=75)
+        record["sections"]["leftventricle"] = {"edv": 60.0, "esv": 39.0}
+        exam = save_examination(user, record)
+
+        call_command("recompute_indices", chunk=1, stdout=io.StringIO())
+        self.assertEqual(Examination.objects.get(id=exam.id).version, exam.version)
+
+    def test_server_ignores_posted_bmi_and_recompute_command_fills_old_rows(self):
+        from django.core.management import call_command
+
+        user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+        self.client.force_login(user)
+        self.client.post(reverse("patients:new_patient"), {
+            "full_name": "Петров", "height": "200", "weight": "100", "bmi": "99", "kdo": "100", "kco": "40",
+        })
+        exam = Examination.objects.get()
+        self.assertEqual((exam.bmi, exam.bsa, exam.ef), (25.0, 2.36, 60.0))
+
+        Examination.objects.update(bmi=None, ef=None, wmsi=None)
+        other = save_examination(user, make_record("Сидоров"))
+        call_command("recompute_indices", chunk=1, stdout=io.StringIO())
+        exam.refresh_from_db()
+        self.assertEqual((exam.bmi, exam.ef, exam.wmsi), (25.0, 60.0, 1.0))
+        # Версия (и ETag отчётов) меняется только у строк, где показатели пересчитались иначе
+        self.assertEqual(exam.version, other.version + 1)
+        self.assertEqual(Examination.objects.get(id=other.id).version, other.version)
+
+
+class DailyStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+
+    def snapshot(self):
+        return sorted(DailyStats.objects.values_list("day", *stats.COUNTER_FIELDS))
+
+    def rounded_snapshot(self):
+        # Суммы после вычитания отличаются от пересборки в последних знаках
+        return [(day, *(round(value, 6) for value in values)) for day, *values in self.snapshot()]
+
+    def test_incremental_matches_rebuild(self):
+        from datetime import timedelta
+
+        now = timezone.now()
+        records = [make_record(f"Пациент {i}", exam_datetime=now - timedelta(days=i % 3)) for i in range(7)]
+        records[0]["sections"]["aorticvalve"] = {"grad_max": 30.0, "grad_mean": 18.0}
+        records[1]["sections"]["leftventricle"] = {"edv": 100.0, "esv": 70.0}
+        save_examinations(self.user, records[:4])
+        save_examinations(self.user, records[4:])
+        Patient.objects.filter(full_name="Пациент 5").delete()
+
+        incremental = self.snapshot()
+        stats.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
+
+        summary = stats.dashboard_summary(self.user)
+        self.assertEqual(summary["exam_count"], 6)
+        self.assertEqual(summary["ef_distribution"][0][1], 1)
+        self.assertEqual(summary["av_grad_max_mean"], 30.0)
+        self.assertEqual(summary["abnormal_segments_share"], round(6 / (6 * 17) * 100, 1))
+
+    def test_patient_delete_subtracts_exams_in_one_pass(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        def add_patient(name, exams):
+            patient = save_examination(self.user, make_record(name)).patient
+            Examination.objects.bulk_create([
+                Examination(patient=patient, **examination_fields(make_record(name))) for _ in range(exams - 1)
+            ])
+            stats.rebuild()
+            return patient
+
+        add_patient("Остаётся", 2)
+        counts = []
+        for name, exams in (("Один", 1), ("Много", 30)):
+            patient = add_patient(name, exams)
+            with CaptureQueriesContext(connection) as ctx:
+                Patient.objects.get(id=patient.id).delete()
+            # Число запросов не зависит от числа обследований: ни UPDATE, ни DELETE на каждое
+            counts.append(len(ctx.captured_queries))
+            incremental = self.rounded_snapshot()
+            stats.rebuild()
+            self.assertEqual(self.rounded_snapshot(), incremental)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_admin_exam_delete_subtracts_exams(self):
+        from datetime import timedelta
+
+        now = timezone.now()
+        save_examinations(self.user, [
+            make_record(f"Пациент {i}", exam_datetime=now - timedelta(days=i % 2)) for i in range(5)
+        ])
+        ids = list(Examination.objects.order_by("id").values_list("id", flat=True))
+        admin = User.objects.create_superuser("admin", "admin@example.com", "pass")
+        self.client.force_login(admin)
+
+        self.client.post(reverse("admin:patients_examination_delete", args=[ids[0]]), {"post": "yes"})
+        self.client.post(reverse("admin:patients_examination_changelist"), {
+            "action": "delete_selected", "_selected_action": ids[1:3], "post": "yes",
+        })
+
+        self.assertEqual(Examination.objects.count(), 2)
+        incremental = self.rounded_snapshot()
+        stats.rebuild()
+        self.assertEqual(self.rounded_snapshot(), incremental)
+
+    def test_recompute_indices_keeps_stats(self):
+        from django.core.management import call_command
+
+        save_examinations(self.user, [make_record(f"Пациент {i}") for i in range(4)])
+        # Старые строки: ФВ не посчитана или посчитана по прежней формуле
+        ids = list(Examination.objects.order_by("id").values_list("id", flat=True))
+        Examination.objects.filter(id=ids[0]).update(ef=None)
+        Examination.objects.filter(id=ids[1]).update(ef=35.0)
+        stats.rebuild()
+
+        call_command("recompute_indices", chunk=3, stdout=io.StringIO())
+        incremental = self.snapshot()
+        stats.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
+        self.assertEqual(stats.dashboard_summary(self.user)["ef_distribution"][0][1], 0)
+
+    def test_abnormal_segments(self):
+        self.assertEqual(stats.abnormal_segments(pack_segments([0, 1, 2, 3] + [0] * 13)), 3)
+        self.assertEqual(stats.abnormal_segments(pack_segments([3] * 17)), 17)
+
+    def test_dashboard_reads_only_summary_rows(self):
+        save_examinations(self.user, [make_record(f"Пациент {i}") for i in range(20)])
+        self.client.force_login(self.user)
+        session = self.client.session
+        session["is_2fa_verified"] = True
+        session.save()
+
+        # сессия + пользователь + сводки
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("accounts:dashboard"))
+        self.assertContains(response, "Обследований:</strong> 20")
+
+
+class SqliteProfileTests(TestCase):
+    def test_pragmas_applied_to_connection(self):
+        from django.db import connection
+
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute("PRAGMA cache_size")
+            self.assertLess(cursor.fetchone()[0], 0)  # размер в КиБ
+        self.assertEqual(connection.transaction_mode, "IMMEDIATE")
+
+    def test_read_only_options(self):
+        options = sqlite_options(read_only=True)
+        self.assertIn("PRAGMA query_only=ON", options["init_command"])
+        self.assertNotIn("transaction_mode", options)
+
+    def test_router_sends_read_only_views_to_read_connection(self):
+        router = ReadWriteRouter()
+        self.assertEqual(router.db_for_read(Patient), "default")
+        with read_only():
+            self.assertEqual(router.db_for_read(Patient), "read")
+            self.assertEqual(router.db_for_write(Patient), "default")
+        self.assertFalse(router.allow_migrate("read", "patients"))
+
+
+class ExamEditTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+        self.exam = save_examination(self.user, make_record())
+        self.client.force_login(self.user)
+        self.url = reverse("patients:exam_edit", args=[self.exam.id])
+
+    def form(self, **changes):
+        from .views import exam_form_initial
+
+        exam = Examination.objects.select_related("patient").get(id=self.exam.id)
+        data = {**exam_form_initial(exam), "version": exam.version}
+        data.update(changes)
+        return data
+
+    def test_one_value_is_one_update(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        data = self.form(diametr_aorta="33.5")
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.url, data)
+        updates = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertRedirects(response, reverse("patients:patient_card", args=[self.exam.patient_id]))
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"aorta_diameter"', updates[0])
+        self.assertNotIn('"leftventricle_edd"', updates[0])
+
+        exam = Examination.objects.get(id=self.exam.id)
+        self.assertEqual(exam.aorta_diameter, 33.5)
+        self.assertEqual(exam.version, 2)
+        self.assertEqual(exam.exam_datetime, self.exam.exam_datetime)
+
+    def test_unchanged_form_writes_nothing(self):
+        self.client.post(self.url, self.form())
+        self.assertEqual(Examination.objects.get(id=self.exam.id).version, 1)
+
+    def test_edit_keeps_daily_stats_consistent(self):
+        # КДО 120 -> 150: ФВ пересчитывается на сервере, сводка дня сдвигается на разницу
+        self.client.post(self.url, self.form(kdo="150", segment_1="3"))
+        exam = Examination.objects.get(id=self.exam.id)
+        self.assertEqual(exam.ef, round((150 - 50) / 150 * 100, 1))
+        self.assertEqual(unpack_segments(exam.segment_states)[0], 3)
+
+        incremental = list(DailyStats.objects.values("day", "exam_count", "ef_sum", "ef_preserved", "segments_abnormal"))
+        stats.rebuild()
+        rebuilt = list(DailyStats.objects.values("day", "exam_count", "ef_sum", "ef_preserved", "segments_abnormal"))
+        self.assertEqual(incremental, rebuilt)
+
+    def test_stale_version_is_rejected(self):
+        response = self.client.post(self.url, self.form(diametr_aorta="40", version=0))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Examination.objects.get(id=self.exam.id).aorta_diameter, 32.0)
+
+    def test_rename_updates_search_and_report_etag(self):
+        report_url = reverse("patients:exam_report", args=[self.exam.id, "xlsx"])
+        etag = self.client.get(report_url)["ETag"]
+        self.assertEqual(self.client.get(report_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.post(self.url, self.form(full_name="Сидоров Семён"))
+        self.assertEqual(Patient.objects.get(id=self.exam.patient_id).search_name, "сидоров семен")
+        self.assertEqual([p.id for p in search_patients(self.user, "сидор")], [self.exam.patient_id])
+        self.assertEqual(Examination.objects.get(id=self.exam.id).version, 2)
+        self.assertEqual(self.client.get(report_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_other_doctor_cannot_edit(self):
+        other = User.objects.create_user("other", "other@example.com", "pass")
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+@override_settings(RESEARCH_PSEUDONYM_KEY="research-key")
+class ResearchExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+        save_examinations(self.user, [make_record("Иванов Иван"), make_record("Петров Пётр", age=None)])
+        # Повторное обследование того же пациента
+        Examination.objects.create(patient=Patient.objects.get(full_name="Иванов Иван"), exam_datetime=timezone.now())
+
+    def export(self, fmt):
+        staff = User.objects.get_or_create(username="staff", defaults={"is_staff": True})[0]
+        self.client.force_login(staff)
+        response = self.client.get(reverse("patients:research_export", args=[fmt]))
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content)
+
+    def test_csv_is_pseudonymized(self):
+        import csv
+
+        content = self.export("csv").decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 3)
+        self.assertNotIn("Иванов", content)
+        self.assertNotIn("full_name", rows[0])
+        # У повторного обследования тот же псевдоним пациента, у другого пациента — свой
+        self.assertEqual(rows[0]["subject"], rows[2]["subject"])
+        self.assertNotEqual(rows[0]["subject"], rows[1]["subject"])
+        self.assertEqual(rows[1]["age"], "")
+        self.assertEqual(rows[0]["segment_17"], "2")
+        self.assertEqual(rows[0]["leftventricle_edv"], "120.0")
+
+    def test_ndjson_and_npz_have_same_columns(self):
+        import json
+
+        import numpy as np
+
+        from .research import RESEARCH_COLUMNS
+
+        lines = self.export("ndjson").decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        first = json.loads(lines[0])
+        self.assertEqual(list(first), [column.name for column in RESEARCH_COLUMNS])
+
+        data = np.load(io.BytesIO(self.export("npz")))
+        self.assertEqual(data["ef"].shape, (3,))
+        self.assertEqual(data["subject"][0].decode(), first["subject"])
+        self.assertTrue(np.isnan(data["age"][1]))
+        self.assertEqual(data["segment_17"].dtype, np.uint8)
+
+    def test_pseudonyms_depend_on_key(self):
+        first = self.export("csv")
+        with override_settings(RESEARCH_PSEUDONYM_KEY="other-key"):
+            second = self.export("csv")
+        self.assertNotEqual(first, second)
+
+    def test_staff_only(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("patients:research_export", args=["csv"]))
+        self.assertEqual(response.status_code, 302)
+
+    def test_refused_without_dedicated_key(self):
+        from django.core.management import CommandError, call_command
+
+        staff = User.objects.create_user("staff", is_staff=True)
+        self.client.force_login(staff)
+        for key in ("", settings.SECRET_KEY):
+            with self.subTest(key=key), override_settings(RESEARCH_PSEUDONYM_KEY=key):
+                response = self.client.get(reverse("patients:research_export", args=["csv"]))
+                self.assertEqual(response.status_code, 503)
+                self.assertIn("RESEARCH_PSEUDONYM_KEY", response.content.decode())
+
+                with tempfile.TemporaryDirectory() as tmp:
+                    output = f"{tmp}/research.csv"
+                    with self.assertRaisesMessage(CommandError, "RESEARCH_PSEUDONYM_KEY"):
+                        call_command("research_export", output=output, stderr=io.StringIO())
+                    self.assertFalse(os.path.exists(output))
+
+
+class GenerateDataTests(TestCase):
+    def test_doctors_patients_exams(self):
+        from django.core.management import call_command
+
+        call_command("generate_data", doctors=2, patients=3, exams=2, prefix="gen", stdout=io.StringIO())
+
+        self.assertEqual(User.objects.filter(username__startswith="gen-").count(), 2)
+        self.assertEqual(Patient.objects.filter(user__username="gen-001").count(), 3)
+        self.assertEqual(Examination.objects.filter(patient__user__username="gen-002").count(), 6)
+        exam = Examination.objects.first()
+        self.assertIsNotNone(exam.leftventricle_edv)
+        self.assertEqual(len(unpack_segments(exam.segment_states)), 17)
+        # Дневные сводки ведутся так же, как при сохранении из формы
+        self.assertEqual(sum(DailyStats.objects.values_list("exam_count", flat=True)), 12)
+        self.assertTrue(self.client.login(username="gen-001", password="bench"))
+
+
+@override_settings(SERVER_TIMING=True)
+class ServerTimingTests(TempStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+        self.client.force_login(self.user)
+        self.exam = save_examination(self.user, make_record())
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_header_and_slow_request_log(self):
+        import json
+
+        with self.assertLogs("liveheart.slow_requests", "WARNING") as logs:
+            response = self.client.get(reverse("patients:patient_card", args=[self.exam.patient_id]))
+
+        self.assertIn('desc="4 queries"', response["Server-Timing"])
+        self.assertIn("tpl;dur=", response["Server-Timing"])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record["view"], record["status"], record["sql_count"]), ("patients:patient_card", 200, 4))
+        self.assertEqual(record["user_id"], self.user.id)
+
+    def test_exporter_time(self):
+        response = self.client.get(reverse("patients:exam_report", args=[self.exam.id, "docx"]))
+        self.assertIn("export;dur=", response["Server-Timing"])
+        # Повторно файл берётся из кэша отчётов, сборки нет
+        response = self.client.get(reverse("patients:exam_report", args=[self.exam.id, "docx"]))
+        self.assertNotIn("export;dur=", response["Server-Timing"])
+
+    def test_query_budget(self):
+        from unittest import mock
+
+        from liveheart.timing import QueryBudgetExceeded
+        from . import views
+
+        url = reverse("patients:patient_card", args=[self.exam.patient_id])
+        with mock.patch.object(views.patient_card_view, "_query_budget", 3):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(url)
+            with override_settings(QUERY_BUDGET_STRICT=False), self.assertLogs("liveheart.slow_requests"):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+        override = override_settings(METRICS_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        metrics.reset()
+        self.user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+        self.exam = save_examination(self.user, make_record())
+
+    def test_quantile_from_buckets(self):
+        self.assertEqual(metrics.quantile(0.5, (1, 2, 4), [0, 10, 0, 0]), 1.5)
+        self.assertEqual(metrics.quantile(0.99, (1, 2, 4), [0, 0, 0, 3]), 4)
+        self.assertIsNone(metrics.quantile(0.5, (1, 2), [0, 0, 0]))
+
+    def test_endpoint_merges_processes(self):
+        import json
+        from pathlib import Path
+
+        self.client.force_login(self.user)
+        self.client.get(reverse("patients:patient_card", args=[self.exam.patient_id]))
+        render_report(load_snapshot(self.exam.id), "xlsx")
+        # Файл завершившегося процесса: счётчики учитываются, датчики — нет
+        Path(self.directory, "999999999-1.json").write_text(json.dumps({
+            "liveheart_http_requests_total": [[["patients:patient_card", "200"], 2]],
+            "liveheart_export_jobs_running": [[[], 5]],
+        }))
+        self.client.logout()
+
+        text = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn('liveheart_http_requests_total{view="patients:patient_card",status="200"} 3', text)
+        self.assertIn('liveheart_http_request_duration_seconds_quantile{view="patients:patient_card",quantile="0.95"}',
+                      text)
+        self.assertIn('liveheart_export_size_bytes_count{format="xlsx"} 1', text)
+        self.assertNotIn("liveheart_export_jobs_running 5", text)
+        # Файл завершившегося процесса перенесён в архив, значения не откатываются
+        self.assertFalse(Path(self.directory, "999999999-1.json").exists())
+        self.assertTrue(Path(self.directory, "archive.json").exists())
+        text = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn('liveheart_http_requests_total{view="patients:patient_card",status="200"} 3', text)
+
+        self.assertEqual(self.client.get(reverse("metrics"), REMOTE_ADDR="10.1.1.1").status_code, 404)
+
+    def test_concurrent_updates_are_not_lost(self):
+        import threading
+
+        counter = metrics.counter("liveheart_test_total", "Тестовый счётчик")
+        threads = [threading.Thread(target=lambda: [counter.inc() for _ in range(5000)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter.values[()], 20000)
+
+    def test_flush_errors_stay_inside(self):
+        from pathlib import Path
+
+        blocker = Path(self.directory, "file")
+        blocker.write_text("")
+        metrics.REQUESTS.inc("view", "200")
+        with override_settings(METRICS_DIR=blocker / "metrics"), self.assertLogs("liveheart.metrics", "WARNING"):
+            metrics.flush()
+
+
+class PatientSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("doctor", "doctor@example.com", "pass")
+        names = ["Семёнов Пётр Ильич", "Петров Семён Андреевич", "Иванова Анна Петровна", "Ёлкин Иван"]
+        exams = save_examinations(self.user, [make_record(name) for name in names])
+        self.patients = {exam.patient.full_name: exam.patient for exam in exams}
+        other = User.objects.create_user("other", "other@example.com", "pass")
+        save_examination(other, make_record("Семенов Пётр"))
+
+    def names(self, query):
+        return [p.full_name for p in search_patients(self.user, query)]
+
+    def test_case_yo_and_prefix_of_each_part(self):
+        self.assertEqual(self.names("СЕМЕНОВ"), ["Семёнов Пётр Ильич"])
+        self.assertEqual(self.names("елк"), ["Ёлкин Иван"])
+        self.assertEqual(self.names("пет ил"), ["Семёнов Пётр Ильич"])
+        self.assertEqual(self.names("ильич семён"), ["Семёнов Пётр Ильич"])
+        self.assertEqual(self.names("сидоров"), [])
+        self.assertEqual(self.names("  ,. "), [])
+
+    def test_surname_matches_rank_first(self):
+        self.assertEqual(self.names("сем"), ["Семёнов Пётр Ильич", "Петров Семён Андреевич"])
+        self.assertEqual(self.names("пет")[0], "Петров Семён Андреевич")
+
+    def test_index_follows_writes(self):
+        patient = self.patients["Ёлкин Иван"]
+        patient.full_name = "Ёлкина Ирина"
+        patient.save(update_fields=["full_name"])
+        self.assertEqual(self.names("ирин"), ["Ёлкина Ирина"])
+        self.assertEqual(self.names("иван"), ["Иванова Анна Петровна"])
+
+        patient.delete()
+        self.assertEqual(self.names("елк"), [])
+
+    def test_json_endpoint_and_history_search(self):
+        self.client.force_login(self.user)
+        with self.assertNumQueries(4):
+            data = self.client.get(reverse("patients:patient_search"), {"q": "анна"}).json()
+        patient = self.patients["Иванова Анна Петровна"]
+        self.assertEqual([r["full_name"] for r in data["results"]], [patient.full_name])
+        self.assertEqual(data["results"][0]["card_url"], reverse("patients:patient_card", args=[patient.id]))
+        self.assertIsNotNone(data["results"][0]["last_exam_at"])
+
+        response = self.client.get(reverse("patients:history"), {"q": "петр"})
+        self.assertEqual([p.full_name for p in response.context["patients"]][0], "Петров Семён Андреевич")
+        self.assertContains(response, 'value="петр"')
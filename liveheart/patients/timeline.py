@@ -0,0 +1,77 @@
+"""
+Динамика показателей пациента по всем его обследованиям.
+
+Вся история читается одним запросом; изменение относительно предыдущего обследования
+считается в SQL оконной функцией LAG, поэтому стоимость не растёт с числом разделов.
+"""
+from django.db.models import F, Window
+from django.db.models.functions import Lag
+
+from .models import Examination, unpack_segments
+
+# (заголовок, поле, единица измерения)
+TIMELINE_METRICS = [
+    ("ФВ", "ef", "%"),
+    ("ФУ", "fs", "%"),
+    ("КДР", "leftventricle_edd", "мм"),
+    ("КСР", "leftventricle_esd", "мм"),
+    ("КДО", "leftventricle_edv", "мл"),
+    ("КСО", "leftventricle_esv", "мл"),
+    ("МЖП", "leftventricle_ivsd", "мм"),
+    ("ЗСЛЖ", "leftventricle_pw", "мм"),
+    ("УО", "sv", "мл"),
+    ("АК град. макс.", "aorticvalve_grad_max", "мм рт.ст."),
+    ("АК град. ср.", "aorticvalve_grad_mean", "мм рт.ст."),
+    ("ЛА град. макс.", "pulmonaryartery_grad_max", "мм рт.ст."),
+    ("TAPSE", "tricuspidvalve_tapse", "мм"),
+    ("ИНЛС", "wmsi", ""),
+]
+
+SEGMENT_STATE_LABELS = {0: "Н", 1: "Г", 2: "А", 3: "Д"}
+
+
+def patient_timeline(patient):
+    """
+    Список обследований пациента по времени. Для каждого показателя — значение
+    и изменение к предыдущему обследованию (None, если одно из значений не заполнено).
+    """
+    order = [F("exam_datetime").asc(nulls_first=True), F("id").asc()]
+    fields = [field for _, field, _ in TIMELINE_METRICS]
+    deltas = {
+        f"{field}__delta": F(field) - Window(Lag(field), order_by=order)
+        for field in fields
+    }
+    rows = (
+        Examination.objects.filter(patient=patient)
+        .values("id", "exam_datetime", "segment_states", *fields)
+        .annotate(**deltas)
+        .order_by(*order)
+    )
+
+    timeline = []
+    for row in rows:
+        timeline.append({
+            "id": row["id"],
+            "exam_datetime": row["exam_datetime"],
+            "metrics": [
+                (row[field], _round(row[f"{field}__delta"])) for _, field, _ in TIMELINE_METRICS
+            ],
+            "segments": [
+                SEGMENT_STATE_LABELS[state] for state in unpack_segments(row["segment_states"])
+            ],
+        })
+    return timeline
+
+
+def timeline_series(timeline):
+    """Показатели в виде временных рядов {поле: [[дата ISO, значение], ...]}"""
+    series = {field: [] for _, field, _ in TIMELINE_METRICS}
+    for exam in timeline:
+        date = exam["exam_datetime"].isoformat() if exam["exam_datetime"] else None
+        for (_, field, _), (value, _) in zip(TIMELINE_METRICS, exam["metrics"]):
+            series[field].append([date, value])
+    return series
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
@@ -6,5 +6,17 @@ app_name = "patients"
 urlpatterns = [
     path("new/", views.new_patient_view, name="new_patient"),
     path("history/", views.patient_list_view, name="history"),
+    path("search.json", views.patient_search_json_view, name="patient_search"),
+    path("register.xlsx", views.register_xlsx_view, name="register_xlsx"),
+    path("research.<str:fmt>", views.research_export_view, name="research_export"),
+    path("<int:patient_id>/card/", views.patient_card_view, name="patient_card"),
+    path("<int:patient_id>/timeline.json", views.patient_timeline_json_view, name="patient_timeline"),
     path("delete/<int:patient_id>/", views.delete_patient_view, name="delete_patient"),
+    path("exams/<int:exam_id>/edit/", views.exam_edit_view, name="exam_edit"),
+    path("exams/<int:exam_id>/report/<str:fmt>/", views.exam_report_view, name="exam_report"),
+    path("reports/cache/stats/", views.report_cache_stats_view, name="report_cache_stats"),
+    path("exports/batch/", views.batch_export_view, name="batch_export"),
+    path("exports/<int:job_id>/", views.export_status_view, name="export_status"),
+    path("exports/<int:job_id>/status/", views.export_status_json_view, name="export_status_json"),
+    path("exports/<int:job_id>/download/", views.export_download_view, name="export_download"),
 ]
@@ -1,14 +1,22 @@
 import io
+import time
+from datetime import datetime
+from django.conf import settings
 from django.http import HttpResponse
 from django.template.loader import render_to_string
 from django.utils import timezone
 from xhtml2pdf import pisa
-from docx import Document
-from docx.shared import Pt, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
 import openpyxl
 from openpyxl.styles import Font, Border, Side, Alignment
 
+from liveheart.metrics import EXPORT_BYTES, EXPORT_SECONDS
+from liveheart.timing import timed
+
+from .docx_template import TEMPLATE_SECTIONS, load_template
+from .indices import ejection_fraction
+from .models import SECTIONS
+from .pdf_reportlab import render_pdf_reportlab
+
 
 # --- ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ---
 
@@ -19,9 +27,31 @@ def format_date(dt):
     if isinstance(dt, str):
         # Если вдруг пришла строка, пробуем вернуть как есть или распарсить (но лучше парсить во view)
         return dt
+    if isinstance(dt, datetime) and timezone.is_aware(dt):
+        # Местная дата, как у фильтра |date в pdf_report.html
+        dt = timezone.localtime(dt)
     return dt.strftime('%d.%m.%Y')
 
 
+class ZipSink(io.RawIOBase):
+    """Поток без перемотки: zipfile пишет в него, а мы забираем накопленные байты"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._buffer += b
+        return len(b)
+
+    def pop(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
 def get_val(val, unit=""):
     """Если значение есть — возвращает 'Значение Ед.изм', иначе '-'"""
     if val is None or val == "":
@@ -29,129 +59,61 @@ def get_val(val, unit=""):
     return f"{val} {unit}"
 
 
-# --- ГЕНЕРАЦИЯ WORD (DOCX) ---
+def exam_ef(exam):
+    """ФВ: сохранённая при записи, а для старых записей — посчитанная на лету"""
+    if exam.ef is not None:
+        return exam.ef
+    return ejection_fraction(exam.leftventricle.edv, exam.leftventricle.esv)
 
-def generate_docx(exam):
-    doc = Document()
-
-    # Настройка стилей
-    style = doc.styles['Normal']
-    style.font.name = 'Times New Roman'
-    style.font.size = Pt(12)
-
-    # 1. ЗАГОЛОВОК
-    header = doc.add_paragraph("ГБУЗ НО «Центральная городская больница г. Арзамас»")
-    header.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    header.runs[0].bold = True
-
-    title = doc.add_paragraph("ПРОТОКОЛ ЭХОКАРДИОГРАФИИ")
-    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    title.runs[0].bold = True
-    title.runs[0].font.size = Pt(14)
-
-    doc.add_paragraph()  # Пустая строка
-
-    # 2. ДАННЫЕ ПАЦИЕНТА
-    p = doc.add_paragraph()
-    p.add_run("Ф.И.О.: ").bold = True
-    p.add_run(f"{exam.patient.full_name}\t\t")
-    p.add_run("Дата: ").bold = True
-    p.add_run(f"{format_date(exam.exam_datetime)}")
-
-    p = doc.add_paragraph()
-    p.add_run("Возраст: ").bold = True
-    p.add_run(f"{get_val(exam.age, 'лет')}\t")
-    p.add_run("Рост: ").bold = True
-    p.add_run(f"{get_val(exam.height, 'см')}\t")
-    p.add_run("Вес: ").bold = True
-    p.add_run(f"{get_val(exam.weight, 'кг')}\t")
-
-    p = doc.add_paragraph()
-    p.add_run("ППТ: ").bold = True
-    p.add_run(f"{get_val(exam.bsa, 'м²')}\t")
-    p.add_run("ЧСС: ").bold = True
-    p.add_run(f"{get_val(exam.hr, 'уд/мин')}")
-
-    doc.add_paragraph("_" * 70)  # Разделитель
-
-    # Функция для создания таблиц разделов
-    def create_section_table(title, data_pairs):
-        doc.add_heading(title, level=3)
-        table = doc.add_table(rows=len(data_pairs), cols=2)
-        table.autofit = True
-
-        for i, (label, value) in enumerate(data_pairs):
-            row = table.rows[i]
-            row.cells[0].text = label
-            row.cells[0].width = Inches(3.0)
-            row.cells[1].text = str(value)
 
-    # --- АОРТА ---
-    if hasattr(exam, 'aorta') and exam.aorta.is_enabled:
-        create_section_table("АОРТА", [
-            ("Диаметр основания:", get_val(exam.aorta.diameter, "мм")),
-            ("Раскрытие аортального клапана:", get_val(exam.aorta.valve_opening, "мм")),
-        ])
-
-    # --- АОРТАЛЬНЫЙ КЛАПАН ---
-    if hasattr(exam, 'aorticvalve') and exam.aorticvalve.is_enabled:
-        create_section_table("АОРТАЛЬНЫЙ КЛАПАН", [
-            ("Пиковая скорость (Vmax):", get_val(exam.aorticvalve.psk, "м/с")),
-            ("Макс. градиент давления:", get_val(exam.aorticvalve.grad_max, "мм рт.ст.")),
-            ("Средний градиент:", get_val(exam.aorticvalve.grad_mean, "мм рт.ст.")),
-            ("Площадь отверстия:", get_val(exam.aorticvalve.area, "см²")),
-            ("Регургитация:", f"{exam.aorticvalve.regurgitation} ст."),
-        ])
+# --- ГЕНЕРАЦИЯ WORD (DOCX) ---
 
-    # --- ЛЕВЫЙ ЖЕЛУДОЧЕК ---
-    if hasattr(exam, 'leftventricle') and exam.leftventricle.is_enabled:
-        lv = exam.leftventricle
-        fv_val = ((lv.edv - lv.esv) / lv.edv * 100) if (lv.edv and lv.esv) else None
-
-        create_section_table("ЛЕВЫЙ ЖЕЛУДОЧЕК", [
-            ("КДР (Конечно-диаст. размер):", get_val(lv.edd, "мм")),
-            ("КСР (Конечно-сист. размер):", get_val(lv.esd, "мм")),
-            ("КДО (Конечно-диаст. объем):", get_val(lv.edv, "мл")),
-            ("КСО (Конечно-сист. объем):", get_val(lv.esv, "мл")),
-            ("МЖП (толщина в диастолу):", get_val(lv.ivsd, "мм")),
-            ("ЗСЛЖ (толщина в диастолу):", get_val(lv.pw, "мм")),
-            ("Фракция выброса (Simpson):", get_val(round(fv_val, 1) if fv_val else None, "%")),
-        ])
-
-    # --- ЗАКЛЮЧЕНИЕ (СЕГМЕНТЫ) ---
-    doc.add_heading("ЛОКАЛЬНАЯ СОКРАТИМОСТЬ", level=3)
-    p = doc.add_paragraph()
-    segments = exam.segments.all().order_by('segment_number')
-    norm_count = 0
-    bad_segments = []
-
-    STATES = {0: "Норма", 1: "Гипокинез", 2: "Акинез", 3: "Дискинез"}
-
-    for s in segments:
-        if s.state == 0:
-            norm_count += 1
-        else:
-            bad_segments.append(f"Сегмент {s.segment_number}: {STATES[s.state]}")
-
-    if norm_count == 17:
-        p.add_run("Нарушения локальной сократимости не выявлены.")
+SEGMENT_STATES = {0: "Норма", 1: "Гипокинез", 2: "Акинез", 3: "Дискинез"}
+
+
+def docx_context(exam, ef=None):
+    """Значения подстановок бланка DOCX для обследования"""
+    context = {
+        "full_name": exam.patient.full_name,
+        "date": format_date(exam.exam_datetime),
+        "age": get_val(exam.age, "лет"),
+        "height": get_val(exam.height, "см"),
+        "weight": get_val(exam.weight, "кг"),
+        "bsa": get_val(exam.bsa, "м²"),
+        "hr": get_val(exam.hr, "уд/мин"),
+        "ef": get_val(round(ef, 1) if ef else None, "%"),
+    }
+    for name, _, rows in TEMPLATE_SECTIONS:
+        section = getattr(exam, name)
+        for _, field, unit in rows:
+            if field.startswith(f"{name}."):
+                context[field] = get_val(getattr(section, field.split(".", 1)[1]), unit)
+
+    bad = [f"Сегмент {s.segment_number}: {SEGMENT_STATES[s.state]}" for s in exam.segments if s.state]
+    if bad:
+        context["segments_title"] = "Выявлены зоны нарушения сократимости: "
+        context["segments"] = ", ".join(bad)
     else:
-        p.add_run("Выявлены зоны нарушения сократимости:\n").bold = True
-        p.add_run(", ".join(bad_segments))
+        context["segments_title"] = ""
+        context["segments"] = "Нарушения локальной сократимости не выявлены."
+    return context
+
+
+def docx_template():
+    """Бланк протокола, разобранный один раз на процесс"""
+    return load_template(str(settings.REPORT_DOCX_TEMPLATE))
 
-    # Сохранение
-    f = io.BytesIO()
-    doc.save(f)
-    f.seek(0)
-    response = HttpResponse(f.read(),
-                            content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
-    response['Content-Disposition'] = f'attachment; filename="Echo_{exam.patient.full_name}.docx"'
-    return response
+
+def render_docx(exam):
+    """Собирает протокол в формате DOCX из бланка и возвращает его байты"""
+    enabled = {name for name in SECTIONS if getattr(exam, name).is_enabled}
+    return docx_template().render(docx_context(exam, exam_ef(exam)), enabled)
 
 
 # --- ГЕНЕРАЦИЯ EXCEL (XLSX) ---
 
-def generate_xlsx(exam):
+def render_xlsx(exam):
+    """Собирает протокол в формате XLSX и возвращает его байты"""
     wb = openpyxl.Workbook()
     ws = wb.active
     ws.title = "Протокол"
@@ -233,7 +195,7 @@ def generate_xlsx(exam):
     # --- ЛЕВЫЙ ЖЕЛУДОЧЕК ---
     if hasattr(exam, 'leftventricle') and exam.leftventricle.is_enabled:
         lv = exam.leftventricle
-        fv_val = ((lv.edv - lv.esv) / lv.edv * 100) if (lv.edv and lv.esv) else None
+        fv_val = exam_ef(exam)
         write_section("ЛЕВЫЙ ЖЕЛУДОЧЕК", {
             "КДР": get_val(lv.edd, "мм"),
             "КСР": get_val(lv.esd, "мм"),
@@ -247,24 +209,103 @@ def generate_xlsx(exam):
     # Сохранение
     f = io.BytesIO()
     wb.save(f)
-    f.seek(0)
-    response = HttpResponse(f.read(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename="Echo_{exam.patient.full_name}.xlsx"'
-    return response
+    return f.getvalue()
 
 
 # --- ГЕНЕРАЦИЯ PDF ---
 
-def generate_pdf(exam):
+class ReportError(Exception):
+    """Не удалось собрать отчёт"""
+
+
+def render_pdf_html(exam):
+    """PDF через HTML-шаблон и xhtml2pdf (прежний способ)"""
     # Используем шаблон pdf_report.html
     html_string = render_to_string('patients/pdf_report.html', {'exam': exam})
     result = io.BytesIO()
     # Поддержка кириллицы требует шрифтов, но xhtml2pdf имеет встроенные ограничения.
     # Для базовой работы убедитесь, что в HTML есть <meta charset="utf-8">
     pdf = pisa.pisaDocument(io.BytesIO(html_string.encode("UTF-8")), result)
+    if pdf.err:
+        raise ReportError("Ошибка PDF")
+    return result.getvalue()
 
-    if not pdf.err:
-        response = HttpResponse(result.getvalue(), content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="Echo_{exam.patient.full_name}.pdf"'
-        return response
-    return HttpResponse("Ошибка PDF")
\ No newline at end of file
+
+# Способы сборки PDF, выбирается настройкой REPORT_PDF_BACKEND
+PDF_BACKENDS = {
+    "reportlab": render_pdf_reportlab,
+    "xhtml2pdf": render_pdf_html,
+}
+
+
+def render_pdf(exam):
+    """Собирает протокол в формате PDF и возвращает его байты"""
+    return PDF_BACKENDS[settings.REPORT_PDF_BACKEND](exam)
+
+
+# --- РЕЕСТР ФОРМАТОВ ---
+
+# Формат -> (функция сборки, content-type)
+EXPORT_FORMATS = {
+    "docx": (render_docx, "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    "xlsx": (render_xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "pdf": (render_pdf, "application/pdf"),
+}
+
+
+# Версия генератора каждого формата входит в ключ кэша отчётов:
+# при изменении вёрстки/шаблона увеличьте номер, и старые файлы перестанут использоваться
+REPORT_VERSIONS = {
+    "docx": 4,
+    "xlsx": 3,
+    "pdf": 3,
+}
+
+
+def report_version(fmt):
+    """Версия генератора для ключа кэша; учитывает бланк DOCX и выбранный способ сборки PDF"""
+    if fmt == "docx":
+        return f"{REPORT_VERSIONS[fmt]}-{docx_template().digest}"
+    if fmt == "pdf":
+        return f"{REPORT_VERSIONS[fmt]}-{settings.REPORT_PDF_BACKEND}"
+    return REPORT_VERSIONS[fmt]
+
+
+def export_filename(exam, fmt):
+    return f"Echo_{exam.patient.full_name}.{fmt}"
+
+
+def render_report(exam, fmt):
+    """Байты отчёта в нужном формате"""
+    renderer, _ = EXPORT_FORMATS[fmt]
+    started = time.perf_counter()
+    with timed("export"):
+        content = renderer(exam)
+    EXPORT_SECONDS.observe(time.perf_counter() - started, fmt)
+    EXPORT_BYTES.observe(len(content), fmt)
+    return content
+
+
+def report_response(exam, fmt, content=None):
+    """HTTP-ответ с вложением отчёта"""
+    _, content_type = EXPORT_FORMATS[fmt]
+    if content is None:
+        content = render_report(exam, fmt)
+    response = HttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(exam, fmt)}"'
+    return response
+
+
+def generate_docx(exam):
+    return report_response(exam, "docx")
+
+
+def generate_xlsx(exam):
+    return report_response(exam, "xlsx")
+
+
+def generate_pdf(exam):
+    try:
+        return report_response(exam, "pdf")
+    except ReportError:
+        return HttpResponse("Ошибка PDF")
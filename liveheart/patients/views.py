@@ -1,9 +1,32 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import OuterRef, Q, Subquery
 from .models import *
-from .utils import generate_docx, generate_xlsx, generate_pdf
-from django.utils.dateparse import parse_datetime
+from .jobs import enqueue_export, export_path
+from .batch import iter_zip, select_exam_ids
+from .worker_pool import shared_pool
+from .register import stream_register
+from .research import RESEARCH_FORMATS, pseudonym_key, stream_research
+from .search import search_patients
+from .report_cache import get_or_render, cache_stats
+from .snapshot import load_snapshot
+from .timeline import TIMELINE_METRICS, patient_timeline, timeline_series
+from .services import StaleExamination, save_examination, update_examination
+from .utils import EXPORT_FORMATS, report_response, report_version
+from .warmup import readiness
+from liveheart.db_router import read_only_view
+from liveheart.metrics import render_prometheus
+from liveheart.timing import query_budget
+from accounts.throttle import client_ip
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date, parse_datetime
 from django.utils import timezone
 
 
@@ -21,141 +44,334 @@ def to_int(val, default=0):
         return default
 
 
+def nth(post, name, index):
+    """index-е поле формы с повторяющимся именем; если прислано одно значение — оно для всех"""
+    values = post.getlist(name)
+    return values[min(index, len(values) - 1)] if values else None
+
+
+def exam_record_from_post(post):
+    """Собирает запись обследования для services.save_examination из данных формы"""
+    raw_date = post.get("exam_datetime")
+    exam_dt = parse_datetime(raw_date) if raw_date else timezone.now()
+
+    # Если дата "наивная" (без часового пояса), делаем её осознанной
+    if exam_dt and timezone.is_naive(exam_dt):
+        exam_dt = timezone.make_aware(exam_dt)
+
+    return {
+        "full_name": post.get("full_name"),
+        "exam": {
+            "exam_datetime": exam_dt,
+            "age": to_int(post.get("age"), None),
+            "height": to_float(post.get("height")),
+            "weight": to_float(post.get("weight")),
+            "hr": to_int(nth(post, "hr", 0), None),
+        },
+        "sections": {
+            # Аорта
+            "aorta": {
+                "diameter": to_float(post.get("diametr_aorta")),
+                "valve_opening": to_float(post.get("opening_aortic_valve")),
+                "is_enabled": post.get("aorta_enabled") == "on",
+            },
+            # Аортальный клапан
+            "aorticvalve": {
+                "psk": to_float(post.get("psk")),
+                "grad_max": to_float(nth(post, "max_gradient", 0)),
+                "grad_mean": to_float(post.get("avr_gradient")),
+                "regurgitation": to_int(post.get("regurgitaciya_1")),
+                "area": to_float(post.get("ploshad_open_clapana")),
+            },
+            # Левый желудочек
+            "leftventricle": {
+                "ivsd": to_float(post.get("mjp")),
+                "edd": to_float(post.get("kdr")),
+                "esd": to_float(post.get("kcr")),
+                "pw": to_float(post.get("zclj")),
+                "edv": to_float(post.get("kdo")),
+                "esv": to_float(post.get("kco")),
+                "hr": to_int(nth(post, "hr", 1), None),
+            },
+            # Остальные камеры
+            "otherchambers": {
+                "la": to_float(post.get("left_pred")),
+                "ra": to_float(post.get("right_pred")),
+                "rv": to_float(post.get("right_jel")),
+                "lav": to_float(post.get("obem_lp")),
+            },
+            # Митральный клапан
+            "mitralvalve": {
+                "e": to_float(post.get("e")),
+                "a": to_float(post.get("a")),
+                "grad_max": to_float(nth(post, "max_gradient", 1)),
+                "dte": to_float(post.get("dte")),
+                "ivrt": to_float(post.get("ivrt")),
+                "reg": to_int(post.get("regurgitaciya_2")),
+            },
+            # Трикуспидальный клапан
+            "tricuspidvalve": {
+                "e": to_float(post.get("trikuspid_e")),
+                "a": to_float(post.get("trikuspid_a")),
+                "grad_max": to_float(post.get("trikuspid_max_gradiend")),
+                "tapse": to_float(post.get("tapse")),
+                "reg": to_int(post.get("regurgitaciya_3")),
+            },
+            # Лёгочная артерия
+            "pulmonaryartery": {
+                "diameter": to_float(post.get("diametr_stvola_la")),
+                "grad_max": to_float(nth(post, "max_gradient", 2)),
+                "velocity": to_float(post.get("speed")),
+                "at": to_float(post.get("at")),
+                "et": to_float(post.get("et")),
+                "reg": to_int(post.get("regurgitaciya_4")),
+                "ivc": to_float(post.get("npv")),
+            },
+        },
+        # Сегменты
+        "segments": [to_int(post.get(f"segment_{i}")) for i in range(1, SEGMENT_COUNT + 1)],
+    }
+
+
+# (поле формы осмотра, колонка Examination) в порядке полей на странице; имена полей повторяются
+FORM_COLUMNS = [
+    ("age", "age"), ("height", "height"), ("weight", "weight"), ("bmi", "bmi"), ("bsa", "bsa"), ("hr", "hr"),
+    ("diametr_aorta", "aorta_diameter"), ("opening_aortic_valve", "aorta_valve_opening"),
+    ("psk", "aorticvalve_psk"), ("max_gradient", "aorticvalve_grad_max"), ("avr_gradient", "aorticvalve_grad_mean"),
+    ("regurgitaciya_1", "aorticvalve_regurgitation"), ("ploshad_open_clapana", "aorticvalve_area"),
+    ("mjp", "leftventricle_ivsd"), ("kdr", "leftventricle_edd"), ("kcr", "leftventricle_esd"),
+    ("zclj", "leftventricle_pw"), ("kdo", "leftventricle_edv"), ("kco", "leftventricle_esv"),
+    ("hr", "leftventricle_hr"),
+    ("fc", "fs"), ("fv", "ef"), ("uo", "sv"), ("cv", "co"), ("ci", "ci"),
+    ("left_pred", "otherchambers_la"), ("right_pred", "otherchambers_ra"), ("right_jel", "otherchambers_rv"),
+    ("obem_lp", "otherchambers_lav"),
+    ("e", "mitralvalve_e"), ("a", "mitralvalve_a"), ("max_gradient", "mitralvalve_grad_max"),
+    ("dte", "mitralvalve_dte"), ("ivrt", "mitralvalve_ivrt"), ("regurgitaciya_2", "mitralvalve_reg"),
+    ("trikuspid_e", "tricuspidvalve_e"), ("trikuspid_a", "tricuspidvalve_a"),
+    ("trikuspid_max_gradiend", "tricuspidvalve_grad_max"), ("tapse", "tricuspidvalve_tapse"),
+    ("regurgitaciya_3", "tricuspidvalve_reg"),
+    ("diametr_stvola_la", "pulmonaryartery_diameter"), ("max_gradient", "pulmonaryartery_grad_max"),
+    ("speed", "pulmonaryartery_velocity"), ("at", "pulmonaryartery_at"), ("et", "pulmonaryartery_et"),
+    ("regurgitaciya_4", "pulmonaryartery_reg"), ("npv", "pulmonaryartery_ivc"),
+]
+
+
+def exam_form_initial(exam):
+    """Значения формы осмотра для правки: {имя поля: [значения по порядку полей с этим именем]}"""
+    initial = {
+        "full_name": [exam.patient.full_name],
+        "exam_datetime": [timezone.localtime(exam.exam_datetime).strftime("%Y-%m-%dT%H:%M") if exam.exam_datetime else ""],
+    }
+    for name, column in FORM_COLUMNS:
+        value = getattr(exam, column)
+        initial.setdefault(name, []).append("" if value is None else value)
+    for segment in exam.segments:
+        initial[f"segment_{segment.segment_number}"] = [segment.state]
+    return initial
+
+
 @login_required
+@query_budget(14)
 def new_patient_view(request):
     if request.method == "POST":
+        export_type = request.POST.get('export_type')
         with transaction.atomic():
-            # 1. Основные данные + ПРИВЯЗКА К ВРАЧУ (request.user)
-            patient = Patient.objects.create(
-                user=request.user,  # <--- ВОТ ГЛАВНОЕ ИЗМЕНЕНИЕ
-                full_name=request.POST.get("full_name")
-            )
-
-            raw_date = request.POST.get("exam_datetime")
-            exam_dt = parse_datetime(raw_date) if raw_date else timezone.now()
-
-            # Если дата "наивная" (без часового пояса), делаем её осознанной
-            if exam_dt and timezone.is_naive(exam_dt):
-                exam_dt = timezone.make_aware(exam_dt)
-
-            exam = Examination.objects.create(
-                patient=patient,
-                exam_datetime=exam_dt,
-                age=request.POST.get("age") or None,
-                height=to_float(request.POST.get("height")),
-                weight=to_float(request.POST.get("weight")),
-                bmi=to_float(request.POST.get("bmi")),
-                bsa=to_float(request.POST.get("bsa")),
-                hr=request.POST.get("hr") or None
-            )
-
-            # 2. Аорта
-            Aorta.objects.create(
-                examination=exam,
-                diameter=to_float(request.POST.get("diametr_aorta")),
-                valve_opening=to_float(request.POST.get("opening_aortic_valve")),
-                is_enabled=request.POST.get("aorta_enabled") == "on"
-            )
-
-            # 3. Аортальный клапан
-            AorticValve.objects.create(
-                examination=exam,
-                psk=to_float(request.POST.get("psk")),
-                grad_max=to_float(request.POST.get("max_gradient")),
-                grad_mean=to_float(request.POST.get("avr_gradient")),
-                regurgitation=int(request.POST.get("regurgitaciya_1", 0)),
-                area=to_float(request.POST.get("ploshad_open_clapana"))
-            )
-
-            # 4. Левый желудочек
-            LeftVentricle.objects.create(
-                examination=exam,
-                ivsd=to_float(request.POST.get("mjp")),
-                edd=to_float(request.POST.get("kdr")),
-                esd=to_float(request.POST.get("kcr")),
-                pw=to_float(request.POST.get("zclj")),
-                edv=to_float(request.POST.get("kdo")),
-                esv=to_float(request.POST.get("kco")),
-                hr=request.POST.get("hr")
-            )
-
-            # 5. Остальные камеры
-            OtherChambers.objects.create(
-                examination=exam,
-                la=to_float(request.POST.get("left_pred")),
-                ra=to_float(request.POST.get("right_pred")),
-                rv=to_float(request.POST.get("right_jel")),
-                lav=to_float(request.POST.get("obem_lp"))
-            )
-
-            # 6. Митральный клапан
-            MitralValve.objects.create(
-                examination=exam,
-                e=to_float(request.POST.get("e")),
-                a=to_float(request.POST.get("a")),
-                grad_max=to_float(request.POST.get("max_gradient")),
-                dte=to_float(request.POST.get("dte")),
-                ivrt=to_float(request.POST.get("ivrt")),
-                reg=int(request.POST.get("regurgitaciya_2", 0))
-            )
-
-            # 7. Трикуспидальный клапан
-            TricuspidValve.objects.create(
-                examination=exam,
-                e=to_float(request.POST.get("trikuspid_e")),
-                a=to_float(request.POST.get("trikuspid_a")),
-                grad_max=to_float(request.POST.get("trikuspid_max_gradiend")),
-                tapse=to_float(request.POST.get("tapse")),
-                reg=int(request.POST.get("regurgitaciya_3", 0))
-            )
-
-            # 8. Лёгочная артерия
-            PulmonaryArtery.objects.create(
-                examination=exam,
-                diameter=to_float(request.POST.get("diametr_stvola_la")),
-                grad_max=to_float(request.POST.get("max_gradient")),
-                velocity=to_float(request.POST.get("speed")),
-                at=to_float(request.POST.get("at")),
-                et=to_float(request.POST.get("et")),
-                reg=int(request.POST.get("regurgitaciya_4", 0)),
-                ivc=to_float(request.POST.get("npv"))
-            )
-
-            # 9. Сегменты
-            for i in range(1, 18):
-                state = request.POST.get(f"segment_{i}", 0)
-                MyocardialSegment.objects.create(
-                    examination=exam,
-                    segment_number=i,
-                    state=int(state)
-                )
-
-            # ЭКСПОРТ ФАЙЛОВ
-            export_type = request.POST.get('export_type')
-            print(f"DEBUG: Export type is {export_type}")
-            if export_type in ['docx', 'xlsx', 'pdf']:
-                exam.refresh_from_db()# Получаем тип из скрытого поля
-                if export_type == 'docx':
-                    return generate_docx(exam)
-                elif export_type == 'xlsx':
-                    return generate_xlsx(exam)
-                elif export_type == 'pdf':
-                    return generate_pdf(exam)
+            # Все строки обследования пишутся пачкой
+            exam = save_examination(request.user, exam_record_from_post(request.POST))
+
+            # ЭКСПОРТ ФАЙЛОВ: только ставим в очередь, собирается после коммита
+            job = None
+            if export_type in EXPORT_FORMATS:
+                job = enqueue_export(request.user, exam, export_type)
+
+        if job:
+            return redirect("patients:export_status", job_id=job.id)
 
         # Перенаправление в личный кабинет (dashboard)
         return redirect("accounts:dashboard")
 
-    return render(request, "patients/new_patient.html", {"segments": range(1, 18)})
+    return render(request, "patients/new_patient.html", {"segments": range(1, SEGMENT_COUNT + 1)})
 
 
 @login_required
+@query_budget(9)
+def exam_edit_view(request, exam_id):
+    """Правка сохранённого обследования: пишутся только изменившиеся поля (см. update_examination)"""
+    exams = Examination.objects.select_related("patient")
+    exam = get_object_or_404(exams, id=exam_id, patient__user=request.user)
+    error = None
+    if request.method == "POST":
+        record = exam_record_from_post(request.POST)
+        # В форме время до минуты: если его не трогали, сохранённое значение остаётся как есть
+        raw_date = request.POST.get("exam_datetime")
+        if not raw_date or raw_date == exam_form_initial(exam)["exam_datetime"][0]:
+            del record["exam"]["exam_datetime"]
+        # Переключателя раздела "Аорта" в форме нет: при правке флаг не трогаем
+        if "aorta_enabled" not in request.POST:
+            del record["sections"]["aorta"]["is_enabled"]
+
+        export_type = request.POST.get('export_type')
+        try:
+            with transaction.atomic():
+                update_examination(exam, record, version=to_int(request.POST.get("version"), None))
+                job = enqueue_export(request.user, exam, export_type) if export_type in EXPORT_FORMATS else None
+        except StaleExamination:
+            exam = get_object_or_404(exams, id=exam_id, patient__user=request.user)
+            error = "Обследование уже изменили в другом окне. Ниже сохранённые значения, внесите правку ещё раз."
+        else:
+            if job:
+                return redirect("patients:export_status", job_id=job.id)
+            return redirect("patients:patient_card", patient_id=exam.patient_id)
+
+    return render(request, "patients/new_patient.html", {
+        "segments": range(1, SEGMENT_COUNT + 1),
+        "exam": exam,
+        "initial": exam_form_initial(exam),
+        "error": error,
+    }, status=409 if error else 200)
+
+
+PATIENTS_PAGE_SIZE = 50
+
+
+def decode_cursor(raw):
+    """Курсор страницы — подписанная пара (full_name, id) последнего пациента предыдущей страницы"""
+    if not raw:
+        return None
+    try:
+        full_name, pk = signing.loads(raw, salt="patients.history")
+        return str(full_name), int(pk)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+
+
+@read_only_view
+@login_required
+@query_budget(4)
 def patient_list_view(request):
-    # Получаем пациентов, привязанных ТОЛЬКО к текущему пользователю
-    # select_related помогает загрузить данные быстрее одним запросом
-    patients = Patient.objects.filter(user=request.user).order_by('full_name')
+    query = request.GET.get("q", "").strip()
+    if query:
+        # Поиск: лучшие совпадения без пагинации
+        return render(request, "patients/history_patient.html", {
+            "patients": search_patients(request.user, query),
+            "query": query,
+            "is_first_page": True,
+        })
+
+    # Дата последнего обследования подтягивается тем же запросом (индекс patient + exam_datetime)
+    last_exam = (
+        Examination.objects.filter(patient=OuterRef("pk"))
+        .order_by("-exam_datetime")
+        .values("exam_datetime")[:1]
+    )
+    patients = (
+        Patient.objects.filter(user=request.user)
+        .annotate(last_exam_at=Subquery(last_exam))
+        .order_by("full_name", "id")
+    )
+
+    # Keyset-пагинация: страница N стоит столько же, сколько первая
+    cursor = decode_cursor(request.GET.get("after"))
+    if cursor:
+        full_name, pk = cursor
+        patients = patients.filter(Q(full_name__gt=full_name) | Q(full_name=full_name, id__gt=pk))
 
-    # Мы можем передать список пациентов в шаблон
-    return render(request, "patients/history_patient.html", {"patients": patients})
+    page = list(patients[:PATIENTS_PAGE_SIZE + 1])
+    next_cursor = None
+    if len(page) > PATIENTS_PAGE_SIZE:
+        page = page[:PATIENTS_PAGE_SIZE]
+        last = page[-1]
+        next_cursor = signing.dumps([last.full_name, last.id], salt="patients.history")
+
+    return render(request, "patients/history_patient.html", {
+        "patients": page,
+        "next_cursor": next_cursor,
+        "is_first_page": cursor is None,
+    })
+
+
+@login_required
+def register_xlsx_view(request):
+    """Реестр всех обследований врача; память не растёт с числом строк"""
+    response = StreamingHttpResponse(stream_register(request.user), content_type=EXPORT_FORMATS["xlsx"][1])
+    response['Content-Disposition'] = f'attachment; filename="Register_{timezone.localdate():%Y-%m-%d}.xlsx"'
+    return response
+
+
+@login_required
+def batch_export_view(request):
+    """ZIP с протоколами выбранных обследований (exam_ids), пациента (patient) или дня (date)"""
+    if request.method != "POST":
+        return redirect("patients:history")
+
+    fmt = request.POST.get("format", "pdf")
+    if fmt not in EXPORT_FORMATS:
+        raise Http404("Неизвестный формат")
+
+    raw_ids = request.POST.getlist("exam_ids")
+    exam_ids = [int(i) for i in raw_ids if i.isdigit()] if raw_ids else None
+    patient_id = request.POST.get("patient")
+    day = parse_date(request.POST.get("date") or "")
+    exam_ids = select_exam_ids(
+        request.user, exam_ids, int(patient_id) if patient_id and patient_id.isdigit() else None, day,
+    )
+    if not exam_ids:
+        raise Http404("Обследования не найдены")
+
+    response = StreamingHttpResponse(
+        iter_zip(exam_ids, fmt, shared_pool() if settings.BATCH_EXPORT_WORKERS else None),
+        content_type="application/zip",
+    )
+    response['Content-Disposition'] = f'attachment; filename="Echo_{fmt}_{timezone.localdate():%Y-%m-%d}.zip"'
+    return response
+
+
+@read_only_view
+@login_required
+@query_budget(4)
+def patient_search_json_view(request):
+    """Поиск по ФИО для поля поиска в истории (по мере ввода)"""
+    patients = search_patients(request.user, request.GET.get("q", ""))
+    return JsonResponse({"results": [
+        {
+            "id": patient.id,
+            "full_name": patient.full_name,
+            "last_exam_at": patient.last_exam_at and timezone.localtime(patient.last_exam_at).strftime("%d.%m.%Y %H:%M"),
+            "card_url": reverse("patients:patient_card", args=[patient.id]),
+            "delete_url": reverse("patients:delete_patient", args=[patient.id]),
+        }
+        for patient in patients
+    ]})
+
+
+@read_only_view
+@login_required
+@query_budget(4)
+def patient_card_view(request, patient_id):
+    """Карта пациента: все обследования и динамика показателей (2 запроса при любом числе обследований)"""
+    patient = get_object_or_404(Patient, id=patient_id, user=request.user)
+    timeline = patient_timeline(patient)
+    return render(request, "patients/patient_card.html", {
+        "patient": patient,
+        "metrics": TIMELINE_METRICS,
+        "timeline": timeline,
+        "report_formats": list(EXPORT_FORMATS),
+    })
+
+
+@read_only_view
+@login_required
+@query_budget(4)
+def patient_timeline_json_view(request, patient_id):
+    """Временные ряды показателей пациента для графиков"""
+    patient = get_object_or_404(Patient, id=patient_id, user=request.user)
+    timeline = patient_timeline(patient)
+    return JsonResponse({
+        "patient": {"id": patient.id, "full_name": patient.full_name},
+        "metrics": [{"field": field, "title": title, "unit": unit} for title, field, unit in TIMELINE_METRICS],
+        "series": timeline_series(timeline),
+        "segments": [[exam["exam_datetime"], "".join(exam["segments"])] for exam in timeline],
+    })
 
 
 @login_required
@@ -169,4 +385,87 @@ def delete_patient_view(request, patient_id):
         if patient:
             patient.delete()
 
-    return redirect("patients:history")
\ No newline at end of file
+    return redirect("patients:history")
+
+
+@login_required
+def export_status_view(request, job_id):
+    job = get_object_or_404(ExportJob, id=job_id, user=request.user)
+    return render(request, "patients/export_status.html", {"job": job})
+
+
+@login_required
+def export_status_json_view(request, job_id):
+    job = get_object_or_404(ExportJob, id=job_id, user=request.user)
+    data = {"id": job.id, "status": job.status, "error": job.error}
+    if job.status == ExportJob.DONE:
+        data["download_url"] = reverse("patients:export_download", args=[job.id])
+    return JsonResponse(data)
+
+
+@login_required
+def export_download_view(request, job_id):
+    job = get_object_or_404(ExportJob, id=job_id, user=request.user, status=ExportJob.DONE)
+    try:
+        f = open(export_path(job), "rb")
+    except FileNotFoundError:
+        raise Http404("Файл отчёта не найден")
+    return FileResponse(
+        f, as_attachment=True, filename=job.file_name, content_type=EXPORT_FORMATS[job.format][1],
+    )
+
+
+@read_only_view
+@login_required
+@query_budget(3)
+def exam_report_view(request, exam_id, fmt):
+    """Повторное скачивание протокола: готовый файл берётся из кэша отчётов"""
+    if fmt not in EXPORT_FORMATS:
+        raise Http404("Неизвестный формат")
+    try:
+        exam = load_snapshot(exam_id)
+    except Examination.DoesNotExist:
+        raise Http404("Обследование не найдено")
+    if exam.patient.user_id != request.user.id:
+        raise Http404("Обследование не найдено")
+    # Версия растёт при каждой правке: повторное скачивание без изменений — 304 без чтения кэша
+    etag = f'"{exam.id}-{exam.version}-{fmt}-{report_version(fmt)}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = report_response(exam, fmt, get_or_render(exam, fmt))
+    response["ETag"] = etag
+    return response
+
+
+@staff_member_required
+def research_export_view(request, fmt):
+    """Обезличенные измерения всех обследований для исследований (CSV, NDJSON или NPZ)"""
+    if fmt not in RESEARCH_FORMATS:
+        raise Http404("Неизвестный формат")
+    # Проверяем до начала потока: посреди ответа ошибку уже не отдать
+    try:
+        pseudonym_key()
+    except ImproperlyConfigured as exc:
+        return HttpResponse(str(exc), status=503, content_type="text/plain; charset=utf-8")
+    content_type, extension = RESEARCH_FORMATS[fmt]
+    response = StreamingHttpResponse(stream_research(fmt), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="Research_{timezone.localdate():%Y-%m-%d}.{extension}"'
+    return response
+
+
+@staff_member_required
+def report_cache_stats_view(request):
+    return JsonResponse(cache_stats())
+
+
+def readiness_view(request):
+    """Проба готовности для балансировщика: 200 только после прогрева процесса"""
+    ready, details = readiness()
+    return JsonResponse(details, status=200 if ready else 503)
+
+
+def metrics_view(request):
+    """Метрики всех процессов в текстовом формате Prometheus (для сборщика метрик и персонала)"""
+    if client_ip(request) not in settings.METRICS_ALLOWED_IPS and not request.user.is_staff:
+        raise Http404()
+    return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
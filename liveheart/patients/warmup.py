@@ -0,0 +1,138 @@
+"""
+Прогрев процесса перед приёмом запросов.
+
+Первый отчёт в свежем воркере платит за импорт python-docx/openpyxl/xhtml2pdf, регистрацию
+шрифтов, компиляцию шаблонов и ленивую инициализацию самих библиотек. warm_up() делает всё
+это заранее; готовность процесса отдаёт эндпоинт /health/ready/.
+
+Режим задаётся настройкой WARMUP_MODE:
+    "off"        — прогрева нет, процесс сразу считается готовым;
+    "sync"       — прогрев при загрузке WSGI/ASGI-приложения, до приёма запросов;
+    "background" — прогрев в отдельном потоке, пока процесс уже отвечает на пробы.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Шаблоны, которые компилируются при прогреве
+WARMUP_TEMPLATES = (
+    "patients/pdf_report.html",
+    "patients/new_patient.html",
+    "patients/history_patient.html",
+    "patients/patient_card.html",
+    "accounts/dashboard1.html",
+    "accounts/login.html",
+)
+
+_lock = threading.Lock()
+_state = {"ready": False, "started": False, "error": None, "steps": {}}
+
+
+def _demo_exam():
+    """Снимок вымышленного обследования со всеми разделами — для пробной сборки отчётов"""
+    from .models import Examination, Patient
+    from .services import examination_fields
+    from .snapshot import ExamSnapshot
+
+    fields = examination_fields({
+        "exam": {"age": 60, "height": 175.0, "weight": 80.0, "hr": 70},
+        "sections": {
+            "aorta": {"diameter": 32.0, "valve_opening": 18.0},
+            "leftventricle": {"edd": 50.0, "esd": 32.0, "edv": 120.0, "esv": 50.0},
+        },
+    })
+    patient = Patient(id=0, user_id=0, full_name="Прогрев Прогрев Прогревович")
+    return ExamSnapshot.from_exam(Examination(patient=patient, **fields))
+
+
+def _urlconf():
+    from django.urls import get_resolver
+
+    # Импортирует все views (а с ними и генераторы отчётов)
+    get_resolver().url_patterns
+
+
+def _fonts():
+    # Без шрифтов с кириллицей процесс с ReportLab остаётся неготовым, а не отдаёт пустые PDF
+    if settings.REPORT_PDF_BACKEND == "reportlab":
+        from .pdf_reportlab import styles
+
+        styles()
+
+
+def _templates():
+    from django.template.loader import get_template
+
+    for name in WARMUP_TEMPLATES:
+        get_template(name)
+
+
+def _exporters():
+    from .utils import EXPORT_FORMATS
+
+    # Сборщики напрямую, мимо кэша отчётов и метрик экспорта: вымышленный протокол
+    # не должен попасть ни на диск, ни в гистограммы времени и размера отчётов
+    exam = _demo_exam()
+    for renderer, _ in EXPORT_FORMATS.values():
+        renderer(exam)
+
+
+WARMUP_STEPS = (
+    ("urlconf", _urlconf),
+    ("fonts", _fonts),
+    ("templates", _templates),
+    ("exporters", _exporters),
+)
+
+
+def warm_up():
+    """Выполняет все шаги прогрева один раз на процесс; возвращает время шагов в мс"""
+    with _lock:
+        if _state["started"]:
+            return _state["steps"]
+        _state["started"] = True
+
+    try:
+        for name, step in WARMUP_STEPS:
+            started = time.perf_counter()
+            step()
+            _state["steps"][name] = round((time.perf_counter() - started) * 1000, 1)
+    except Exception as exc:
+        # Процесс остаётся неготовым: балансировщик не пустит на него трафик
+        _state["error"] = f"{type(exc).__name__}: {exc}"
+        logger.exception("Прогрев не удался")
+    else:
+        _state["ready"] = True
+        logger.info("Прогрев завершён: %s", _state["steps"])
+    return _state["steps"]
+
+
+def warm_up_on_start():
+    """Вызывается из wsgi.py / asgi.py после создания приложения"""
+    mode = settings.WARMUP_MODE
+    if mode == "sync":
+        warm_up()
+    elif mode == "background":
+        threading.Thread(target=warm_up, name="warmup", daemon=True).start()
+
+
+def readiness():
+    """(готов ли процесс, подробности для эндпоинта)"""
+    if settings.WARMUP_MODE == "off":
+        return True, {"ready": True, "warmup": "off"}
+    return _state["ready"], {
+        "ready": _state["ready"],
+        "warmup": settings.WARMUP_MODE,
+        "steps_ms": dict(_state["steps"]),
+        "error": _state["error"],
+    }
+
+
+def reset():
+    """Сбрасывает состояние прогрева (для тестов)"""
+    with _lock:
+        _state.update(ready=False, started=False, error=None, steps={})
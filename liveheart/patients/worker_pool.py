@@ -0,0 +1,94 @@
+"""
+Пул процессов для тяжёлой сборки отчётов.
+
+Модуль не импортирует модели на верхнем уровне: процессы пула стартуют через spawn
+и сначала выполняют django.setup() в _init_worker.
+
+Веб-запросы пользуются одним пулом на процесс сервера (shared_pool): он создаётся при первой
+пакетной выгрузке и живёт до выхода, поэтому запуск и прогрев процессов не повторяются
+на каждый запрос, а число процессов не растёт с числом одновременных выгрузок.
+Отдельный пул на один запуск (make_pool) — только для команды export_batch.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def _init_worker():
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "liveheart.settings")
+    django.setup()
+
+    from django.conf import settings
+
+    if settings.WARMUP_MODE != "off":
+        from .warmup import warm_up
+
+        warm_up()
+
+
+def make_pool(workers=None):
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+
+
+def shared_pool():
+    """Общий пул процесса из BATCH_EXPORT_WORKERS процессов"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            from django.conf import settings
+
+            _shared = make_pool(settings.BATCH_EXPORT_WORKERS)
+        return _shared
+
+
+def discard_shared_pool(pool):
+    """Забывает сломанный пул (упал процесс); следующий запрос создаст новый"""
+    global _shared
+    with _shared_lock:
+        if _shared is pool:
+            _shared = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _shutdown_shared():
+    with _shared_lock:
+        if _shared is not None:
+            _shared.shutdown(wait=False, cancel_futures=True)
+
+
+def _after_fork():
+    # Пул родителя дочернему процессу не принадлежит: свой создастся при первом запросе
+    global _shared, _shared_lock
+    _shared = None
+    _shared_lock = threading.Lock()
+
+
+atexit.register(_shutdown_shared)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def run_export_job(job_id):
+    from .jobs import run_job
+
+    return run_job(job_id)
+
+
+def render_exam_report(exam_id, fmt):
+    from .report_cache import get_or_render
+    from .snapshot import load_snapshot
+    from .utils import export_filename
+
+    exam = load_snapshot(exam_id)
+    return exam_id, export_filename(exam, fmt), get_or_render(exam, fmt)